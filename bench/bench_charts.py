@@ -0,0 +1,50 @@
+"""Бенчмарк рендеринга графиков Gemodynamics.draw.
+
+Печатает скорость рендеринга (графиков в секунду) пулом kaleido на холодном
+кэше и повторный проход по кэшу png.
+
+Example:
+    python bench/bench_charts.py 20 4
+"""
+import tempfile
+import time
+import sys
+sys.path.append("./")
+sys.path.append("./bench")
+
+from internal.charts.charts import CHARTS, Renderer
+from bench_sheet2_prep import make_sheet2
+from report import Gemodynamics
+
+
+if __name__ == "__main__":
+    orgs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    df = make_sheet2(orgs * 200)
+    df['organization_id'] = df['organization_id'] % orgs
+    df['organization_name'] = "Организация " + df['organization_id'].astype(str)
+    df = Gemodynamics.__new__(Gemodynamics).sheet2_prep(df)
+
+    jobs = [(f"{i}_{name}.png", buf, spec)
+            for i, buf in df.groupby('organization_name', sort=False)
+            for name, spec in CHARTS.items()]
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        renderer = Renderer(workers, cache_dir)
+
+        t = time.perf_counter()
+        renderer.start().submit(int).result()
+        print(f"старт пула ({renderer.workers} процессов): {time.perf_counter() - t:.2f} с")
+
+        t = time.perf_counter()
+        renderer.draw(jobs)
+        t_cold = time.perf_counter() - t
+        print(f"рендеринг: {len(jobs)} графиков за {t_cold:.2f} с, {len(jobs) / t_cold:.1f} графиков/с")
+
+        t = time.perf_counter()
+        renderer.draw(jobs)
+        t_warm = time.perf_counter() - t
+        print(f"из кэша:   {len(jobs)} графиков за {t_warm:.2f} с, {len(jobs) / t_warm:.1f} графиков/с")
+
+        renderer.close()
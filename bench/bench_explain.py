@@ -0,0 +1,53 @@
+"""Проверка планов запросов пайплайнов отчета.
+
+Создает (или только проверяет) рекомендуемые индексы и печатает статистику
+explain("executionStats") по каждому пайплайну, который выполняет выгрузка (DB.pipelines: общий
+проход $facet или раздельные sheet1 и sheet2, и границы организаций): сколько документов и ключей
+просмотрено, сколько возвращено, какие индексы использованы и время выполнения.
+Завершается с кодом 1, если план деградировал: полный проход по коллекции
+или просмотрено больше документов, чем допускает --max-ratio.
+
+Example:
+    python bench/bench_explain.py mongodb://localhost:27017 --start 2023-10-01 --end 2023-11-01 --orgs 1328 2211
+"""
+from datetime import datetime
+import argparse
+import json
+import sys
+sys.path.append("./")
+sys.path.append("./bench")
+
+from internal.db.db import DB
+from inspections import BENCH_DB
+from query.queries import pipeline, schema, indexes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("connection_string")
+    parser.add_argument("--start", type=datetime.fromisoformat, required=True)
+    parser.add_argument("--end", type=datetime.fromisoformat, required=True)
+    parser.add_argument("--orgs", type=int, nargs="+", required=True)
+    parser.add_argument("--db", default=BENCH_DB, help="база с коллекцией inspections (history - рабочая)")
+    parser.add_argument("--validate-only", action="store_true", help="не создавать недостающие индексы")
+    parser.add_argument("--single-scan", action="store_true", help="общий проход $facet вместо раздельных sheet1 и sheet2")
+    parser.add_argument("--no-percentiles", action="store_true", help="без $percentile (mongo < 7.0)")
+    parser.add_argument("--max-ratio", type=float, default=1.5, help="допустимое отношение просмотренных документов к найденным")
+    args = parser.parse_args()
+
+    db = DB(pipeline, schema, connection_string=args.connection_string,
+            single_scan=args.single_scan, percentiles=not args.no_percentiles, db_name=args.db)
+    report = {
+        'indexes': db.ensure_indexes(indexes, create=not args.validate_only),
+        'pipelines': db.explain(args.start, args.end, args.orgs),
+    }
+    db.close_client()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    failed = [
+        p['pipeline'] for p in report['pipelines']
+        if p['collscan'] or (p['docs_examined'] or 0) > args.max_ratio * max(p['returned'] or 0, 1)
+    ]
+    if failed:
+        print(f"план запроса деградировал: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,69 @@
+"""Бенчмарк времени холодного старта.
+
+Каждый сценарий запускается в новом интерпретаторе несколько раз: печатается медианное время,
+самые долгие импорты по -X importtime и какие тяжелые зависимости оказались загружены.
+
+Example:
+    python bench/bench_import.py 5
+"""
+import statistics
+import subprocess
+import time
+import sys
+
+
+HEAVY = ['pandas', 'numpy', 'pymongo', 'plotly', 'kaleido', 'xlsxwriter', 'pyarrow']
+
+SCENARIOS = {
+    'import report': "import report",
+    'Gemodynamics без графиков': (
+        "from datetime import datetime\n"
+        "from report import Gemodynamics\n"
+        "Gemodynamics(datetime(2023, 10, 1), datetime(2023, 11, 1), [], 'results', replay_path='tmp', charts=False)"
+    ),
+    'Gemodynamics с графиками': (
+        "from datetime import datetime\n"
+        "from report import Gemodynamics\n"
+        "from internal.charts.charts import figure, CHARTS\n"
+        "import pandas as pd\n"
+        "Gemodynamics(datetime(2023, 10, 1), datetime(2023, 11, 1), [], 'results', replay_path='tmp')\n"
+        "figure(pd.DataFrame({'x': ['a'], 'y': [1.0]}), {**CHARTS['fig1'], 'x': 'x', 'y': 'y'})"
+    ),
+}
+
+
+def loaded(code: str) -> list:
+    probe = code + "\nimport sys\nprint(','.join(m for m in %r if m in sys.modules))" % (HEAVY,)
+    out = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True).stdout
+    return out.strip().splitlines()[-1].split(',') if out.strip() else []
+
+
+def slowest(code: str, top: int = 5) -> list:
+    # строки -X importtime: "import time: self [us] | cumulative | imported package"
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True).stderr
+    rows = []
+    for line in err.splitlines():
+        parts = line.split('|')
+        if line.startswith("import time:") and len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2]))
+    # вложенные импорты сдвинуты вправо, оставим только импорты верхнего уровня
+    top_level = [(cumulative, module.strip()) for cumulative, module in rows if not module[1:].startswith(' ')]
+    return sorted(top_level, reverse=True)[:top]
+
+
+def wall(code: str, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, capture_output=True)
+        times.append(time.perf_counter() - t)
+    return statistics.median(times)
+
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for name, code in SCENARIOS.items():
+        print(f"{name}: {wall(code, repeat):.3f} с (медиана из {repeat})")
+        print(f"  загружены: {', '.join(loaded(code)) or '-'}")
+        for cumulative, module in slowest(code):
+            print(f"  {module:<32}{cumulative / 1e6:>8.3f} с")
@@ -0,0 +1,84 @@
+"""Проверка и бенчмарк живых агрегатов (internal/live) на локальном одноузловом replica set.
+
+Подписывается на change stream, загружает синтетические осмотры (bench/inspections.py),
+ждет, пока все события будут учтены, и сравнивает выгрузки Live.load с DB.load.
+Печатает скорость обработки событий и время сборки отчета из живых агрегатов и из mongo.
+
+Example:
+    mongod --replSet rs0 --dbpath /tmp/rs0 &
+    mongosh --eval "rs.initiate()"
+    python bench/bench_live.py mongodb://localhost:27017/?directConnection=true 100000
+"""
+from datetime import datetime
+import threading
+import argparse
+import time
+import sys
+sys.path.append("./")
+sys.path.append("./bench")
+
+import pandas as pd
+
+from internal.db.db import DB
+from internal.live.live import Live
+from inspections import load, BENCH_DB
+from query.queries import pipeline, schema, compact
+
+
+def same(live: pd.DataFrame, db: pd.DataFrame, keys: list) -> None:
+    # порядок строк и категории у выгрузок разные, сравниваем значения
+    live = live.astype({col: object for col in live.select_dtypes('category')}).sort_values(keys, ignore_index=True)
+    db = db.astype({col: object for col in db.select_dtypes('category')}).sort_values(keys, ignore_index=True)
+    pd.testing.assert_frame_equal(live[db.columns], db, check_dtype=False, rtol=1e-4)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("connection_string", help="строка подключения к replica set")
+    parser.add_argument("n", type=int)
+    parser.add_argument("--orgs", type=int, default=20)
+    parser.add_argument("--employees", type=int, default=200, help="сотрудников в организации")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=datetime(2023, 10, 1))
+    parser.add_argument("--end", type=datetime.fromisoformat, default=datetime(2023, 11, 1))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=600, help="сколько ждать обработки событий, с")
+    args = parser.parse_args()
+
+    client = DB.pool(args.connection_string)
+    collection = client[BENCH_DB]["inspections"]
+    collection.delete_many({})
+    org_ids = list(range(1, args.orgs + 1))
+
+    live = Live(schema, dtypes=compact)
+    stop = threading.Event()
+    watcher = threading.Thread(target=live.watch, args=(collection, stop), daemon=True)
+    watcher.start()
+    # поток открывается асинхронно, дадим ему подписаться до вставки
+    time.sleep(1)
+
+    t = time.perf_counter()
+    loaded = load(collection, args.n, args.start, args.end, args.orgs, employees=args.employees, seed=args.seed)
+    inserted = time.perf_counter() - t
+    while live.events < loaded and time.perf_counter() - t < args.timeout:
+        time.sleep(0.1)
+    applied = time.perf_counter() - t
+    stop.set()
+    watcher.join()
+    print(f"{loaded} осмотров: вставка {inserted:.1f} с, учтены в живых агрегатах через {applied:.1f} с "
+          f"({live.events / applied:.0f} событий/с)")
+
+    t = time.perf_counter()
+    live1, live2 = live.load(args.start, args.end, org_ids)
+    print(f"Live.load: {time.perf_counter() - t:.3f} с")
+
+    db = DB(pipeline, schema, client=client, dtypes=compact, db_name=BENCH_DB)
+    t = time.perf_counter()
+    db1, db2 = db.load(args.start, args.end, org_ids)
+    print(f"DB.load: {time.perf_counter() - t:.3f} с")
+
+    # перцентилей в живых агрегатах нет: по дням они не складываются
+    db2 = db2[[col for col in db2.columns if col in live2.columns]]
+    same(live1, db1, ['organization_id', 'host_release_point'])
+    same(live2, db2, ['organization_id', 'employee_number'])
+    print("выгрузки совпадают")
+    client.close()
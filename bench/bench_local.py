@@ -0,0 +1,108 @@
+"""Сверка и бенчмарк локального источника выгрузок (internal/local) на синтетических осмотрах.
+
+Пишет n осмотров (bench/inspections.py) в экспорты Parquet и JSON lines в формате mongoexport
+(даты как {"$date": ...}), строит выгрузки Local.load по обоим и печатает время. С --mongo
+те же осмотры загружаются в mongod, выгрузки Local сверяются с DB.load, а общий проход
+$facet (single_scan) - с раздельными запросами.
+
+Example:
+    python bench/bench_local.py 1000000
+    python bench/bench_local.py 100000 --mongo mongodb://localhost:27017
+"""
+from datetime import datetime
+import contextlib
+import tempfile
+import argparse
+import json
+import time
+import sys
+sys.path.append("./")
+sys.path.append("./bench")
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from internal.db.db import DB
+from internal.local.local import Local
+from inspections import make_inspections, load, BENCH_DB
+from query.queries import pipeline, schema, compact
+
+
+def mongoexport(value):
+    # расширенный json mongoexport: даты - {"$date": ...}
+    if isinstance(value, datetime):
+        return {'$date': value.strftime("%Y-%m-%dT%H:%M:%S.%fZ")}
+    raise TypeError(type(value))
+
+
+def export(path: str, n: int, args, jsonl: bool = True):
+    writer = None
+    with open(f"{path}/inspections.jsonl", 'w') if jsonl else contextlib.nullcontext() as f:
+        for batch in make_inspections(n, args.start, args.end, args.orgs, employees=args.employees, seed=args.seed):
+            for doc in batch if jsonl else []:
+                f.write(json.dumps(doc, default=mongoexport, ensure_ascii=False) + "\n")
+            table = pa.Table.from_pylist(batch)
+            writer = writer or pq.ParquetWriter(f"{path}/inspections.parquet", table.schema, compression='zstd')
+            writer.write_table(table)
+    if writer is not None:
+        writer.close()
+
+
+def same(a: pd.DataFrame, b: pd.DataFrame, keys: list) -> None:
+    # порядок строк и категории у выгрузок разные, сравниваем значения
+    a = a.astype({col: object for col in a.select_dtypes('category')}).sort_values(keys, ignore_index=True)
+    b = b.astype({col: object for col in b.select_dtypes('category')}).sort_values(keys, ignore_index=True)
+    pd.testing.assert_frame_equal(a[b.columns], b, check_dtype=False, rtol=1e-4)
+
+
+def timed(backend, org_ids: list, args) -> tuple:
+    t = time.perf_counter()
+    dfs = backend.load(args.start, args.end, org_ids)
+    return dfs, time.perf_counter() - t
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("n", type=int)
+    parser.add_argument("--orgs", type=int, default=20)
+    parser.add_argument("--employees", type=int, default=200, help="сотрудников в организации")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=datetime(2023, 10, 1))
+    parser.add_argument("--end", type=datetime.fromisoformat, default=datetime(2023, 11, 1))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mongo", default=None, help="строка подключения к mongod для сверки с DB.load")
+    args = parser.parse_args()
+
+    org_ids = list(range(1, args.orgs + 1))
+    with tempfile.TemporaryDirectory() as workdir:
+        t = time.perf_counter()
+        export(workdir, args.n, args)
+        print(f"{args.n} осмотров: экспорт {time.perf_counter() - t:.1f} с")
+
+        (p1, p2), seconds = timed(Local(f"{workdir}/inspections.parquet", schema, compact), org_ids, args)
+        print(f"Local.load parquet: {seconds:.3f} с, строк {len(p1)} и {len(p2)}")
+        (j1, j2), seconds = timed(Local(f"{workdir}/inspections.jsonl", schema, compact), org_ids, args)
+        print(f"Local.load jsonl:   {seconds:.3f} с")
+        same(j1, p1, ['organization_id', 'host_release_point'])
+        same(j2, p2, ['organization_id', 'employee_number'])
+        print("parquet и jsonl совпадают")
+
+    if args.mongo:
+        client = DB.pool(args.mongo)
+        load(client[BENCH_DB]["inspections"], args.n, args.start, args.end, args.orgs,
+             employees=args.employees, seed=args.seed)
+        db = DB(pipeline, schema, client=client, dtypes=compact, percentiles=False, db_name=BENCH_DB)
+        (m1, m2), seconds = timed(db, org_ids, args)
+        print(f"DB.load:            {seconds:.3f} с")
+        # перцентили mongo приближенные, сверяем без них
+        same(p1, m1, ['organization_id', 'host_release_point'])
+        same(p2[[col for col in p2.columns if col in m2.columns]], m2, ['organization_id', 'employee_number'])
+        print("Local и mongo совпадают")
+        # общий проход $facet должен давать те же выгрузки, что раздельные запросы
+        facet = DB(pipeline, schema, client=client, dtypes=compact, percentiles=False, single_scan=True, db_name=BENCH_DB)
+        (f1, f2), seconds = timed(facet, org_ids, args)
+        print(f"DB.load $facet:     {seconds:.3f} с")
+        same(f1, m1, ['organization_id', 'host_release_point'])
+        same(f2, m2, ['organization_id', 'employee_number'])
+        print("$facet и раздельные запросы совпадают")
+        client.close()
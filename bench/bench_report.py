@@ -0,0 +1,146 @@
+"""Сквозной бенчмарк формирования отчета на синтетических осмотрах.
+
+Для каждой точки масштаба загружает n осмотров (bench/inspections.py) в локальный mongod
+или, с 'local' вместо строки подключения, пишет их в экспорт Parquet и строит выгрузки локальным
+источником (internal/local), затем строит отчет по всем организациям и печатает время и пик памяти
+этапов: выгрузка по пайплайнам, sheet1_prep, sheet2_prep, draw и save. Замеры сохраняются в json,
+а с --baseline печатается сравнение с прошлым запуском (до/после изменения).
+
+Example:
+    python bench/bench_report.py mongodb://localhost:27017 --scales 10000 100000 1000000 --out after.json --baseline before.json
+    python bench/bench_report.py local --scales 10000
+"""
+from datetime import datetime
+from collections import defaultdict
+import tempfile
+import argparse
+import json
+import time
+import sys
+import os
+sys.path.append("./")
+sys.path.append("./bench")
+
+from internal.charts.charts import Renderer
+from internal.db.db import DB
+from internal.local.local import Local
+from inspections import load, BENCH_DB
+from bench_local import export
+from query.queries import indexes, schema, compact
+from report import Gemodynamics
+
+
+SCALES = [10_000, 100_000, 1_000_000, 10_000_000]
+
+
+def client_for(connection_string: str):
+    # без mongo осмотры читаются из экспорта локальным источником
+    if connection_string == "local":
+        return None
+    return DB.pool(connection_string)
+
+
+def summary(stages: list) -> dict:
+    """Суммирует замеры по этапам, сохранение по организациям складывается в один этап."""
+
+    res = defaultdict(lambda: {'seconds': 0.0, 'peak_mb': 0.0, 'rows_in': None, 'rows_out': None})
+    for record in stages:
+        name = "save:org" if record['stage'].startswith("save:") else record['stage']
+        res[name]['seconds'] = round(res[name]['seconds'] + (record.get('seconds') or 0), 4)
+        res[name]['peak_mb'] = max(res[name]['peak_mb'], record.get('peak_mb') or 0)
+        for key in ('rows_in', 'rows_out'):
+            if record.get(key) is not None:
+                res[name][key] = (res[name][key] or 0) + record[key]
+    return dict(res)
+
+
+def bench(client, n: int, args, workdir: str) -> dict:
+    t = time.perf_counter()
+    backend = None
+    if client is None:
+        os.makedirs(f"{workdir}/exports/{n}")
+        export(f"{workdir}/exports/{n}", n, args, jsonl=False)
+        backend = Local(f"{workdir}/exports/{n}/inspections.parquet", schema, compact,
+                        snapshot_path=None if args.in_memory else f"{workdir}/tmp/{n}")
+    else:
+        collection = client[BENCH_DB]["inspections"]
+        load(collection, n, args.start, args.end, args.orgs, employees=args.employees, seed=args.seed)
+        for name, keys in indexes.items():
+            collection.create_index(keys, name=name)
+    print(f"{n}: загрузка осмотров {time.perf_counter() - t:.1f} с")
+
+    renderer = Renderer(args.workers, cache_dir=None)
+    report = Gemodynamics(args.start, args.end, list(range(1, args.orgs + 1)), f"{workdir}/results/{n}",
+                          workers=args.workers, client=client, backend=backend, renderer=renderer,
+                          images_path=f"{workdir}/images/{n}", snapshot_path=f"{workdir}/tmp/{n}",
+                          box=args.box, charts=not args.no_charts, in_memory=args.in_memory,
+                          shard_orgs=args.shard_orgs, shard_days=args.shard_days, shard_workers=args.shard_workers,
+                          profile_path=f"{workdir}/profile_{n}.json", db_name=BENCH_DB)
+
+    # те же этапы, что в run, плюс графики
+    stage = report.profiler.stage
+    try:
+        with stage("get_reports"):
+            dfs = report.get_reports()
+        with stage("sheet1_prep", rows_in=len(dfs['sheet1']) + len(dfs['sheet11'])) as record:
+            df1, df11 = report.sheet1_prep(dfs)
+            record['rows_out'] = len(df1) + len(df11)
+        with stage("sheet2_prep", rows_in=len(dfs['sheet2'])) as record:
+            df2 = report.sheet2_prep(dfs['sheet2'])
+            record['rows_out'] = len(df2)
+        if not args.no_charts:
+            report.draw(df2, dfs.get('box'))
+        with stage("save", rows_in=len(df2)):
+            report.save(df1, df11, df2)
+        return summary(report.profiler.stages)
+    finally:
+        report.profiler.dump()
+        renderer.close()
+
+
+def compare(results: dict, baseline: dict):
+    for n, stages in results.items():
+        before = baseline.get(n, {})
+        print(f"\n{n} осмотров")
+        print(f"{'этап':<24}{'с':>10}{'было, с':>10}{'x':>8}{'пик, MB':>10}")
+        for name, record in stages.items():
+            was = before.get(name, {}).get('seconds')
+            ratio = f"{was / record['seconds']:.2f}" if was and record['seconds'] else ""
+            print(f"{name:<24}{record['seconds']:>10.3f}{was if was is not None else '':>10}{ratio:>8}{record['peak_mb']:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("connection_string", help="строка подключения к mongod или 'local' (экспорт и Local)")
+    parser.add_argument("--scales", type=int, nargs="+", default=SCALES)
+    parser.add_argument("--orgs", type=int, default=20)
+    parser.add_argument("--employees", type=int, default=200, help="сотрудников в организации")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=datetime(2023, 10, 1))
+    parser.add_argument("--end", type=datetime.fromisoformat, default=datetime(2023, 11, 1))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--box", action="store_true", help="графики по статистикам 'Ящика с усами'")
+    parser.add_argument("--no-charts", action="store_true", help="не рисовать графики")
+    parser.add_argument("--in-memory", action="store_true", help="графики и книги в памяти, без записи на диск")
+    parser.add_argument("--shard-orgs", type=int, default=None, help="организаций в шарде выгрузки")
+    parser.add_argument("--shard-days", type=int, default=None, help="дней в шарде выгрузки")
+    parser.add_argument("--shard-workers", type=int, default=4, help="одновременно выполняемых шардов")
+    parser.add_argument("--out", default="bench_report.json", help="куда сохранить замеры")
+    parser.add_argument("--baseline", default=None, help="замеры прошлого запуска для сравнения")
+    args = parser.parse_args()
+
+    client = client_for(args.connection_string)
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for n in args.scales:
+            results[str(n)] = bench(client, n, args, workdir)
+    if client is not None:
+        client.close()
+
+    with open(args.out, 'w') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    compare(results, baseline)
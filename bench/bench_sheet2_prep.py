@@ -0,0 +1,101 @@
+"""Бенчмарк подготовки второй страницы отчета.
+
+Сравнивает векторную классификацию Gemodynamics.sheet2_prep с прежней построчной
+реализацией на синтетических данных и проверяет, что результаты совпадают.
+
+Example:
+    python bench/bench_sheet2_prep.py 1000000
+"""
+from datetime import datetime
+import time
+import sys
+sys.path.append("./")
+
+import pandas as pd
+import numpy as np
+
+from report import Gemodynamics
+
+
+def make_sheet2(n: int, seed: int = 0) -> pd.DataFrame:
+    """Генерирует синтетическую выгрузку для второй страницы отчета.
+
+    Args:
+        n (int): Количество сотрудников.
+        seed (int): Зерно генератора случайных чисел.
+
+    Returns:
+        pd.DataFrame: Датафрейм в формате выгрузки DB.load для sheet2.
+    """
+
+    rng = np.random.default_rng(seed)
+    org_id = rng.integers(1, 200, n)
+    origin = np.where(rng.random(n) < 0.3, 'org', 'default')
+    boundary = {
+        'pulse': {'lower': 50, 'upper': 110},
+        'pressure': {'systolic': {'lower': 95, 'upper': 145}, 'diastolic': {'lower': 55, 'upper': 95}},
+    }
+    count_all = rng.integers(1, 60, n)
+    df = pd.DataFrame({
+        'organization_name': pd.Series(org_id).map(lambda x: f"Организация {x}"),
+        'organization_id': org_id,
+        'organization_inn': pd.Series(org_id).map(lambda x: f"77{x:08d}"),
+        'boundary': [boundary if o == 'org' else None for o in origin],
+        'boundary_origin': origin,
+        'employee_name': 'Иван',
+        'employee_surname': 'Иванов',
+        'employee_patronymic': 'Иванович',
+        'employee_birthday': pd.to_datetime(rng.integers(-5000, 12000, n), unit='D'),
+        'employee_number': pd.Series(np.arange(n)).astype(str),
+        'count_all': count_all,
+        'count_ad_pulse_cause': rng.integers(0, count_all + 1),
+        'mean_sad': rng.normal(128, 14, n),
+        'mean_dad': rng.normal(82, 9, n),
+        'mean_pulse': rng.normal(76, 12, n),
+    })
+    # средние квадратов: квадрат среднего плюс дисперсия показателя сотрудника
+    for value in ['sad', 'dad', 'pulse']:
+        df[f'mean_sq_{value}'] = df[f'mean_{value}'] ** 2 + rng.uniform(0, 100, n)
+    return df
+
+
+def legacy_sheet2_prep(df: pd.DataFrame) -> pd.DataFrame:
+    """Прежняя построчная реализация классификации (для сравнения)."""
+
+    buf = df.copy()
+    buf['boundary_pulse_lower'] = buf.apply(lambda x: x.boundary['pulse']['lower'] if x.boundary_origin=='org' else 54, axis=1)
+    buf['boundary_pulse_upper'] = buf.apply(lambda x: x.boundary['pulse']['upper'] if x.boundary_origin=='org' else 100, axis=1)
+    buf['boundary_sad_upper'] = buf.apply(lambda x: x.boundary['pressure']['systolic']['upper'] if x.boundary_origin=='org' else 139, axis=1)
+    buf['boundary_sad_lower'] = buf.apply(lambda x: x.boundary['pressure']['systolic']['lower'] if x.boundary_origin=='org' else 100, axis=1)
+    buf['boundary_dad_upper'] = buf.apply(lambda x: x.boundary['pressure']['diastolic']['upper'] if x.boundary_origin=='org' else 89, axis=1)
+    buf['boundary_dad_lower'] = buf.apply(lambda x: x.boundary['pressure']['systolic']['lower'] if x.boundary_origin=='org' else 60, axis=1)
+    buf['type_sad'] = buf.apply(lambda x: "Гипертоник (Повышенное сАД)" if x.mean_sad>x.boundary_sad_upper else ("Гипотоник (Пониженное сАД)" if x.mean_sad<x.boundary_sad_lower else ""), axis=1)
+    buf['type_dad'] = buf.apply(lambda x: "Гипертоник (Повышенное дАД)" if x.mean_dad>x.boundary_dad_upper else ("Гипотоник (Пониженное дАД)" if x.mean_dad<x.boundary_dad_lower else ""), axis=1)
+    buf['type_pulse'] = buf.apply(lambda x: "Тахиритмик (Повышенная ЧСС)" if x.mean_pulse>x.boundary_pulse_upper else "", axis=1)
+    buf['type_sad'] = buf.apply(lambda x: "Брадиритмик (Пониженная ЧСС)" if x.mean_pulse<x.boundary_pulse_lower else "", axis=1)
+    buf['Тип гемодинамики'] = buf[['type_sad', 'type_dad', 'type_pulse', 'type_sad']].agg(', '.join, axis=1).str.rstrip(", ").str.lstrip(", ")
+    buf['Блок наблюдений по АД'] = buf.apply(lambda x: "Повышенное АД" if x.mean_dad>89 or x.mean_sad>139 else ("Пониженное АД" if x.mean_dad<60 or x.mean_sad<100 else "Нормальное АД"), axis=1)
+    buf['Блок наблюдений по ЧСС'] = buf.apply(lambda x: "Повышенная ЧСС" if x.mean_pulse>100 else ("Пониженная ЧСС" if x.mean_pulse<54 else "Нормальная ЧСС"), axis=1)
+    buf['Рекомендации'] = buf.apply(lambda x: "Рекомендуется внеочередной медицинский осмотра с заключением врача профпатолога" if x.mean_sad >= 160 or x.mean_sad <= 89 or x.mean_dad >= 100 or x.mean_dad <= 49 or x.mean_pulse >= 106 or x.mean_pulse <= 44 else "Рекомендуется обратиться ко врачу терапевту за медицинской консультацией", axis=1)
+    buf['Возраст'] = pd.to_datetime(buf['employee_birthday']).apply(lambda x: datetime.now().year - x.year - ((datetime.now().month, datetime.now().day) < (x.month, x.day)))
+    return buf[['Тип гемодинамики', 'Блок наблюдений по АД', 'Блок наблюдений по ЧСС', 'Рекомендации', 'Возраст']]
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    df = make_sheet2(n)
+    report = Gemodynamics.__new__(Gemodynamics)
+
+    t = time.perf_counter()
+    new = report.sheet2_prep(df)
+    t_new = time.perf_counter() - t
+    print(f"sheet2_prep (векторно):    {n} строк за {t_new:.2f} с")
+
+    t = time.perf_counter()
+    old = legacy_sheet2_prep(df)
+    t_old = time.perf_counter() - t
+    print(f"sheet2_prep (построчно):   {n} строк за {t_old:.2f} с")
+    print(f"ускорение: x{t_old / t_new:.1f}")
+
+    pd.testing.assert_frame_equal(new[old.columns].reset_index(drop=True), old.reset_index(drop=True), check_dtype=False)
+    print("результаты совпадают")
@@ -0,0 +1,174 @@
+"""Генератор синтетических осмотров коллекции inspections.
+
+Документы содержат все поля, которые читают пайплайны query.queries.pipeline:
+timestamps.processedAt, isTest, type, organization, host.releasePoint, resolution,
+steps.result.value (давление и пульс, берется второе измерение), boundaries и employee.
+
+Осмотры загружаются в отдельную базу BENCH_DB, а не в рабочую history: загрузка очищает коллекцию.
+Отчеты и бенчмарки читают ее с DB(..., db_name=BENCH_DB) или Gemodynamics(..., db_name=BENCH_DB).
+
+Example:
+    # загрузить 1 млн осмотров в локальный mongod
+    python bench/inspections.py mongodb://localhost:27017 1000000 --orgs 50
+"""
+from typing import Iterator, List
+from datetime import datetime, timedelta
+import argparse
+import sys
+sys.path.append("./")
+
+import numpy as np
+
+from query.queries import remarks
+
+
+# база синтетических осмотров бенчмарков
+BENCH_DB = "bench"
+
+TYPES = ['BEFORE_TRIP', 'BEFORE_SHIFT', 'AFTER_TRIP', 'AFTER_SHIFT']
+TYPE_WEIGHTS = [0.5, 0.2, 0.2, 0.1]
+
+NAMES = ['Иван', 'Петр', 'Сергей', 'Алексей', 'Дмитрий', 'Андрей', 'Михаил', 'Николай']
+SURNAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Волков', 'Соколов']
+PATRONYMICS = ['Иванович', 'Петрович', 'Сергеевич', 'Алексеевич', 'Дмитриевич', 'Андреевич']
+
+# границы организаций, у которых они заданы (boundaries.origin == 'org')
+ORG_BOUNDARIES = {
+    'pulse': {'lower': 50, 'upper': 110},
+    'pressure': {'systolic': {'lower': 95, 'upper': 145}, 'diastolic': {'lower': 55, 'upper': 95}},
+}
+DEFAULT_BOUNDARIES = {
+    'pulse': {'lower': 54, 'upper': 100},
+    'pressure': {'systolic': {'lower': 100, 'upper': 139}, 'diastolic': {'lower': 60, 'upper': 89}},
+}
+
+
+def make_inspections(n: int, start_date: datetime, end_date: datetime, orgs: int = 20,
+                     employees: int = 200, seed: int = 0, batch_size: int = 10000) -> Iterator[List[dict]]:
+    """Генерирует осмотры пачками.
+
+    У каждого сотрудника свое "типичное" давление и пульс, так что в отчете есть и нормальные,
+    и гипертоники, и тахиритмики. Около 15% осмотров - недопуски с замечаниями из реестра remarks.
+
+    Args:
+        n (int): Количество осмотров.
+        start_date (datetime): Начало периода осмотров.
+        end_date (datetime): Конец периода (не включается).
+        orgs (int): Количество организаций.
+        employees (int): Количество сотрудников в организации.
+        seed (int): Зерно генератора случайных чисел.
+        batch_size (int): Размер пачки.
+
+    Returns:
+        Iterator[List[dict]]: Пачки документов.
+    """
+
+    rng = np.random.default_rng(seed)
+
+    # сотрудники: организация, ФИО и типичные показатели
+    total = orgs * employees
+    emp_org = np.repeat(np.arange(1, orgs + 1), employees)
+    emp_sad = rng.normal(128, 14, total)
+    emp_dad = rng.normal(82, 9, total)
+    emp_pulse = rng.normal(76, 12, total)
+    emp_name = rng.choice(NAMES, total)
+    emp_surname = rng.choice(SURNAMES, total)
+    emp_patronymic = rng.choice(PATRONYMICS, total)
+    emp_birthday = [datetime(1960, 1, 1) + timedelta(days=int(x)) for x in rng.integers(0, 40 * 365, total)]
+    org_origin = np.where(rng.random(orgs + 1) < 0.3, 'org', 'default')
+
+    all_remarks = sorted({code for codes in remarks.values() for code in codes})
+    span = (end_date - start_date).total_seconds()
+
+    for offset in range(0, n, batch_size):
+        size = min(batch_size, n - offset)
+        emp = rng.integers(0, total, size)
+        seconds = rng.random(size) * span
+        types = rng.choice(TYPES, size, p=TYPE_WEIGHTS)
+        success = rng.random(size) >= 0.15
+        is_test = rng.random(size) < 0.01
+        points = rng.integers(1, 4, size)
+        first = np.stack([rng.normal(emp_sad[emp], 8), rng.normal(emp_dad[emp], 6), rng.normal(emp_pulse[emp], 8)], axis=1).round()
+        second = np.stack([rng.normal(emp_sad[emp], 8), rng.normal(emp_dad[emp], 6), rng.normal(emp_pulse[emp], 8)], axis=1).round()
+        fails = rng.choice(all_remarks, (size, 2))
+
+        batch = []
+        for i in range(size):
+            e, org = int(emp[i]), int(emp_org[emp[i]])
+            origin = org_origin[org]
+            batch.append({
+                'timestamps': {'processedAt': start_date + timedelta(seconds=float(seconds[i]))},
+                'isTest': bool(is_test[i]),
+                'type': str(types[i]),
+                'organization': {'id': org, 'name': f"Организация {org}", 'inn': f"77{org:08d}"},
+                'host': {'releasePoint': {'address': f"г. Москва, точка выпуска {org}-{points[i]}"}},
+                'resolution': {
+                    'success': bool(success[i]),
+                    'remarks': [] if success[i] else list(dict.fromkeys(fails[i].tolist())),
+                },
+                'steps': [
+                    {'type': 'alcohol', 'result': {'value': {'alcohol': 0.0}}},
+                    {'type': 'tonometry', 'result': {'value': {
+                        'pressure': {'systolic': float(first[i, 0]), 'diastolic': float(first[i, 1])}, 'pulse': float(first[i, 2])}}},
+                    {'type': 'tonometry', 'result': {'value': {
+                        'pressure': {'systolic': float(second[i, 0]), 'diastolic': float(second[i, 1])}, 'pulse': float(second[i, 2])}}},
+                ],
+                'boundaries': {'origin': origin, 'values': ORG_BOUNDARIES if origin == 'org' else DEFAULT_BOUNDARIES},
+                'employee': {
+                    'id': e,
+                    'name': str(emp_name[e]),
+                    'surname': str(emp_surname[e]),
+                    'patronymic': str(emp_patronymic[e]),
+                    'personnelNumber': f"{e:06d}",
+                    'dateOfBirth': emp_birthday[e],
+                },
+            })
+        yield batch
+
+
+def load(collection, n: int, start_date: datetime, end_date: datetime, orgs: int = 20, **kwargs) -> int:
+    """Очищает коллекцию и загружает в нее n синтетических осмотров.
+
+    Args:
+        collection: Коллекция pymongo (или mongomock) из базы BENCH_DB.
+        n (int): Количество осмотров.
+        start_date (datetime): Начало периода осмотров.
+        end_date (datetime): Конец периода (не включается).
+        orgs (int): Количество организаций.
+        **kwargs: Остальные параметры make_inspections.
+
+    Returns:
+        int: Количество загруженных документов.
+
+    Raises:
+        ValueError: Коллекция не из базы BENCH_DB.
+    """
+
+    if collection.database.name != BENCH_DB:
+        raise ValueError(f"синтетические осмотры загружаются только в базу {BENCH_DB}, а не в {collection.database.name}")
+    collection.delete_many({})
+    loaded = 0
+    for batch in make_inspections(n, start_date, end_date, orgs, **kwargs):
+        collection.insert_many(batch, ordered=False)
+        loaded += len(batch)
+    return loaded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("connection_string")
+    parser.add_argument("n", type=int)
+    parser.add_argument("--orgs", type=int, default=20)
+    parser.add_argument("--employees", type=int, default=200, help="сотрудников в организации")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=datetime(2023, 10, 1))
+    parser.add_argument("--end", type=datetime.fromisoformat, default=datetime(2023, 11, 1))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from pymongo import MongoClient
+
+    client = MongoClient(args.connection_string)
+    loaded = load(client[BENCH_DB]["inspections"], args.n, args.start, args.end, args.orgs,
+                  employees=args.employees, seed=args.seed)
+    client.close()
+    print(f"загружено {loaded} осмотров")
@@ -0,0 +1,222 @@
+from typing import Dict, Hashable, List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import threading
+import tempfile
+import hashlib
+import json
+import sys
+import os
+sys.path.append("./")
+
+import pandas as pd
+
+
+# описание графиков типа 'Ящик с усами': имя файла -> параметры px.box
+CHARTS: Dict[str, dict] = {
+    'fig1': {
+        'x': "Блок наблюдений по АД",
+        'y': "Среднее значение по АД систолическое",
+        'color_discrete_map': {
+            "Нормальное АД": "green",
+            "Повышенное АД": "red",
+            "Пониженное АД": "yellow"
+        },
+        'title': 'Систолическое давление',
+    },
+    'fig2': {
+        'x': "Блок наблюдений по АД",
+        'y': "Среднее значение по АД диастолическое",
+        'color_discrete_map': {
+            "Нормальное АД": "green",
+            "Повышенное АД": "red",
+            "Пониженное АД": "yellow"
+        },
+        'title': 'Диастолическое давление',
+    },
+    'fig3': {
+        'x': "Блок наблюдений по ЧСС",
+        'y': "Среднее значение по ЧСС",
+        'color_discrete_map': {
+            "Нормальная ЧСС": "green",
+            "Повышенная ЧСС": "red",
+            "Пониженная ЧСС": "yellow"
+        },
+        'title': 'Частота сердечно-сосудистых сокращений',
+    },
+}
+
+
+def figure(df: pd.DataFrame, spec: dict):
+    """Строит график типа 'Ящик с усами' по описанию из CHARTS.
+
+    Args:
+        df (pd.DataFrame): Данные одной организации.
+        spec (dict): Описание графика.
+
+    Returns:
+        plotly.graph_objects.Figure: График.
+    """
+
+    import plotly.express as px
+
+    return px.box(df,
+                  x=spec['x'],
+                  y=spec['y'],
+                  color=spec['x'],
+                  color_discrete_map=spec['color_discrete_map'],
+                  points='all',
+                  width=1000,
+                  height=700,
+                  title=spec['title'])
+
+
+def box_stats(df: pd.DataFrame, spec: dict) -> pd.DataFrame:
+    """Считает статистики 'Ящика с усами' по блокам наблюдений одной организации.
+
+    Квартили и усы считаются так же, как в plotly: усы - крайние точки в пределах 1.5 IQR от квартилей.
+
+    Args:
+        df (pd.DataFrame): Данные одной организации.
+        spec (dict): Описание графика.
+
+    Returns:
+        pd.DataFrame: Колонки block, q1, median, q3, lowerfence, upperfence, outliers.
+    """
+
+    data = df[[spec['x'], spec['y']]].dropna().rename(columns={spec['x']: 'block', spec['y']: 'value'})
+    if data.empty:
+        return pd.DataFrame(columns=['block', 'q1', 'median', 'q3', 'lowerfence', 'upperfence', 'outliers'])
+    res = data.groupby('block', sort=False)['value'].quantile([0.25, 0.5, 0.75]).unstack()
+    res.columns = ['q1', 'median', 'q3']
+
+    iqr = res['q3'] - res['q1']
+    lower = data['block'].map(res['q1'] - 1.5 * iqr)
+    upper = data['block'].map(res['q3'] + 1.5 * iqr)
+    inside = (data['value'] >= lower) & (data['value'] <= upper)
+
+    fences = data[inside].groupby('block', sort=False)['value'].agg(['min', 'max'])
+    res['lowerfence'] = fences['min']
+    res['upperfence'] = fences['max']
+    outliers = data[~inside].groupby('block', sort=False)['value'].agg(list)
+    res['outliers'] = [outliers.get(block, []) for block in res.index]
+    return res.reset_index()
+
+
+def box_figure(stats: pd.DataFrame, spec: dict):
+    """Строит 'Ящик с усами' по готовым статистикам: вместо всех точек рисуются только выбросы.
+
+    Args:
+        stats (pd.DataFrame): Статистики одной организации (box_stats).
+        spec (dict): Описание графика.
+
+    Returns:
+        plotly.graph_objects.Figure: График.
+    """
+
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    for row in stats.itertuples(index=False):
+        color = spec['color_discrete_map'].get(row.block)
+        fig.add_trace(go.Box(x=[row.block], q1=[row.q1], median=[row.median], q3=[row.q3],
+                             lowerfence=[row.lowerfence], upperfence=[row.upperfence],
+                             name=row.block, marker_color=color, boxpoints=False))
+        outliers = list(row.outliers if row.outliers is not None else [])
+        if outliers:
+            fig.add_trace(go.Scatter(x=[row.block] * len(outliers), y=outliers, mode='markers',
+                                     marker_color=color, showlegend=False))
+    fig.update_layout(width=1000, height=700, title=spec['title'],
+                      xaxis_title=spec['x'], yaxis_title=spec['y'], legend_title_text=spec['x'])
+    return fig
+
+
+def chart_data(df: pd.DataFrame, spec: dict) -> pd.DataFrame:
+    """Данные, по которым строится график: готовые статистики целиком или две колонки точек."""
+
+    return df if 'q1' in df else df[[spec['x'], spec['y']]]
+
+
+def render(df: pd.DataFrame, spec: dict) -> bytes:
+    """Рендерит график в png: по точкам или по готовым статистикам."""
+
+    return (box_figure if 'q1' in df else figure)(df, spec).to_image(format="png")
+
+
+def warm():
+    """Запускает kaleido в процессе пула, чтобы первый график не платил за старт браузера."""
+
+    render(pd.DataFrame({'x': ['x'], 'y': [0]}), {'x': 'x', 'y': 'y', 'color_discrete_map': {}, 'title': ''})
+
+
+def key(df: pd.DataFrame, spec: dict) -> str:
+    """Ключ кэша графика: хэш данных, по которым он строится, и его описания."""
+
+    data = chart_data(df, spec)
+    if 'outliers' in data:
+        # выбросы - списки, hash_pandas_object их не хэширует; хэшируем сериализованными
+        data = data.assign(outliers=data['outliers'].map(lambda x: json.dumps([float(v) for v in x])))
+    digest = hashlib.sha256(json.dumps(spec, sort_keys=True, ensure_ascii=False).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+class Renderer:
+
+    def __init__(self, workers: int = None, cache_dir: str = "images/cache") -> None:
+        """Рендерер графиков с пулом прогретых процессов kaleido и кэшем png.
+
+        Args:
+            workers (int, optional): Количество процессов рендеринга. По умолчанию - число ядер.
+            cache_dir (str, optional): Папка кэша png. Если None, кэш не используется.
+        """
+
+        self.workers = workers or os.cpu_count()
+        self.cache_dir = cache_dir
+        self.pool = None
+        # общий рендерер пакетного режима: пул создается один раз, даже если первые графики рисуются из разных потоков
+        self.lock = threading.Lock()
+
+    def start(self) -> ProcessPoolExecutor:
+        with self.lock:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=warm)
+            return self.pool
+
+    def draw(self, jobs: List[Tuple[Hashable, pd.DataFrame, dict]]) -> Dict[Hashable, bytes]:
+        """Рендерит графики, пропуская те, что уже есть в кэше.
+
+        Args:
+            jobs (List[Tuple[Hashable, pd.DataFrame, dict]]): Список (ключ графика, данные, описание графика).
+
+        Returns:
+            Dict[Hashable, bytes]: Ключ графика -> png.
+        """
+
+        res, futures = {}, {}
+        for name, df, spec in jobs:
+            cache_path = None
+            if self.cache_dir is not None:
+                cache_path = os.path.join(self.cache_dir, f"{key(df, spec)}.png")
+                if os.path.exists(cache_path):
+                    with open(cache_path, 'rb') as f:
+                        res[name] = f.read()
+                    continue
+            data = chart_data(df, spec)
+            futures[name] = (cache_path, self.start().submit(render, data, spec))
+
+        for name, (cache_path, future) in futures.items():
+            res[name] = future.result()
+            if cache_path is not None:
+                # пишем через временный файл, чтобы параллельные запуски не прочитали недописанный png;
+                # имя уникально, так что потоки одного процесса не пишут в один файл
+                os.makedirs(self.cache_dir, exist_ok=True)
+                with tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix=".tmp", delete=False) as f:
+                    f.write(res[name])
+                os.replace(f.name, cache_path)
+        return res
+
+    def close(self):
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
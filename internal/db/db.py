@@ -1,59 +1,489 @@
-from typing import Tuple, List
-from datetime import datetime
+from typing import Tuple, List, Dict, Protocol, TYPE_CHECKING
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import hashlib
+import json
 import sys
 import os
 sys.path.append("./")
 
 import pandas as pd
-from pymongo import MongoClient, database
+import numpy as np
+
+from internal.store.store import Store
+from internal.hemodynamics.hemodynamics import flatten_boundaries
+from internal.profile.profile import Profiler
+from query.queries import flagged as flagged_match
+
+# pymongo загружается при первом подключении: воспроизведение снимков обходится без него
+if TYPE_CHECKING:
+    from pymongo import MongoClient, database
+
+# коды ошибок mongo "неизвестный оператор" (InvalidPipelineOperator, неизвестные аккумулятор,
+# выражение и стадия): так сервер старше 7.0 отвечает на $percentile
+UNKNOWN_OPERATOR = {168, 15952, 15999, 40324}
+
+
+class Backend(Protocol):
+    """Источник выгрузок отчета: mongo (DB), экспорт осмотров (internal.local.local.Local),
+    снимок прошлого запуска (internal.snapshot.snapshot.Snapshot) или живые агрегаты (internal.live.live.Live)."""
+
+    def load(self, start_date: datetime, end_date: datetime, org_ids: List[int],
+             flagged: bool = False) -> Tuple[pd.DataFrame]: ...
+
+    def box(self, start_date: datetime, end_date: datetime, org_ids: List[int]) -> pd.DataFrame: ...
+
+    def save(self, name: str, df: pd.DataFrame): ...
+
+    def close_client(self): ...
 
 
 class DB:
     CONNECTION_STRING = "*****"
 
-    def __init__(self, pipeline: dict) -> None:
+    def __init__(self, pipeline: dict, schema: Dict[str, Dict[str, str]] = None, batch_size: int = 10000,
+                 store: Store = None, connection_string: str = None, client: "MongoClient" = None,
+                 single_scan: bool = False, snapshot_path: str = "tmp", profiler: Profiler = None,
+                 percentiles: bool = True, dtypes: Dict[str, str] = None, shard_orgs: int = None,
+                 shard_days: int = None, shard_workers: int = 4, db_name: str = "history") -> None:
         self.pipe = pipeline
-        self.db_name = "history"
+        # типы колонок выгрузок в памяти (см. query.queries.compact)
+        self.dtypes = dtypes or {}
+        # перцентили sheet2 ($percentile) есть только в mongo 7.0+, на старых серверах отключаются после первой ошибки
+        self.percentiles = percentiles
+        self.profiler = profiler or Profiler()
+        self.snapshot_path = snapshot_path
+        # обе страницы одним проходом $facet; выключено, пока результат не сверен с раздельными
+        # запросами на настоящем mongod (bench/bench_local.py --mongo)
+        self.single_scan = single_scan
+        # шардированная выгрузка: организаций и дней в одном шарде, одновременно выполняемых шардов
+        self.shard_orgs = shard_orgs
+        self.shard_days = shard_days
+        self.shard_workers = shard_workers
+        self.connection_string = connection_string or self.CONNECTION_STRING
+        # общий клиент (пакетный режим) принадлежит вызывающему и здесь не закрывается
+        self.owns_client = client is None
+        self.schema = schema or {}
+        self.batch_size = batch_size
+        self.store = store
+        # границы организаций: (id организации, начало, конец) -> (boundary_origin, boundary)
+        self.boundary_cache = {}
+        self.db_name = db_name
         self.collection_name = "inspections"
-        self.client = self.connect()
+        self.client = client or self.connect()
         self.db = self.get_db()
         self.collection = self.get_collection()
 
-    def connect(self) -> MongoClient:
-        client = MongoClient(self.CONNECTION_STRING)
+    def connect(self) -> "MongoClient":
+        from pymongo import MongoClient
+
+        client = MongoClient(self.connection_string)
         return client
 
-    def get_db(self) -> database:
+    @classmethod
+    def pool(cls, connection_string: str = None, max_pool_size: int = 100) -> "MongoClient":
+        from pymongo import MongoClient
+
+        return MongoClient(connection_string or cls.CONNECTION_STRING, maxPoolSize=max_pool_size)
+
+    def get_db(self) -> "database":
         db = self.client[self.db_name]
         return db
 
-    def get_collection(self) -> database:
+    def get_collection(self) -> "database":
         col = self.db[self.collection_name]
         return col
 
     @staticmethod
-    def to_csv(cursor):
-        df = pd.DataFrame(list(cursor))
+    def to_csv(cursor, columns: Dict[str, str] = None, batch_size: int = 10000) -> pd.DataFrame:
+        if columns is None:
+            df = pd.DataFrame(list(cursor))
+        else:
+            # читаем курсор пачками в колоночные буферы известной схемы; даты копятся как есть
+            # и разбираются после чтения, чтобы одна нестандартная дата не обрывала выгрузку
+            dates = [col for col, dtype in columns.items() if dtype.startswith('datetime64')]
+            buffer_dtypes = {col: object if dtype == 'json' or col in dates else dtype for col, dtype in columns.items()}
+            buffers = {col: [] for col in columns}
+            while True:
+                batch = list(islice(cursor, batch_size))
+                if not batch:
+                    break
+                for col, dtype in buffer_dtypes.items():
+                    chunk = np.empty(len(batch), dtype=dtype)
+                    chunk[:] = [doc.get(col) for doc in batch]
+                    buffers[col].append(chunk)
+                del batch
+            df = pd.DataFrame({
+                col: np.concatenate(chunks) if chunks else np.empty(0, dtype=buffer_dtypes[col])
+                for col, chunks in buffers.items()
+            }).infer_objects()
+            for col in dates:
+                df[col] = DB.to_datetime(df[col]).astype(columns[col])
         if '_id' in df:
             del df['_id']
         if 'date' in df.columns:
             df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
         return df
 
-    def load(self, start_date: datetime, end_date: datetime, org_ids: List[int]) -> Tuple[pd.DataFrame]:
-        pipe1 = self.pipe("sheet1", start_date, end_date, org_ids)
-        pipe2 = self.pipe("sheet2", start_date, end_date, org_ids)
-        
-        df1 = self.collection.aggregate(pipe1, allowDiskUse=True)
-        df2 = self.collection.aggregate(pipe2, allowDiskUse=True)
-        df1 = self.to_csv(df1)
-        df2 = self.to_csv(df2)
-        
-        return df1, df2
+    @staticmethod
+    def to_datetime(values: pd.Series) -> pd.Series:
+        # из mongo приходят datetime и строки ISO; прочие строки (например, 12.05.1980) разбираются
+        # по одной, день впереди, а неразборчивые становятся NaT; даты с поясом приводятся к UTC без пояса
+        res = pd.to_datetime(values, errors='coerce', format='ISO8601', utc=True)
+        rest = res.isna() & values.notna()
+        if rest.any():
+            res[rest] = pd.to_datetime(values[rest], errors='coerce', format='mixed', dayfirst=True, utc=True)
+        return res.dt.tz_localize(None)
+
+    def fetch(self, name: str, start_date: datetime, end_date: datetime, org_ids: List[int],
+              stages: List[dict] = ()) -> pd.DataFrame:
+        pipe = self.pipe(name, start_date, end_date, org_ids) + list(stages)
+        cursor = self.collection.aggregate(pipe, allowDiskUse=True, batchSize=self.batch_size)
+        return self.to_csv(cursor, self.schema.get(name), self.batch_size)
+
+    def aggregate(self, name: str, start_date: datetime, end_date: datetime, org_ids: List[int],
+                  stages: List[dict] = ()) -> pd.DataFrame:
+        with self.profiler.stage(f"DB.load:{name}") as record:
+            df = self.fetch(name, start_date, end_date, org_ids, stages)
+            record['rows_out'] = len(df)
+        return df
+
+    def load(self, start_date: datetime, end_date: datetime, org_ids: List[int],
+             flagged: bool = False) -> Tuple[pd.DataFrame]:
+        # flagged - в sheet2 только сотрудники с типом гемодинамики (отбираются на сервере, когда статистики
+        # графиков посчитаны там же, см. box); хранилище и шарды отдают всех, лишних отбросит отчет
+        # хранилище дневных агрегатов работает только с границами по целым дням
+        if self.store is not None and start_date == datetime.combine(start_date.date(), datetime.min.time()) \
+                and end_date == datetime.combine(end_date.date(), datetime.min.time()):
+            df1 = self.load_daily("sheet1", start_date, end_date, org_ids)
+            df2 = self.load_daily("sheet2", start_date, end_date, org_ids)
+        elif self.shard_orgs or self.shard_days:
+            df1 = self.load_sharded("sheet1", start_date, end_date, org_ids)
+            df2 = self.load_sharded("sheet2", start_date, end_date, org_ids)
+        elif self.single_scan and (dfs := self.aggregate_facet(start_date, end_date, org_ids)) is not None:
+            df1, df2 = dfs
+        else:
+            df1 = self.aggregate("sheet1", start_date, end_date, org_ids)
+            df2 = self.aggregate_sheet2(start_date, end_date, org_ids, [self.flagged(start_date, end_date, org_ids)] if flagged else ())
+
+        return self.compact(df1, self.dtypes), self.compact(self.join_boundaries(df2, start_date, end_date), self.dtypes)
+
+    @staticmethod
+    def compact(df: pd.DataFrame, dtypes: Dict[str, str]) -> pd.DataFrame:
+        # повторяющиеся строки - category, узкие числа; колонки меняются на месте, без копии всей таблицы
+        for col, dtype in dtypes.items():
+            if col in df.columns and df[col].dtype != dtype:
+                df[col] = df[col].astype(dtype)
+        return df
+
+    def boundaries(self, start_date: datetime, end_date: datetime, org_ids: List[int]) -> Dict[int, tuple]:
+        # по одному маленькому запросу на организацию, которой еще нет в кэше
+        with self.profiler.stage("DB.load:boundary", rows_in=len(org_ids)):
+            for org_id in org_ids:
+                key = (org_id, start_date, end_date)
+                if key not in self.boundary_cache:
+                    doc = next(self.collection.aggregate(self.pipe("boundary", start_date, end_date, [org_id])), {})
+                    self.boundary_cache[key] = (doc.get('boundary_origin'), doc.get('boundary'))
+        return {org_id: self.boundary_cache[(org_id, start_date, end_date)] for org_id in org_ids}
+
+    def join_boundaries(self, df: pd.DataFrame, start_date: datetime, end_date: datetime) -> pd.DataFrame:
+        # сотрудники sheet2 сгруппированы без границ, подтянем границы их организаций
+        found = self.boundaries(start_date, end_date, list(df['organization_id'].dropna().unique()))
+        return self.attach_boundaries(df, found)
+
+    @staticmethod
+    def attach_boundaries(df: pd.DataFrame, found: Dict[int, tuple]) -> pd.DataFrame:
+        # сразу числовыми колонками: разворачиваем по одному документу на организацию, а не на сотрудника
+        orgs = pd.DataFrame({'boundary_origin': [value[0] for value in found.values()],
+                             'boundary': [value[1] for value in found.values()]}, index=list(found))
+        orgs = orgs[['boundary_origin']].join(flatten_boundaries(orgs))
+        for col in orgs.columns:
+            df[col] = df['organization_id'].map(orgs[col])
+        return df
+
+    def flagged(self, start_date: datetime, end_date: datetime, org_ids: List[int]) -> dict:
+        # границы организаций известны до выгрузки sheet2 (и остаются в кэше для join_boundaries)
+        found = self.boundaries(start_date, end_date, org_ids)
+        limits = self.attach_boundaries(pd.DataFrame({'organization_id': list(found)}), found)
+        return flagged_match(limits.set_index('organization_id').to_dict('index'))
+
+    def aggregate_sheet2(self, start_date: datetime, end_date: datetime, org_ids: List[int],
+                         stages: List[dict] = ()) -> pd.DataFrame:
+        from pymongo.errors import OperationFailure
+
+        if self.percentiles:
+            try:
+                return self.aggregate("sheet2_percentile", start_date, end_date, org_ids, stages)
+            except OperationFailure as exc:
+                if exc.code not in UNKNOWN_OPERATOR:
+                    raise
+                self.percentiles = False
+        return self.aggregate("sheet2", start_date, end_date, org_ids, stages)
+
+    def aggregate_facet(self, start_date: datetime, end_date: datetime, org_ids: List[int]) -> Tuple[pd.DataFrame]:
+        # обе страницы за один проход; None - ответ слишком велик или сервер не поддерживает пайплайн
+        from pymongo.errors import OperationFailure
+
+        name, sheet2 = ("facet_percentile", "sheet2_percentile") if self.percentiles else ("facet", "sheet2")
+        pipe = self.pipe(name, start_date, end_date, org_ids)
+        with self.profiler.stage(f"DB.load:{name}") as record:
+            try:
+                doc = next(self.collection.aggregate(pipe, allowDiskUse=True), None)
+            except OperationFailure as exc:
+                # ответ больше 16 МБ, нехватка памяти и прочие ошибки - сразу к раздельным запросам,
+                # перцентили отключаются, только если сервер их не знает
+                if not self.percentiles or exc.code not in UNKNOWN_OPERATOR:
+                    return None
+                self.percentiles = False
+                return self.aggregate_facet(start_date, end_date, org_ids)
+            if doc is None or doc.get('too_large'):
+                return None
+            dfs = (self.to_csv(iter(doc['sheet1']), self.schema.get("sheet1"), self.batch_size),
+                   self.to_csv(iter(doc['sheet2']), self.schema.get(sheet2), self.batch_size))
+            record['rows_out'] = sum(len(df) for df in dfs)
+        return dfs
+
+    def box(self, start_date: datetime, end_date: datetime, org_ids: List[int]) -> pd.DataFrame:
+        # статистики графиков на сервере; None - сервер не поддерживает $percentile (mongo < 7.0)
+        from pymongo.errors import OperationFailure
+
+        try:
+            return self.aggregate("box", start_date, end_date, org_ids)
+        except OperationFailure as exc:
+            if exc.code not in UNKNOWN_OPERATOR:
+                raise
+            return None
+
+    def table(self, daily: str) -> str:
+        """Таблица хранилища для дневных агрегатов: имя с хэшем пайплайна и схемы.
+
+        Изменился пайплайн или колонки агрегатов - меняется и таблица (вместе с ее покрытием),
+        так что частичные агрегаты старого формата не читаются и выгружаются заново.
+        """
+
+        # пайплайн компилируется на постоянных параметрах: от периода и организаций имя не зависит
+        pipe = self.pipe(daily, datetime(2000, 1, 1), datetime(2000, 1, 2), [0])
+        version = hashlib.sha256(json.dumps([pipe, self.schema[daily]], sort_keys=True, default=str).encode())
+        return f"{daily}_{version.hexdigest()[:12]}"
+
+    def load_daily(self, name: str, start_date: datetime, end_date: datetime, org_ids: List[int]) -> pd.DataFrame:
+        daily = f"{name}_daily"
+        columns = self.schema[daily]
+        table = self.table(daily)
+
+        # прошедшие дни (по UTC) не меняются и кэшируются, текущий и будущие запрашиваются всегда
+        today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+        closed_end = max(start_date, min(end_date, today))
+        days = [d.strftime("%Y-%m-%d") for d in pd.date_range(start_date, closed_end, freq='D', inclusive='left')]
+
+        # догрузим из mongo только недостающие дни непрерывными диапазонами
+        for missing_days, missing_orgs in self.store.missing(table, days, org_ids):
+            for run in self.runs(missing_days):
+                first = datetime.strptime(run[0], "%Y-%m-%d")
+                last = datetime.strptime(run[-1], "%Y-%m-%d") + timedelta(days=1)
+                df = self.aggregate(daily, first, last, missing_orgs)
+                self.store.put(table, self.encode(df, columns), run, missing_orgs)
+
+        parts = [self.store.get(table, days, org_ids)]
+        if closed_end < end_date:
+            parts.append(self.encode(self.aggregate(daily, closed_end, end_date, org_ids), columns))
+
+        df = pd.concat([part for part in parts if len(part)] or [pd.DataFrame(columns=list(columns))], ignore_index=True)
+        return self.decode(self.merge(self.schema, name, df), self.schema[name])
+
+    def shards(self, start_date: datetime, end_date: datetime, org_ids: List[int]) -> List[Tuple[datetime, datetime, List[int]]]:
+        # (подмножество организаций x отрезок времени); без размера по оси шард занимает ее целиком
+        step = self.shard_orgs or max(len(org_ids), 1)
+        orgs = [org_ids[i:i + step] for i in range(0, len(org_ids), step)]
+        slices, first = [], start_date
+        while first < end_date:
+            last = min(end_date, first + timedelta(days=self.shard_days)) if self.shard_days else end_date
+            slices.append((first, last))
+            first = last
+        return [(first, last, part) for first, last in slices for part in orgs]
+
+    def load_sharded(self, name: str, start_date: datetime, end_date: datetime, org_ids: List[int]) -> pd.DataFrame:
+        # шарды выполняются параллельно через пул подключений клиента, каждый - на своем ядре сервера;
+        # частичные агрегаты складываются точно: счетчики суммируются, средние - из сумм и количеств.
+        # перцентили так не складываются, поэтому в этом режиме их нет
+        partial = f"{name}_partial"
+        shards = self.shards(start_date, end_date, org_ids)
+        with self.profiler.stage(f"DB.load:{partial}") as record:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.shard_workers, len(shards)))) as pool:
+                parts = list(pool.map(lambda shard: self.fetch(partial, *shard), shards))
+            df = pd.concat([part for part in parts if len(part)] or [pd.DataFrame(columns=list(self.schema[partial]))],
+                           ignore_index=True)
+            record['rows_out'] = len(df)
+            record['shards'] = len(shards)
+        return self.merge(self.schema, name, df)
+
+    @staticmethod
+    def runs(days: List[str]) -> List[List[str]]:
+        res = []
+        for day in days:
+            if res and datetime.strptime(day, "%Y-%m-%d") - datetime.strptime(res[-1][-1], "%Y-%m-%d") == timedelta(days=1):
+                res[-1].append(day)
+            else:
+                res.append([day])
+        return res
+
+    @staticmethod
+    def encode(df: pd.DataFrame, columns: Dict[str, str]) -> pd.DataFrame:
+        # вложенные документы и даты храним и группируем как строки
+        df = df.copy()
+        for col, dtype in columns.items():
+            if dtype == 'json':
+                df[col] = df[col].map(lambda x: json.dumps(x, sort_keys=True, default=str) if isinstance(x, (dict, list)) else None)
+            elif dtype.startswith('datetime'):
+                df[col] = df[col].dt.strftime("%Y-%m-%dT%H:%M:%S").astype(object).where(df[col].notna(), None)
+        return df
+
+    @staticmethod
+    def decode(df: pd.DataFrame, columns: Dict[str, str]) -> pd.DataFrame:
+        for col, dtype in columns.items():
+            if dtype == 'json':
+                df[col] = df[col].map(lambda x: json.loads(x) if isinstance(x, str) else None)
+            elif dtype.startswith('datetime'):
+                df[col] = pd.to_datetime(df[col])
+        return df
+
+    @staticmethod
+    def merge(schema: Dict[str, Dict[str, str]], name: str, partials: pd.DataFrame) -> pd.DataFrame:
+        # ключи группировки складываются, счетчики суммируются, средние пересчитываются из сумм и количеств
+        columns = schema[name]
+        keys = [col for col, dtype in columns.items() if dtype not in ('int64', 'float64')]
+        means = [col for col, dtype in columns.items() if dtype == 'float64']
+        values = [col for col in schema[f"{name}_daily"] if col not in keys and col != 'day']
+
+        df = partials.astype({col: 'float64' for col in values}).groupby(keys, as_index=False, sort=False, dropna=False)[values].sum()
+        for col in means:
+            df[col] = df[f'{col}_sum'] / df[f'{col}_count'].where(df[f'{col}_count'] > 0)
+        for col, dtype in columns.items():
+            if dtype == 'int64':
+                df[col] = df[col].astype('int64')
+        return df[list(columns)]
+
+    def ensure_indexes(self, indexes: Dict[str, List[Tuple[str, int]]], create: bool = True) -> Dict[str, str]:
+        # сравниваем по набору ключей, а не по имени: подходящий индекс мог быть создан под другим именем
+        existing = {
+            # направление как есть: кроме 1/-1 бывают 'hashed', 'text', '2dsphere'
+            tuple((field, direction) for field, direction in info['key']): name
+            for name, info in self.collection.index_information().items()
+        }
+        res = {}
+        for name, keys in indexes.items():
+            if tuple(keys) in existing:
+                res[name] = f"exists ({existing[tuple(keys)]})"
+            elif create:
+                self.collection.create_index(keys, name=name)
+                res[name] = "created"
+            else:
+                res[name] = "missing"
+        return res
+
+    def pipelines(self) -> List[str]:
+        # пайплайны, которые выполнит load при текущих настройках (ветки в том же порядке)
+        sheet2 = "sheet2_percentile" if self.percentiles else "sheet2"
+        if self.store is not None:
+            names = ["sheet1_daily", "sheet2_daily"]
+        elif self.shard_orgs or self.shard_days:
+            names = ["sheet1_partial", "sheet2_partial"]
+        elif self.single_scan:
+            names = ["facet_percentile" if self.percentiles else "facet"]
+        else:
+            names = ["sheet1", sheet2]
+        return names + ["boundary"]
+
+    def explain(self, start_date: datetime, end_date: datetime, org_ids: List[int],
+                names: Tuple[str] = None) -> List[dict]:
+        # по умолчанию - пайплайны, которые реально выполняются при выгрузке (self.pipelines)
+        res = []
+        for name in names or self.pipelines():
+            # границы запрашиваются по одной организации
+            pipe = self.pipe(name, start_date, end_date, org_ids[:1] if name == "boundary" else org_ids)
+            plan = self.db.command(
+                'explain',
+                {'aggregate': self.collection_name, 'pipeline': pipe, 'cursor': {}, 'allowDiskUse': True},
+                verbosity='executionStats')
+            stats = self.find(plan, 'executionStats') or {}
+            stages = self.find_all(plan, 'stage')
+            res.append({
+                'pipeline': name,
+                'docs_examined': stats.get('totalDocsExamined'),
+                'keys_examined': stats.get('totalKeysExamined'),
+                'returned': stats.get('nReturned'),
+                'time_ms': stats.get('executionTimeMillis'),
+                'indexes': sorted(set(self.find_all(plan, 'indexName'))),
+                'collscan': 'COLLSCAN' in stages,
+            })
+        return res
+
+    @classmethod
+    def find(cls, doc, key: str):
+        # первое вхождение ключа в дереве explain (формат зависит от версии сервера и движка)
+        if isinstance(doc, dict):
+            if key in doc:
+                return doc[key]
+            doc = list(doc.values())
+        if isinstance(doc, list):
+            for value in doc:
+                found = cls.find(value, key)
+                if found is not None:
+                    return found
+        return None
+
+    @classmethod
+    def find_all(cls, doc, key: str) -> list:
+        res = []
+        if isinstance(doc, dict):
+            if key in doc:
+                res.append(doc[key])
+            doc = list(doc.values())
+        if isinstance(doc, list):
+            for value in doc:
+                res.extend(cls.find_all(value, key))
+        return res
+
+    def identity(self) -> dict:
+        # источник и настройки, от которых зависит результат load (ключ кэша выгрузки);
+        # серверы - адресами из клиента, без учетных данных строки подключения
+        return {
+            'servers': sorted(self.client.topology_description.server_descriptions()),
+            'db': self.db_name,
+            'collection': self.collection_name,
+            'store': self.store.path if self.store is not None else None,
+            'shard_orgs': self.shard_orgs,
+            'shard_days': self.shard_days,
+            'single_scan': self.single_scan,
+            'percentiles': self.percentiles,
+            'dtypes': self.dtypes,
+        }
 
     def close_client(self):
-        self.client.close()
+        if self.owns_client:
+            self.client.close()
+        if self.store is not None:
+            self.store.close()
 
     def save(self, name: str, df: pd.DataFrame):
-        os.makedirs(f"tmp/{name}", exist_ok=True)
-        df.to_csv(f"tmp/{name}/{name}.csv", index=False)
+        self.write(self.snapshot_path, name, df)
+
+    @staticmethod
+    def write(snapshot_path: str, name: str, df: pd.DataFrame):
+        # типизированный снимок: вложенные документы сохраняются как struct, а не строками
+        # без папки снимков (snapshot_path=None) ничего не пишется
+        if snapshot_path is None:
+            return
+        path = f"{snapshot_path}/{name}/{name}.parquet"
+        if df is None:
+            # выгрузки нет (статистики box не посчитаны): снимок прошлого запуска не должен попасть в воспроизведение
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        os.makedirs(f"{snapshot_path}/{name}", exist_ok=True)
+        df.to_parquet(path, compression='zstd', index=False)
+
+    @staticmethod
+    def read(snapshot_path: str, name: str) -> pd.DataFrame:
+        return pd.read_parquet(f"{snapshot_path}/{name}/{name}.parquet")
@@ -0,0 +1,166 @@
+from typing import Dict, List, Tuple, Union
+from datetime import datetime
+import operator
+import sys
+sys.path.append("./")
+
+import pandas as pd
+import numpy as np
+
+
+# границы показателей: колонка -> (путь внутри boundaries.values, значение по умолчанию)
+BOUNDARIES: Dict[str, Tuple[Tuple[str, ...], float]] = {
+    'boundary_pulse_lower': (('pulse', 'lower'), 54),
+    'boundary_pulse_upper': (('pulse', 'upper'), 100),
+    'boundary_sad_upper': (('pressure', 'systolic', 'upper'), 139),
+    'boundary_sad_lower': (('pressure', 'systolic', 'lower'), 100),
+    'boundary_dad_upper': (('pressure', 'diastolic', 'upper'), 89),
+    'boundary_dad_lower': (('pressure', 'systolic', 'lower'), 60),
+}
+
+# правило: (колонка, оператор, порог - число или колонка с границей)
+Rule = Tuple[str, str, Union[str, float]]
+
+# таблица правил: колонка -> ([(значение, [правила через "или"]), ...], значение по умолчанию)
+# порядок значений важен - выбирается первое сработавшее
+HEMODYNAMIC_TYPES: Dict[str, Tuple[List[Tuple[str, List[Rule]]], str]] = {
+    'type_sad': ([
+        ("Брадиритмик (Пониженная ЧСС)", [('mean_pulse', '<', 'boundary_pulse_lower')]),
+    ], ""),
+    'type_dad': ([
+        ("Гипертоник (Повышенное дАД)", [('mean_dad', '>', 'boundary_dad_upper')]),
+        ("Гипотоник (Пониженное дАД)", [('mean_dad', '<', 'boundary_dad_lower')]),
+    ], ""),
+    'type_pulse': ([
+        ("Тахиритмик (Повышенная ЧСС)", [('mean_pulse', '>', 'boundary_pulse_upper')]),
+    ], ""),
+}
+
+# порядок склейки колонок в 'Тип гемодинамики'
+HEMODYNAMIC_TYPE_ORDER = ['type_sad', 'type_dad', 'type_pulse', 'type_sad']
+
+OBSERVATION_BLOCKS: Dict[str, Tuple[List[Tuple[str, List[Rule]]], str]] = {
+    'Блок наблюдений по АД': ([
+        ("Повышенное АД", [('mean_dad', '>', 89), ('mean_sad', '>', 139)]),
+        ("Пониженное АД", [('mean_dad', '<', 60), ('mean_sad', '<', 100)]),
+    ], "Нормальное АД"),
+    'Блок наблюдений по ЧСС': ([
+        ("Повышенная ЧСС", [('mean_pulse', '>', 100)]),
+        ("Пониженная ЧСС", [('mean_pulse', '<', 54)]),
+    ], "Нормальная ЧСС"),
+    'Рекомендации': ([
+        ("Рекомендуется внеочередной медицинский осмотра с заключением врача профпатолога", [
+            ('mean_sad', '>=', 160), ('mean_sad', '<=', 89),
+            ('mean_dad', '>=', 100), ('mean_dad', '<=', 49),
+            ('mean_pulse', '>=', 106), ('mean_pulse', '<=', 44)]),
+    ], "Рекомендуется обратиться ко врачу терапевту за медицинской консультацией"),
+}
+
+OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+
+def _dig(value: dict, path: Tuple[str, ...]) -> float:
+    for key in path:
+        value = value[key]
+    return value
+
+
+def flatten_boundaries(df: pd.DataFrame) -> pd.DataFrame:
+    """Разворачивает вложенный словарь boundary в числовые колонки границ.
+
+    Для строк с boundary_origin != 'org' подставляются значения по умолчанию.
+
+    Args:
+        df (pd.DataFrame): Данные с колонками boundary и boundary_origin.
+
+    Returns:
+        pd.DataFrame: Датафрейм с колонками из BOUNDARIES.
+    """
+
+    org = (df['boundary_origin'] == 'org').to_numpy()
+    res = pd.DataFrame(index=df.index)
+    for col, (_, default) in BOUNDARIES.items():
+        res[col] = np.full(len(df), default, dtype=float)
+
+    if org.any():
+        # пройдем по вложенным словарям только для строк с границами организации
+        boundaries = df['boundary'].to_numpy()[org]
+        for col, (path, _) in BOUNDARIES.items():
+            res.loc[org, col] = np.fromiter((_dig(x, path) for x in boundaries), dtype=float, count=len(boundaries))
+
+    return res
+
+
+def select(df: pd.DataFrame, choices: List[Tuple[str, List[Rule]]], default: str) -> np.ndarray:
+    """Векторно вычисляет значение колонки по таблице правил.
+
+    Args:
+        df (pd.DataFrame): Данные с колонками, упомянутыми в правилах.
+        choices (List[Tuple[str, List[Rule]]]): Значения и условия для них.
+        default (str): Значение, если ни одно условие не выполнено.
+
+    Returns:
+        np.ndarray: Массив значений.
+    """
+
+    conditions = []
+    for _, rules in choices:
+        mask = np.zeros(len(df), dtype=bool)
+        for col, op, threshold in rules:
+            bound = df[threshold].to_numpy(dtype=float) if isinstance(threshold, str) else threshold
+            mask |= OPERATORS[op](df[col].to_numpy(dtype=float), bound)
+        conditions.append(mask)
+    res = np.select(conditions, [value for value, _ in choices], default=default)
+    return res.astype(object)
+
+
+def age(birthday: pd.Series, now: datetime = None) -> pd.Series:
+    """Вычисляет полное число лет на текущую дату.
+
+    Args:
+        birthday (pd.Series): Даты рождения.
+        now (datetime, optional): Дата, на которую считается возраст.
+
+    Returns:
+        pd.Series: Возраст в годах.
+    """
+
+    now = now or datetime.now()
+    born = pd.to_datetime(birthday)
+    before_birthday = (born.dt.month > now.month) | ((born.dt.month == now.month) & (born.dt.day > now.day))
+    return now.year - born.dt.year - before_birthday.astype('int64')
+
+
+def classify(df: pd.DataFrame) -> pd.DataFrame:
+    """Присваивает сотрудникам типы гемодинамики, блоки наблюдений и рекомендации.
+
+    Границы берутся из колонок BOUNDARIES, если DB.load уже развернул их, иначе - из вложенного boundary
+    (снимки прежних запусков). В первом случае данные не копируются: колонки добавляются в поверхностную
+    копию df, и датафрейм вызывающего (выгрузка dfs['sheet2'], которую читают и следующие этапы) не меняется.
+
+    Args:
+        df (pd.DataFrame): Данные второй страницы с колонками mean_sad, mean_dad, mean_pulse.
+
+    Returns:
+        pd.DataFrame: Данные с добавленными колонками.
+    """
+
+    buf = df.copy(deep=False) if set(BOUNDARIES) <= set(df.columns) else df.join(flatten_boundaries(df))
+
+    for col, (choices, default) in HEMODYNAMIC_TYPES.items():
+        buf[col] = select(buf, choices, default)
+
+    types = buf[HEMODYNAMIC_TYPE_ORDER[0]]
+    for col in HEMODYNAMIC_TYPE_ORDER[1:]:
+        types = types + ", " + buf[col]
+    buf['Тип гемодинамики'] = types.str.rstrip(", ").str.lstrip(", ")
+
+    for col, (choices, default) in OBSERVATION_BLOCKS.items():
+        buf[col] = select(buf, choices, default)
+
+    return buf
@@ -0,0 +1,348 @@
+from typing import Dict, List, Tuple
+from datetime import datetime, timedelta, timezone
+import threading
+import pickle
+import sys
+import os
+sys.path.append("./")
+
+import pandas as pd
+
+from internal.db.db import DB
+from query.queries import count_causes, EMPLOYEE_KEY
+
+
+# шаги осмотра, из которых берутся показатели: колонка -> путь внутри steps.result.value
+READINGS = {
+    'sad': ('pressure', 'systolic'),
+    'dad': ('pressure', 'diastolic'),
+    'pulse': ('pulse',),
+}
+
+# средние пайплайна sheet2: колонка -> показатель и возводится ли он в квадрат
+MEANS = {
+    'mean_sad': ('sad', False),
+    'mean_dad': ('dad', False),
+    'mean_pulse': ('pulse', False),
+    'mean_sq_sad': ('sad', True),
+    'mean_sq_dad': ('dad', True),
+    'mean_sq_pulse': ('pulse', True),
+}
+
+SHEET2_TYPES = ('BEFORE_TRIP', 'BEFORE_SHIFT')
+
+MISSING = object()
+
+
+def _get(doc, path: Tuple[str, ...]):
+    for key in path:
+        if not isinstance(doc, dict) or key not in doc:
+            return MISSING
+        doc = doc[key]
+    return doc
+
+
+def _number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def reading(doc: dict, path: Tuple[str, ...]):
+    """Второе измерение показателя, как {'$arrayElemAt': ['$steps.result.value...', 1]}.
+
+    Путь по массиву шагов собирает значения только тех шагов, где он есть.
+    """
+
+    values = [value for step in doc.get('steps') or [] if (value := _get(step, ('result', 'value') + path)) is not MISSING]
+    return values[1] if len(values) > 1 else None
+
+
+class Live:
+
+    def __init__(self, schema: Dict[str, Dict[str, str]], path: str = None, dtypes: Dict[str, str] = None,
+                 window: timedelta = timedelta(hours=1), retention_days: int = 400, snapshot_path: str = None) -> None:
+        """Живые дневные агрегаты отчета, обновляемые из change stream коллекции осмотров.
+
+        Хранит те же дневные частичные агрегаты, что пайплайны sheet1_daily и sheet2_daily:
+        счетчики и пары сумма/количество для средних, и последние границы организаций.
+        Отчет из них собирается DB.merge без обращения к mongo: Live - источник выгрузок
+        с интерфейсом DB (Gemodynamics(..., live=live)).
+
+        Args:
+            schema (Dict[str, Dict[str, str]]): Схема пайплайнов (query.queries.schema).
+            path (str, optional): Файл состояния. Если указан, состояние и токен возобновления
+                change stream сохраняются в него (checkpoint) и читаются при создании.
+            dtypes (Dict[str, str], optional): Типы колонок в памяти (query.queries.compact).
+            window (timedelta, optional): Сколько после обработки осмотра по нему еще могут прийти события
+                (повтор после возобновления потока, повторное обновление). prune сдвигает watermark
+                на window назад от последнего учтенного осмотра и забывает _id до него.
+            retention_days (int, optional): Сколько дней хранить агрегаты и границы, считая от последнего
+                учтенного осмотра. Если None, хранятся все дни.
+            snapshot_path (str, optional): Папка для снимков выгрузок отчета. Если не указана, снимки не пишутся.
+
+        Example:
+            live = Live(schema, "tmp/live/live.pickle", compact)
+            live.seed(DB(pipeline, schema), datetime(2023, 10, 1), [1328, 2211])
+            threading.Thread(target=live.watch, args=(collection,), daemon=True).start()
+            Gemodynamics(datetime(2023, 10, 1), datetime(2023, 11, 1), [1328, 2211], "results", live=live).run()
+        """
+
+        self.schema = schema
+        self.path = path
+        self.dtypes = dtypes or {}
+        self.lock = threading.Lock()
+        self.rows: Dict[str, Dict[tuple, dict]] = {'sheet1': {}, 'sheet2': {}}
+        # граница организации за день: (id организации, день) -> (время осмотра, origin, values)
+        self.boundaries: Dict[Tuple[int, str], tuple] = {}
+        self.resume_token = None
+        # осмотры, обработанные раньше этого времени, уже учтены при seed
+        self.watermark: datetime = None
+        # _id осмотров, уже учтенных из change stream, -> время обработки: повторное обновление или повтор
+        # события после возобновления потока не должны учитывать осмотр второй раз
+        self.applied: Dict[object, datetime] = {}
+        # время обработки последнего учтенного осмотра: от него отсчитываются window и retention_days
+        self.latest: datetime = None
+        self.events = 0
+        self.margin = timedelta(minutes=1)
+        self.window = window
+        self.retention_days = retention_days
+        self.snapshot_path = snapshot_path
+        if path is not None and os.path.exists(path):
+            self.restore()
+
+    def add(self, name: str, key: tuple, doc: dict, counters: Dict[str, int]):
+        row = self.rows[name].get(key)
+        if row is None:
+            # атрибуты берутся из первого осмотра дня, как $first в пайплайне
+            row = self.rows[name][key] = {col: 0 for col in self.schema[f"{name}_daily"]}
+            row.update(doc)
+        for col, value in counters.items():
+            row[col] += value
+
+    def apply(self, doc: dict):
+        """Учитывает один обработанный осмотр в дневных агрегатах обеих страниц."""
+
+        processed_at = _get(doc, ('timestamps', 'processedAt'))
+        if not isinstance(processed_at, datetime) or doc.get('isTest') is not False:
+            return
+        if self.watermark is not None and processed_at < self.watermark:
+            return
+
+        day = processed_at.strftime("%Y-%m-%d")
+        org = doc.get('organization') or {}
+        resolution = doc.get('resolution') or {}
+        success, remarks = resolution.get('success'), resolution.get('remarks')
+
+        with self.lock:
+            if doc.get('_id') is not None:
+                if doc['_id'] in self.applied:
+                    return
+                self.applied[doc['_id']] = processed_at
+            if self.latest is None or self.latest < processed_at:
+                self.latest = processed_at
+            attrs = {
+                'organization_name': org.get('name'),
+                'organization_id': org.get('id'),
+                'organization_inn': org.get('inn'),
+                'day': day,
+            }
+            point = _get(doc, ('host', 'releasePoint', 'address'))
+            point = None if point is MISSING else point
+            self.add('sheet1', (org.get('id'), org.get('name'), org.get('inn'), point, day),
+                     {**attrs, 'host_release_point': point}, {
+                         'count_medics': 1,
+                         'count_success': int(bool(success)),
+                         'count_not_success': int(not success),
+                         **count_causes("sheet1", remarks, success),
+                     })
+
+            if doc.get('type') not in SHEET2_TYPES:
+                return
+
+            employee = doc.get('employee') or {}
+            values = {name: reading(doc, path) for name, path in READINGS.items()}
+            counters = {'count_all': 1, **count_causes("sheet2", remarks, success)}
+            for col, (name, squared) in MEANS.items():
+                if _number(values[name]):
+                    counters[f'{col}_sum'] = values[name] ** 2 if squared else values[name]
+                    counters[f'{col}_count'] = 1
+            person = {
+                'employee_name': employee.get('name'),
+                'employee_surname': employee.get('surname'),
+                'employee_patronymic': employee.get('patronymic'),
+                'employee_birthday': employee.get('dateOfBirth'),
+                'employee_number': employee.get('personnelNumber'),
+            }
+            self.add('sheet2', (org.get('id'), *[person[col] for col in EMPLOYEE_KEY], day), {**attrs, **person}, counters)
+
+            boundaries = doc.get('boundaries') or {}
+            latest = self.boundaries.get((org.get('id'), day))
+            if latest is None or latest[0] <= processed_at:
+                self.boundaries[(org.get('id'), day)] = (processed_at, boundaries.get('origin'), boundaries.get('values'))
+
+    def on_change(self, change: dict):
+        # осмотр учитывается, когда становится обработанным: вставка уже обработанного
+        # или обновление, выставившее timestamps.processedAt; учтенные осмотры apply пропускает по _id
+        self.events += 1
+        doc = change.get('fullDocument')
+        if doc is None:
+            return
+        if change['operationType'] == 'update':
+            fields = (change.get('updateDescription') or {}).get('updatedFields') or {}
+            if not any(field == 'timestamps' or field.startswith('timestamps.processedAt') for field in fields):
+                return
+        self.apply(doc)
+
+    def watch(self, collection, stop: threading.Event = None, save_every: int = 1000):
+        """Подписывается на change stream коллекции и обновляет агрегаты до установки stop.
+
+        Требует replica set (или одноузловой replica set локально). Продолжает с сохраненного
+        токена возобновления, если он есть.
+
+        Args:
+            collection: Коллекция pymongo history.inspections.
+            stop (threading.Event, optional): Событие остановки.
+            save_every (int, optional): Сохранять состояние каждые save_every событий (если задан path).
+        """
+
+        from bson import Timestamp
+
+        match = {'$match': {'operationType': {'$in': ['insert', 'update']}}}
+        start_at = None
+        if self.resume_token is None and self.watermark is not None:
+            # с запасом до watermark: повторы отсекаются по processedAt в apply
+            start_at = Timestamp(int((self.watermark - self.margin).replace(tzinfo=timezone.utc).timestamp()), 0)
+        with collection.watch([match], full_document='updateLookup', resume_after=self.resume_token,
+                              start_at_operation_time=start_at, max_await_time_ms=500) as stream:
+            while stop is None or not stop.is_set():
+                change = stream.try_next()
+                if change is not None:
+                    self.on_change(change)
+                self.resume_token = stream.resume_token
+                if change is not None and self.events % save_every == 0:
+                    self.prune()
+                    if self.path is not None:
+                        self.checkpoint()
+        if self.path is not None:
+            self.checkpoint()
+
+    def seed(self, db: DB, start_date: datetime, org_ids: List[int], end_date: datetime = None):
+        """Загружает агрегаты за прошедшие дни из mongo, дальше работает change stream.
+
+        Осмотры, обработанные до watermark, учитываются выгрузкой, а события по ним из change stream
+        пропускаются. Запускать до watch: без токена возобновления поток открывается чуть раньше watermark,
+        так что осмотры, обработанные между выгрузкой и подпиской, не теряются.
+
+        Args:
+            db (DB): Сервис базы данных.
+            start_date (datetime): Первый день.
+            org_ids (List[int]): Список id организаций.
+            end_date (datetime, optional): Момент, до которого берутся осмотры. По умолчанию - сейчас (UTC).
+        """
+
+        self.watermark = end_date or datetime.utcnow()
+        for name in ['sheet1', 'sheet2']:
+            df = db.aggregate(f"{name}_daily", start_date, self.watermark, org_ids)
+            keys = [col for col in self.schema[f"{name}_daily"] if col in self.schema[name] and self.schema[name][col] not in ('int64', 'float64')]
+            for row in df.astype(object).where(df.notna(), None).to_dict('records'):
+                key = (row['organization_id'], *[row[col] for col in EMPLOYEE_KEY], row['day']) if name == 'sheet2' else \
+                    (row['organization_id'], row['organization_name'], row['organization_inn'], row['host_release_point'], row['day'])
+                counters = {col: row[col] or 0 for col in self.schema[f"{name}_daily"] if col not in keys and col != 'day'}
+                with self.lock:
+                    self.add(name, key, {col: row[col] for col in keys + ['day']}, counters)
+        for org_id in org_ids:
+            doc = next(db.collection.aggregate(db.pipe("boundary", start_date, self.watermark, [org_id])), None)
+            if doc is not None:
+                day = doc['processed_at'].strftime("%Y-%m-%d")
+                with self.lock:
+                    latest = self.boundaries.get((org_id, day))
+                    if latest is None or latest[0] <= doc['processed_at']:
+                        self.boundaries[(org_id, day)] = (doc['processed_at'], doc.get('boundary_origin'), doc.get('boundary'))
+
+    def load(self, start_date: datetime, end_date: datetime, org_ids: List[int],
+             flagged: bool = False) -> Tuple[pd.DataFrame]:
+        """Собирает выгрузки обеих страниц из живых агрегатов, как DB.load.
+
+        Args:
+            start_date (datetime): Начало периода (целый день).
+            end_date (datetime): Конец периода, не включается (целый день).
+            org_ids (List[int]): Список id организаций.
+            flagged (bool, optional): Не используется: статистик графиков в живых агрегатах нет (box - None),
+                и отчету нужны все сотрудники.
+
+        Returns:
+            Tuple[pd.DataFrame]: Выгрузки sheet1 (по точкам выпуска) и sheet2.
+        """
+
+        if start_date != datetime.combine(start_date.date(), datetime.min.time()) \
+                or end_date != datetime.combine(end_date.date(), datetime.min.time()):
+            raise ValueError("живые агрегаты хранятся по дням: границы периода должны быть целыми днями")
+
+        days = {d.strftime("%Y-%m-%d") for d in pd.date_range(start_date, end_date, freq='D', inclusive='left')}
+        orgs = set(org_ids)
+        res = []
+        with self.lock:
+            for name in ['sheet1', 'sheet2']:
+                rows = [row for row in self.rows[name].values() if row['day'] in days and row['organization_id'] in orgs]
+                res.append(pd.DataFrame(rows, columns=list(self.schema[f"{name}_daily"])))
+            latest = {}
+            for (org_id, day), value in self.boundaries.items():
+                if day in days and org_id in orgs and (org_id not in latest or latest[org_id][0] <= value[0]):
+                    latest[org_id] = value
+
+        res[1]['employee_birthday'] = DB.to_datetime(res[1]['employee_birthday'])
+        df1 = DB.merge(self.schema, "sheet1", res[0])
+        df2 = DB.merge(self.schema, "sheet2", res[1])
+        df2 = DB.attach_boundaries(df2, {org_id: value[1:] for org_id, value in latest.items()})
+        return DB.compact(df1, self.dtypes), DB.compact(df2, self.dtypes)
+
+    def prune(self):
+        """Забывает _id осмотров старше window и дни агрегатов старше retention_days.
+
+        Осмотры, обработанные раньше сдвинутого watermark, apply пропускает и без _id, поэтому
+        множество учтенных осмотров не растет бесконечно. События, пришедшие позже window, теряются.
+        """
+
+        with self.lock:
+            if self.latest is None:
+                return
+            cutoff = self.latest - self.window
+            if self.watermark is None or self.watermark < cutoff:
+                self.watermark = cutoff
+            self.applied = {_id: at for _id, at in self.applied.items() if at >= self.watermark}
+            if self.retention_days is None:
+                return
+            first = (self.latest - timedelta(days=self.retention_days)).strftime("%Y-%m-%d")
+            for name in self.rows:
+                self.rows[name] = {key: row for key, row in self.rows[name].items() if row['day'] >= first}
+            self.boundaries = {key: value for key, value in self.boundaries.items() if key[1] >= first}
+
+    def box(self, start_date: datetime, end_date: datetime, org_ids: List[int]) -> pd.DataFrame:
+        # квартили по дням не складываются, статистики графиков считаются по sheet2 (charts.box_stats)
+        return None
+
+    def save(self, name: str, df: pd.DataFrame):
+        DB.write(self.snapshot_path, name, df)
+
+    def close_client(self):
+        # агрегаты живут дольше отчета, поток изменений закрывает watch
+        pass
+
+    def checkpoint(self):
+        # через временный файл, чтобы упавший процесс не оставил недописанное состояние
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self.lock:
+            state = {'rows': self.rows, 'boundaries': self.boundaries, 'applied': self.applied,
+                     'latest': self.latest, 'resume_token': self.resume_token, 'watermark': self.watermark}
+            with open(f"{self.path}.{os.getpid()}", 'wb') as f:
+                pickle.dump(state, f)
+        os.replace(f"{self.path}.{os.getpid()}", self.path)
+
+    def restore(self):
+        with open(self.path, 'rb') as f:
+            state = pickle.load(f)
+        self.rows = state['rows']
+        self.boundaries = state['boundaries']
+        self.applied = state.get('applied', {})
+        self.latest = state.get('latest')
+        self.resume_token = state['resume_token']
+        self.watermark = state['watermark']
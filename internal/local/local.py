@@ -0,0 +1,260 @@
+from typing import Dict, List, Tuple
+from datetime import datetime
+import sys
+import os
+sys.path.append("./")
+
+import pandas as pd
+import numpy as np
+
+from internal.db.db import DB
+from query.queries import remarks, causes, quantiles, EMPLOYEE_KEY
+
+
+# поля осмотра, которые читают пайплайны: колонка -> путь в документе
+FIELDS = {
+    'processed_at': ('timestamps', 'processedAt'),
+    'is_test': ('isTest',),
+    'type': ('type',),
+    'organization_name': ('organization', 'name'),
+    'organization_id': ('organization', 'id'),
+    'organization_inn': ('organization', 'inn'),
+    'host_release_point': ('host', 'releasePoint', 'address'),
+    'resolution_success': ('resolution', 'success'),
+    'resolution_remarks': ('resolution', 'remarks'),
+    'employee_name': ('employee', 'name'),
+    'employee_surname': ('employee', 'surname'),
+    'employee_patronymic': ('employee', 'patronymic'),
+    'employee_number': ('employee', 'personnelNumber'),
+    'employee_birthday': ('employee', 'dateOfBirth'),
+    'boundary_origin': ('boundaries', 'origin'),
+    'boundary': ('boundaries', 'values'),
+}
+
+# показатели второго измерения: колонка -> путь внутри steps.result.value
+READINGS = {
+    'sad': ('pressure', 'systolic'),
+    'dad': ('pressure', 'diastolic'),
+    'pulse': ('pulse',),
+}
+
+SHEET2_TYPES = ['BEFORE_TRIP', 'BEFORE_SHIFT']
+
+EXTENSIONS = ('.parquet', '.jsonl', '.json')
+
+
+def field(array, path: Tuple[str, ...]):
+    """Вложенное поле массива структур arrow; если его нет - None.
+
+    Даты mongoexport ({"$date": ...}) разворачиваются в строку даты.
+    """
+
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    for name in path + ('$date',):
+        if not pa.types.is_struct(array.type) or array.type.get_field_index(name) < 0:
+            return None if name != '$date' else array
+        # struct_field, в отличие от StructArray.field, учитывает пустые родительские структуры
+        array = pc.struct_field(array, [array.type.get_field_index(name)])
+    return array
+
+
+def column(table, path: Tuple[str, ...]) -> pd.Series:
+    import pyarrow as pa
+
+    if path[0] not in table.column_names:
+        return pd.Series([None] * table.num_rows, dtype=object)
+    array = field(table.column(path[0]).combine_chunks(), path[1:])
+    if array is None:
+        return pd.Series([None] * table.num_rows, dtype=object)
+    if pa.types.is_struct(array.type) or pa.types.is_list(array.type):
+        # вложенные документы и массивы - объектами python, как из курсора pymongo
+        return pd.Series(array.to_pylist(), dtype=object)
+    return array.to_pandas()
+
+
+def reading(table, path: Tuple[str, ...]) -> np.ndarray:
+    """Второе значение показателя среди шагов осмотра, как {'$arrayElemAt': ['$steps.result.value...', 1]}.
+
+    Путь по массиву в mongo пропускает шаги без этого поля; в arrow отсутствующее поле и null неразличимы,
+    поэтому пропускаются и явные null.
+    """
+
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    res = np.full(table.num_rows, np.nan)
+    if 'steps' not in table.column_names or not pa.types.is_list(table.column('steps').type):
+        return res
+    steps = table.column('steps').combine_chunks()
+    values = field(pc.list_flatten(steps), ('result', 'value') + path)
+    if values is None:
+        return res
+    df = pd.DataFrame({'parent': pc.list_parent_indices(steps).to_numpy(), 'value': values.to_pandas()})
+    df = df[pc.is_valid(values).to_numpy(zero_copy_only=False)]
+    second = df[df.groupby('parent').cumcount() == 1]
+    # нечисловые значения занимают позицию, но в $avg не участвуют
+    res[second['parent'].to_numpy()] = pd.to_numeric(second['value'], errors='coerce').to_numpy(dtype=float)
+    return res
+
+
+def to_datetime(values: pd.Series) -> pd.Series:
+    # даты mongo - UTC без часового пояса
+    return pd.to_datetime(values, utc=True, errors='coerce').dt.tz_localize(None)
+
+
+class Local:
+
+    def __init__(self, path: str, schema: Dict[str, Dict[str, str]], dtypes: Dict[str, str] = None,
+                 snapshot_path: str = None, batch_size: int = 100000, percentiles: bool = True) -> None:
+        """Локальный источник выгрузок: пайплайны sheet1 и sheet2 над экспортом коллекции осмотров.
+
+        Читает Parquet или JSON lines (mongoexport) и векторно повторяет семантику пайплайнов
+        query.queries: $match по периоду, isTest и организациям, категории замечаний, счетчики $group,
+        $first атрибутов, средние второго измерения и границы организации по последнему осмотру.
+        Интерфейс тот же, что у DB, так что Gemodynamics(backend=Local(...)) строит отчет без mongo.
+
+        Args:
+            path (str): Файл экспорта или папка с файлами .parquet/.jsonl/.json.
+            schema (Dict[str, Dict[str, str]]): Схема пайплайнов (query.queries.schema).
+            dtypes (Dict[str, str], optional): Типы колонок в памяти (query.queries.compact).
+            snapshot_path (str, optional): Папка для снимков выгрузок. Если не указана, снимки не пишутся.
+            batch_size (int, optional): Строк parquet за одно чтение.
+            percentiles (bool, optional): Считать медиану и 90-й перцентиль показателей сотрудника
+                (точные, в mongo - приближенные).
+
+        Example:
+            backend = Local("exports/inspections", schema, compact)
+            Gemodynamics(datetime(2023, 10, 1), datetime(2023, 11, 1), [1328, 2211], "results", backend=backend).run()
+        """
+
+        self.path = path
+        self.schema = schema
+        self.dtypes = dtypes or {}
+        self.snapshot_path = snapshot_path
+        self.batch_size = batch_size
+        self.percentiles = percentiles
+
+    def files(self) -> List[str]:
+        if os.path.isfile(self.path):
+            return [self.path]
+        return sorted(os.path.join(self.path, name) for name in os.listdir(self.path) if name.endswith(EXTENSIONS))
+
+    def tables(self):
+        import pyarrow as pa
+        import pyarrow.json
+        import pyarrow.parquet as pq
+
+        tops = sorted({path[0] for path in FIELDS.values()} | {'steps'})
+        for path in self.files():
+            if path.endswith('.parquet'):
+                file = pq.ParquetFile(path)
+                columns = [name for name in tops if name in file.schema_arrow.names]
+                for batch in file.iter_batches(batch_size=self.batch_size, columns=columns):
+                    yield pa.Table.from_batches([batch])
+            else:
+                yield pyarrow.json.read_json(path)
+
+    def read(self, start_date: datetime, end_date: datetime, org_ids: List[int]) -> pd.DataFrame:
+        """Осмотры периода ($match пайплайнов) плоскими колонками FIELDS и READINGS."""
+
+        import pyarrow as pa
+
+        parts = []
+        for table in self.tables():
+            # сначала отфильтруем по дешевым полям, вложенные шаги разбираем только у подходящих
+            processed_at = to_datetime(column(table, FIELDS['processed_at']))
+            mask = ((processed_at >= start_date) & (processed_at < end_date)
+                    & column(table, FIELDS['is_test']).eq(False)
+                    & column(table, FIELDS['organization_id']).isin(org_ids)).to_numpy()
+            if not mask.any():
+                continue
+            table = table.filter(pa.array(mask))
+            df = pd.DataFrame({col: column(table, path) for col, path in FIELDS.items()})
+            for col, path in READINGS.items():
+                df[col] = reading(table, path)
+            parts.append(df)
+
+        columns = list(FIELDS) + list(READINGS)
+        df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=columns)
+        df['processed_at'] = to_datetime(df['processed_at'])
+        df['employee_birthday'] = DB.to_datetime(df['employee_birthday'])
+        return df
+
+    @staticmethod
+    def causes(df: pd.DataFrame, name: str) -> pd.DataFrame:
+        # как counters: недопуск (success строго false) с хотя бы одним замечанием категории
+        exploded = df['resolution_remarks'].explode()
+        failed = df['resolution_success'].eq(False).to_numpy()
+        res = pd.DataFrame(index=df.index)
+        for col, category in causes[name].items():
+            found = exploded.isin(remarks[category]).groupby(level=0).any().reindex(df.index, fill_value=False)
+            res[col] = (found.to_numpy() & failed).astype('int64')
+        return res
+
+    def sheet1(self, df: pd.DataFrame) -> pd.DataFrame:
+        columns = self.schema["sheet1"]
+        keys = [col for col, dtype in columns.items() if dtype not in ('int64', 'float64')]
+        # $cond по success - истинность значения: null и отсутствие - не допуск
+        success = df['resolution_success'].fillna(False).astype(bool).to_numpy()
+        buf = pd.concat([df[keys], self.causes(df, "sheet1")], axis=1)
+        buf['count_medics'] = 1
+        buf['count_success'] = success.astype('int64')
+        buf['count_not_success'] = (~success).astype('int64')
+        res = buf.groupby(keys, as_index=False, sort=False, dropna=False).sum()
+        return res.astype({col: 'int64' for col, dtype in columns.items() if dtype == 'int64'})[list(columns)]
+
+    def sheet2(self, df: pd.DataFrame) -> pd.DataFrame:
+        columns = self.schema["sheet2_percentile" if self.percentiles else "sheet2"]
+        keys = ['organization_id', *EMPLOYEE_KEY]
+        df = pd.concat([df, self.causes(df, "sheet2")], axis=1)
+        for col in READINGS:
+            df[f'sq_{col}'] = df[col] ** 2
+
+        # атрибуты сотрудника - из первого осмотра группы, как $first (включая пустые значения)
+        res = df.drop_duplicates(keys)[[col for col in columns if col in FIELDS]].reset_index(drop=True)
+        groups = df.groupby(keys, sort=False, dropna=False)
+        agg = groups.agg(
+            count_all=('organization_id', 'size'),
+            count_ad_pulse_cause=('count_ad_pulse_cause', 'sum'),
+            **{f'mean_{col}': (col, 'mean') for col in READINGS},
+            **{f'mean_sq_{col}': (f'sq_{col}', 'mean') for col in READINGS},
+        )
+        if self.percentiles:
+            for col, (value, p) in quantiles.items():
+                agg[col] = groups[value].quantile(p)
+        res = res.merge(agg.reset_index(), on=keys, how='left')
+        return res.astype({col: 'int64' for col, dtype in columns.items() if dtype == 'int64'})[list(columns)]
+
+    @staticmethod
+    def boundaries(df: pd.DataFrame) -> Dict[int, tuple]:
+        # как пайплайн boundary: последний по processedAt осмотр организации
+        last = df.sort_values('processed_at', kind='stable').drop_duplicates('organization_id', keep='last')
+        return {org_id: (origin, boundary) for org_id, origin, boundary
+                in zip(last['organization_id'], last['boundary_origin'], last['boundary'])}
+
+    def empty(self, name: str) -> pd.DataFrame:
+        # выгрузка без осмотров - как из пустого курсора DB, с типами схемы
+        return DB.to_csv(iter([]), self.schema[name])
+
+    def load(self, start_date: datetime, end_date: datetime, org_ids: List[int],
+             flagged: bool = False) -> Tuple[pd.DataFrame]:
+        # flagged не используется: статистики графиков считает отчет (box - None), ему нужны все сотрудники
+        df = self.read(start_date, end_date, org_ids)
+        df1 = self.sheet1(df) if len(df) else self.empty("sheet1")
+        df = df[df['type'].isin(SHEET2_TYPES)].reset_index(drop=True)
+        # у пустого периода колонки object, и quantile по ним падает
+        sheet2 = self.sheet2(df) if len(df) else self.empty("sheet2_percentile" if self.percentiles else "sheet2")
+        df2 = DB.attach_boundaries(sheet2, self.boundaries(df))
+        return DB.compact(df1, self.dtypes), DB.compact(df2, self.dtypes)
+
+    def box(self, start_date: datetime, end_date: datetime, org_ids: List[int]) -> pd.DataFrame:
+        # $percentile стадии box локально не выполняется, статистики считаются по sheet2 (charts.box_stats)
+        return None
+
+    def save(self, name: str, df: pd.DataFrame):
+        DB.write(self.snapshot_path, name, df)
+
+    def close_client(self):
+        pass
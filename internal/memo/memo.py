@@ -0,0 +1,84 @@
+from typing import Any
+import hashlib
+import inspect
+import threading
+import pickle
+import sys
+import os
+sys.path.append("./")
+
+import pandas as pd
+
+
+# значение, которого нет в кэше (None - допустимый результат этапа)
+MISSING = object()
+
+
+class Memo:
+
+    def __init__(self, path: str) -> None:
+        """Кэш результатов этапов отчета на диске, адресуемый по содержимому.
+
+        Результат этапа хранится под хэшем всего, от чего он зависит: входов (или ключей
+        предыдущих этапов), параметров и версии кода этапа. Изменился хоть один из них -
+        изменился ключ, и этап выполняется заново; иначе результат берется из кэша.
+        Упавший запуск при повторе продолжается с последнего сохраненного этапа.
+
+        Args:
+            path (str): Папка кэша.
+
+        Example:
+            memo = Memo("tmp/memo")
+            key = Memo.key(start_date, end_date, org_ids, Memo.version(prep))
+            if (df := memo.get("prep", key)) is MISSING:
+                df = memo.put("prep", key, prep(start_date, end_date, org_ids))
+        """
+
+        self.path = path
+        self.stats = {'hits': 0, 'misses': 0}
+
+    @staticmethod
+    def key(*parts) -> str:
+        """Хэш параметров: строки, числа, даты, списки и датафреймы (по содержимому)."""
+
+        digest = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, pd.DataFrame):
+                digest.update(repr((list(part.columns), [str(dtype) for dtype in part.dtypes])).encode())
+                digest.update(pd.util.hash_pandas_object(part, index=False).to_numpy().tobytes())
+            elif isinstance(part, bytes):
+                digest.update(hashlib.sha256(part).digest())
+            else:
+                digest.update(repr(part).encode())
+            # разделитель, чтобы ('ab', 'c') и ('a', 'bc') давали разные ключи
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    @staticmethod
+    def version(*objects) -> str:
+        """Версия кода этапа: хэш исходников функций, классов и модулей, от которых он зависит."""
+
+        return Memo.key(*[inspect.getsource(obj) for obj in objects])
+
+    def file(self, stage: str, key: str) -> str:
+        return os.path.join(self.path, stage, f"{key}.pickle")
+
+    def get(self, stage: str, key: str) -> Any:
+        path = self.file(stage, key)
+        if not os.path.exists(path):
+            self.stats['misses'] += 1
+            return MISSING
+        with open(path, 'rb') as f:
+            value = pickle.load(f)
+        self.stats['hits'] += 1
+        return value
+
+    def put(self, stage: str, key: str, value: Any) -> Any:
+        # через временный файл: оборванная запись не должна стать "готовым" результатом этапа
+        path = self.file(stage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        return value
@@ -0,0 +1,128 @@
+from typing import Callable, Dict, List
+from contextlib import contextmanager
+import cProfile
+import tracemalloc
+import json
+import time
+import sys
+import os
+sys.path.append("./")
+
+
+MB = 1024 * 1024
+
+
+def measure(fn: Callable, *args) -> dict:
+    """Выполняет функцию в процессе пула и возвращает время и пик памяти этого процесса.
+
+    Args:
+        fn (Callable): Функция.
+        *args: Аргументы функции.
+
+    Returns:
+        dict: seconds и peak_mb, а в result - то, что вернула функция.
+    """
+
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    try:
+        result = fn(*args)
+    finally:
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        if not tracing:
+            tracemalloc.stop()
+    return {'seconds': round(seconds, 4), 'peak_mb': round(peak / MB, 2), 'result': result}
+
+
+class Profiler:
+
+    def __init__(self, path: str = None, cprofile_path: str = None) -> None:
+        """Замеры по этапам формирования отчета: время, строки на входе и выходе, пик памяти.
+
+        Если ни один путь не указан, профилировщик выключен и stage ничего не делает.
+        Пик памяти считается через tracemalloc и включает вложенные этапы; при параллельных
+        заданиях в одном процессе (run_batch) память этапов смешивается.
+
+        Args:
+            path (str, optional): Путь до json с замерами.
+            cprofile_path (str, optional): Путь до дампа cProfile (pstats).
+        """
+
+        self.path = path
+        self.cprofile_path = cprofile_path
+        self.enabled = path is not None or cprofile_path is not None
+        self.stages: List[dict] = []
+        self.stack: List[dict] = []
+        self.cprofile = None
+
+    def start(self):
+        if not self.enabled:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.cprofile_path is not None and self.cprofile is None:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    @contextmanager
+    def stage(self, name: str, rows_in: int = None):
+        """Замеряет этап. В выданный словарь можно записать rows_out и другие поля.
+
+        Example:
+            with profiler.stage('sheet2_prep', rows_in=len(df)) as record:
+                buf = prep(df)
+                record['rows_out'] = len(buf)
+        """
+
+        if not self.enabled:
+            yield {}
+            return
+
+        self.start()
+        current, peak = tracemalloc.get_traced_memory()
+        if self.stack:
+            self.stack[-1]['_peak'] = max(self.stack[-1]['_peak'], peak)
+        tracemalloc.reset_peak()
+        record = {'stage': name, 'rows_in': rows_in, 'rows_out': None, '_start': current, '_peak': current}
+        self.stack.append(record)
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = round(time.perf_counter() - started, 4)
+            peak = max(record.pop('_peak'), tracemalloc.get_traced_memory()[1])
+            record['peak_mb'] = round((peak - record.pop('_start')) / MB, 2)
+            self.stack.pop()
+            if self.stack:
+                self.stack[-1]['_peak'] = max(self.stack[-1]['_peak'], peak)
+            self.stages.append(record)
+
+    def record(self, name: str, **fields):
+        """Добавляет замер, сделанный вне процесса (например, measure в пуле)."""
+
+        if self.enabled:
+            self.stages.append({'stage': name, **fields})
+
+    def report(self) -> Dict[str, list]:
+        return {'stages': self.stages}
+
+    def dump(self):
+        """Сохраняет json с замерами и дамп cProfile и останавливает профилирование."""
+
+        if not self.enabled:
+            return
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            os.makedirs(os.path.dirname(self.cprofile_path) or ".", exist_ok=True)
+            self.cprofile.dump_stats(self.cprofile_path)
+            self.cprofile = None
+        if self.path is not None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, 'w') as f:
+                json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
@@ -0,0 +1,201 @@
+from typing import Dict, List, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+import asyncio
+import argparse
+import hashlib
+import shutil
+import json
+import time
+import sys
+import os
+sys.path.append("./")
+
+from internal.charts.charts import Renderer
+from internal.db.db import DB
+from report import Gemodynamics
+
+
+# ключ отчета: (начало, конец, отсортированные id организаций)
+Key = Tuple[datetime, datetime, Tuple[int, ...]]
+
+
+class ReportService:
+
+    def __init__(self,
+                 connection_string: str = None,
+                 max_pool_size: int = 16,
+                 jobs: int = 4,
+                 workers: int = None,
+                 cache_path: str = "service",
+                 cache_size: int = 64,
+                 ttl: float = 600,
+                 **kwargs) -> None:
+        """Долгоживущий сервис отчетов поверх Gemodynamics.
+
+        Держит общий пул подключений к mongo и прогретый рендерер графиков. Одинаковые запросы,
+        пришедшие, пока отчет строится, ждут один и тот же запуск. Готовые отчеты кэшируются:
+        не больше cache_size отчетов (LRU), а отчеты за период, который еще не закончился,
+        живут не дольше ttl секунд.
+
+        Args:
+            connection_string (str, optional): Строка подключения к mongo.
+            max_pool_size (int, optional): Размер пула подключений.
+            jobs (int, optional): Количество одновременно строящихся отчетов.
+            workers (int, optional): Количество процессов рендеринга и сохранения.
+            cache_path (str, optional): Папка для отчетов, графиков и снимков.
+            cache_size (int, optional): Сколько готовых отчетов хранить.
+            ttl (float, optional): Время жизни отчета за незакончившийся период, в секундах.
+            **kwargs: Остальные параметры Gemodynamics (store_path, box и т.д.).
+        """
+
+        self.client = DB.pool(connection_string, max_pool_size)
+        # кэш png рядом с отчетами сервиса, а не в images/cache рабочей папки
+        self.renderer = Renderer(workers, cache_dir=os.path.join(cache_path, "images", "cache"))
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=max(1, min(jobs, max_pool_size)))
+        self.cache_path = cache_path
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.kwargs = kwargs
+        self.cache: "OrderedDict[Key, Tuple[float, List[str]]]" = OrderedDict()
+        self.inflight: Dict[Key, asyncio.Future] = {}
+        self.stats = {'hits': 0, 'coalesced': 0, 'runs': 0, 'errors': 0}
+
+    @staticmethod
+    def key(start_date: datetime, end_date: datetime, org_ids: List[int]) -> Key:
+        return start_date, end_date, tuple(sorted(set(org_ids)))
+
+    def folder(self, key: Key) -> str:
+        digest = hashlib.sha256(repr(key).encode()).hexdigest()[:16]
+        return os.path.join(self.cache_path, digest)
+
+    def fresh(self, key: Key) -> bool:
+        # даты периода - UTC без часового пояса, как в mongo; период, закончившийся до построения
+        # отчета, больше не меняется, остальные живут ttl
+        created, _ = self.cache[key]
+        return key[1] <= datetime.utcfromtimestamp(created) or time.time() - created < self.ttl
+
+    def evict(self, key: Key):
+        self.cache.pop(key, None)
+        shutil.rmtree(self.folder(key), ignore_errors=True)
+
+    def build(self, key: Key) -> List[str]:
+        # отчет строится в потоке пула, у каждого ключа своя папка
+        start_date, end_date, org_ids = key
+        folder = self.folder(key)
+        shutil.rmtree(folder, ignore_errors=True)
+        Gemodynamics(start_date, end_date, list(org_ids), f"{folder}/results", workers=self.workers,
+                     client=self.client, renderer=self.renderer, images_path=f"{folder}/images",
+                     snapshot_path=f"{folder}/tmp", **self.kwargs).run()
+        results = f"{folder}/results"
+        return sorted(os.path.join(results, name) for name in os.listdir(results)) if os.path.isdir(results) else []
+
+    async def report(self, start_date: datetime, end_date: datetime, org_ids: List[int]) -> Tuple[List[str], bool]:
+        """Возвращает пути до готовых отчетов и признак того, что они взяты из кэша.
+
+        Args:
+            start_date (datetime): Дата начала выгрузки осмотров.
+            end_date (datetime): Дата конца выгрузки осмотров (не входит в интервал).
+            org_ids (List[int]): Список id организаций.
+
+        Returns:
+            Tuple[List[str], bool]: Пути до отчетов и признак попадания в кэш.
+        """
+
+        key = self.key(start_date, end_date, org_ids)
+        if key in self.cache:
+            if self.fresh(key):
+                self.cache.move_to_end(key)
+                self.stats['hits'] += 1
+                return self.cache[key][1], True
+            self.evict(key)
+
+        # тот же отчет уже строится - ждем его, а не запускаем второй раз
+        if key in self.inflight:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(self.inflight[key]), False
+
+        future = asyncio.get_running_loop().run_in_executor(self.executor, self.build, key)
+        self.inflight[key] = future
+        self.stats['runs'] += 1
+        try:
+            paths = await asyncio.shield(future)
+        except Exception:
+            self.stats['errors'] += 1
+            raise
+        finally:
+            self.inflight.pop(key, None)
+
+        self.cache[key] = (time.time(), paths)
+        while len(self.cache) > self.cache_size:
+            self.evict(next(iter(self.cache)))
+        return paths, False
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """HTTP: GET /report?start=2023-10-01&end=2023-11-01&orgs=1328,2211 и GET /stats."""
+
+        try:
+            request = (await reader.readline()).decode('latin-1').split()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            url = urlsplit(request[1] if len(request) > 1 else '/')
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+            if url.path == '/stats':
+                status, body = 200, {**self.stats, 'cached': len(self.cache), 'inflight': len(self.inflight)}
+            elif url.path == '/report':
+                try:
+                    start_date = datetime.fromisoformat(query['start'])
+                    end_date = datetime.fromisoformat(query['end'])
+                    org_ids = [int(x) for x in query['orgs'].split(',') if x]
+                except (KeyError, ValueError) as exc:
+                    status, body = 400, {'error': f"bad request: {exc!r}"}
+                else:
+                    try:
+                        paths, cached = await self.report(start_date, end_date, org_ids)
+                        status, body = 200, {'files': paths, 'cached': cached}
+                    except Exception as exc:
+                        status, body = 500, {'error': repr(exc)}
+            else:
+                status, body = 404, {'error': 'not found'}
+
+            data = json.dumps(body, ensure_ascii=False).encode()
+            writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                         f"Content-Type: application/json; charset=utf-8\r\n"
+                         f"Content-Length: {len(data)}\r\n"
+                         f"Connection: close\r\n\r\n".encode() + data)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8080):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown()
+        self.renderer.close()
+        self.client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--connection-string", default=None)
+    parser.add_argument("--jobs", type=int, default=4, help="одновременно строящихся отчетов")
+    parser.add_argument("--cache-size", type=int, default=64)
+    parser.add_argument("--ttl", type=float, default=600, help="жизнь отчета за незакончившийся период, с")
+    parser.add_argument("--store-path", default=None)
+    args = parser.parse_args()
+
+    service = ReportService(args.connection_string, jobs=args.jobs, cache_size=args.cache_size,
+                            ttl=args.ttl, store_path=args.store_path)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    finally:
+        service.close()
@@ -0,0 +1,46 @@
+from typing import List, Tuple
+from datetime import datetime
+import sys
+import os
+sys.path.append("./")
+
+import pandas as pd
+
+from internal.db.db import DB
+
+
+class Snapshot:
+
+    def __init__(self, path: str) -> None:
+        """Источник выгрузок из снимка прошлого запуска (DB.save): отчет строится без обращения к mongo.
+
+        Снимок хранит уже готовые выгрузки, поэтому период и организации не выбирают данные,
+        а оставляются такими, какими был снят снимок.
+
+        Args:
+            path (str): Папка снимка (snapshot_path прошлого запуска).
+
+        Example:
+            Gemodynamics(datetime(2023, 10, 1), datetime(2023, 11, 1), [], "results", backend=Snapshot("tmp")).run()
+        """
+
+        self.path = path
+
+    @property
+    def boxed(self) -> bool:
+        # статистики графиков посчитал сервер, а sheet2 в снимке - только сотрудники с типом гемодинамики
+        return os.path.exists(f"{self.path}/box/box.parquet")
+
+    def load(self, start_date: datetime, end_date: datetime, org_ids: List[int],
+             flagged: bool = False) -> Tuple[pd.DataFrame]:
+        return DB.read(self.path, 'sheet11'), DB.read(self.path, 'sheet2')
+
+    def box(self, start_date: datetime, end_date: datetime, org_ids: List[int]) -> pd.DataFrame:
+        return DB.read(self.path, 'box') if self.boxed else None
+
+    def save(self, name: str, df: pd.DataFrame):
+        # снимок уже на диске
+        pass
+
+    def close_client(self):
+        pass
@@ -0,0 +1,87 @@
+from typing import Tuple, List
+import sqlite3
+import sys
+import os
+sys.path.append("./")
+
+import pandas as pd
+
+
+class Store:
+
+    def __init__(self, path: str = "tmp/store/store.sqlite") -> None:
+        """Локальное хранилище дневных частичных агрегатов по организациям.
+
+        Для каждой таблицы агрегатов хранится покрытие - пары (организация, день),
+        которые уже выгружены из mongo и больше не меняются.
+
+        Args:
+            path (str): Путь до файла базы sqlite.
+        """
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        # запись из параллельных заданий пакетного режима ждет снятия блокировки, а не падает
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=60)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS coverage (
+                name TEXT,
+                organization_id INTEGER,
+                day TEXT,
+                PRIMARY KEY (name, organization_id, day)
+            )""")
+
+    def exists(self, name: str) -> bool:
+        row = self.conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone()
+        return row is not None
+
+    def missing(self, name: str, days: List[str], org_ids: List[int]) -> List[Tuple[List[str], List[int]]]:
+        """Возвращает дни и организации, для которых в хранилище нет агрегатов.
+
+        Args:
+            name (str): Название таблицы агрегатов.
+            days (List[str]): Дни в формате YYYY-MM-DD.
+            org_ids (List[int]): Список id организаций.
+
+        Returns:
+            List[Tuple[List[str], List[int]]]: Группы организаций с одинаковым набором недостающих дней.
+        """
+
+        if not days or not org_ids:
+            return []
+        covered = set(self.conn.execute(
+            "SELECT organization_id, day FROM coverage WHERE name=? AND day>=? AND day<=?",
+            (name, days[0], days[-1])).fetchall())
+        groups = {}
+        for org_id in org_ids:
+            lack = tuple(d for d in days if (org_id, d) not in covered)
+            if lack:
+                groups.setdefault(lack, []).append(org_id)
+        return [(list(lack), orgs) for lack, orgs in groups.items()]
+
+    def put(self, name: str, df: pd.DataFrame, days: List[str], org_ids: List[int]):
+        """Сохраняет агрегаты и отмечает пары (организация, день) как выгруженные.
+
+        Прежние агрегаты по этим парам удаляются, так что повторная запись не задваивает данные.
+        """
+
+        pairs = [(o, d) for o in org_ids for d in days]
+        with self.conn:
+            if self.exists(name):
+                self.conn.executemany(f'DELETE FROM "{name}" WHERE organization_id=? AND day=?', pairs)
+            df.to_sql(name, self.conn, if_exists='append', index=False)
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}_org_day" ON "{name}" (organization_id, day)')
+            self.conn.executemany("INSERT OR REPLACE INTO coverage VALUES (?, ?, ?)", [(name, o, d) for o, d in pairs])
+
+    def get(self, name: str, days: List[str], org_ids: List[int]) -> pd.DataFrame:
+        """Читает агрегаты за непрерывный диапазон дней по организациям."""
+
+        if not days or not org_ids or not self.exists(name):
+            return pd.DataFrame()
+        placeholders = ", ".join("?" * len(org_ids))
+        return pd.read_sql(
+            f'SELECT * FROM "{name}" WHERE day>=? AND day<=? AND organization_id IN ({placeholders})',
+            self.conn, params=[days[0], days[-1], *org_ids])
+
+    def close(self):
+        self.conn.close()
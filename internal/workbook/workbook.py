@@ -0,0 +1,140 @@
+from typing import Dict, List, Union
+import io
+import sys
+sys.path.append("./")
+
+import pandas as pd
+import numpy as np
+import xlsxwriter
+
+
+# раскраска колонки с недопусками: (верхняя граница доли, цвет), выше последней границы - красный
+COLORS = [(0.25, 'green'), (0.35, 'yellow')]
+DEFAULT_COLOR = 'red'
+
+# доли хранятся числами и показываются в процентах форматом ячейки
+PERCENT_FORMAT = '0.00%'
+PERCENT_COLUMNS = ['Доля недопусков по АД и ЧСС']
+
+# колонка с недопусками на первой странице
+NOT_SUCCESS_COLUMN = 'Недопуск (включая тех.сбои) %'
+
+# строки первой страницы под таблицами и позиции графиков на второй
+NOTES = ["Рекомендуемый период составляет 1 месяц",
+         "если меньше - данные теряют точность, если больше данные теряют актуальность"]
+IMAGE_ROWS = [1, 38, 74]
+IMAGE_COL = 14
+
+
+def widths(df: pd.DataFrame) -> np.ndarray:
+    """Ширина колонок по самому длинному значению или заголовку.
+
+    Args:
+        df (pd.DataFrame): Данные страницы.
+
+    Returns:
+        np.ndarray: Ширина каждой колонки.
+    """
+
+    res = np.zeros(len(df.columns), dtype=int)
+    for idx, col in enumerate(df.columns):
+        values = df[col].astype(str).str.len().max() if len(df) else 0
+        res[idx] = max(values, len(str(col))) + 1
+    return res
+
+
+def percent_columns(df: pd.DataFrame) -> List[int]:
+    """Номера колонок с долями: с суффиксом '%' или из PERCENT_COLUMNS."""
+
+    return [idx for idx, col in enumerate(df.columns) if str(col).endswith('%') or col in PERCENT_COLUMNS]
+
+
+def highlight(worksheet, df: pd.DataFrame, startrow: int, palette: dict):
+    """Раскрашивает колонку недопусков условным форматированием вместо формата на каждую ячейку."""
+
+    if not len(df):
+        return
+    col = df.columns.get_loc(NOT_SUCCESS_COLUMN)
+    first, last = startrow + 1, startrow + len(df)
+    for bound, color in COLORS:
+        worksheet.conditional_format(first, col, last, col, {
+            'type': 'cell', 'criteria': '<', 'value': bound, 'format': palette[color], 'stop_if_true': True})
+    worksheet.conditional_format(first, col, last, col, {
+        'type': 'cell', 'criteria': '>=', 'value': COLORS[-1][0], 'format': palette[DEFAULT_COLOR]})
+
+
+def write_frame(worksheet, df: pd.DataFrame, startrow: int, header_format, column_formats: Dict[int, object] = None):
+    """Пишет датафрейм построчно, как того требует режим constant_memory.
+
+    Args:
+        worksheet: Лист xlsxwriter.
+        df (pd.DataFrame): Данные.
+        startrow (int): Строка заголовка.
+        header_format: Формат заголовка.
+        column_formats (Dict[int, object], optional): Номер колонки -> формат ее ячеек.
+    """
+
+    column_formats = column_formats or {}
+    worksheet.write_row(startrow, 0, list(df.columns), header_format)
+    rows = df.astype(object).where(df.notna(), None).to_numpy().tolist()
+    for i, row in enumerate(rows):
+        worksheet.write_row(startrow + 1 + i, 0, row)
+        for col, cell_format in column_formats.items():
+            worksheet.write(startrow + 1 + i, col, row[col], cell_format)
+
+
+def write_workbook(path: str, buf1: pd.DataFrame, buf11: pd.DataFrame, buf2: pd.DataFrame,
+                   images: List[Union[str, bytes]]) -> bytes:
+    """Формирует и сохраняет отчет по одной организации.
+
+    Книга пишется в режиме constant_memory: строки сбрасываются на диск по мере записи,
+    поэтому память не зависит от размера организации. Доли пишутся числами с процентным форматом.
+    Без пути книга собирается в памяти (in_memory, временные файлы не создаются) и возвращается байтами.
+
+    Args:
+        path (str): Путь до файла отчета. Если None, книга не сохраняется на диск.
+        buf1 (pd.DataFrame): Данные для первой части первой страницы.
+        buf11 (pd.DataFrame): Данные для второй части первой страницы.
+        buf2 (pd.DataFrame): Данные для второй страницы.
+        images (List[Union[str, bytes]]): Графики для второй страницы: пути до png или сами png.
+
+    Returns:
+        bytes: Содержимое книги, если path не указан, иначе None.
+    """
+
+    output = io.BytesIO() if path is None else None
+    workbook = xlsxwriter.Workbook(output or path, {'in_memory': True} if path is None else {'constant_memory': True})
+
+    # форматы создаются один раз на книгу
+    header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    percent_format = workbook.add_format({'num_format': PERCENT_FORMAT})
+    palette = {color: workbook.add_format({'bg_color': color}) for color in [c for _, c in COLORS] + [DEFAULT_COLOR]}
+
+    # первая страница: две таблицы с раскрашенной колонкой недопусков и рекомендации под ними
+    worksheet = workbook.add_worksheet("Лист1")
+    for buf, startrow in [(buf1, 0), (buf11, len(buf1) + 1)]:
+        write_frame(worksheet, buf, startrow, header_format, dict.fromkeys(percent_columns(buf), percent_format))
+        highlight(worksheet, buf, startrow, palette)
+    for i, note in enumerate(NOTES):
+        worksheet.write_string(len(buf1) + len(buf11) + 3 + i, 0, note)
+
+    # отнормируем ширину колонок по обеим таблицам
+    width1, width11 = widths(buf1), widths(buf11)
+    size = max(len(width1), len(width11))
+    width = np.maximum(np.pad(width1, (0, size - len(width1))), np.pad(width11, (0, size - len(width11))))
+    for idx, value in enumerate(width):
+        worksheet.set_column(idx, idx, int(value))
+
+    # вторая страница с графиками
+    worksheet = workbook.add_worksheet("Лист2")
+    write_frame(worksheet, buf2, 0, header_format, dict.fromkeys(percent_columns(buf2), percent_format))
+    for idx, value in enumerate(widths(buf2)):
+        worksheet.set_column(idx, idx, int(value))
+    for idx, (row, image) in enumerate(zip(IMAGE_ROWS, images)):
+        if isinstance(image, bytes):
+            worksheet.insert_image(row, IMAGE_COL, f"image{idx + 1}.png", {'image_data': io.BytesIO(image)})
+        else:
+            worksheet.insert_image(row, IMAGE_COL, image)
+
+    workbook.close()
+    return output.getvalue() if output is not None else None
@@ -1,5 +1,368 @@
+import copy
 import datetime
-from typing import List
+from typing import List, Dict
+
+from internal.hemodynamics.hemodynamics import OBSERVATION_BLOCKS, HEMODYNAMIC_TYPES
+
+
+# реестр категорий замечаний осмотра: категория -> коды замечаний
+remarks = {
+    'med': ['pulse', 'pressure', 'temperature', 'complaints', 'complains', 'skin', 'injury', 'alcohol',
+            'reactions', 'inebriation', 'odd_behavior'],
+    'adm': ['alco_out_of_sight', 'tono_out_of_sight', 'alco_rules', 'tono_rules', 'temperature_rules',
+            'out_of_sight', 'wrong_order', 'clothes', 'mask_gloves', 'high_illumination', 'low_illumination',
+            'wrong_person', 'strangers', 'extra_stuff', 'food', 'bandage', 'illegal_drugs_intake'],
+    'tech': ['no_video', 'outdated', 'not_all_steps', 'device_malfunction', 'no_photo', 'incorrect_video'],
+    'cancel': ['cancel'],
+    'ad': ['pressure'],
+    'pulse': ['pulse'],
+    'ad_pulse': ['pressure', 'pulse'],
+}
+
+# счетчики недопусков по категориям замечаний: колонка -> категория
+causes = {
+    "sheet1": {
+        'count_med_cause': 'med',
+        'count_adm_cause': 'adm',
+        'count_tech_cause': 'tech',
+        'count_cancel_cause': 'cancel',
+        'count_ad': 'ad',
+        'count_pulse': 'pulse',
+    },
+    "sheet2": {
+        'count_ad_pulse_cause': 'ad_pulse',
+    },
+}
+
+
+def has_remark(category: str) -> dict:
+    """Выражение mongo: есть ли у осмотра хотя бы одно замечание из категории."""
+
+    return {'$gt': [{'$size': {'$setIntersection': [{'$ifNull': ['$resolution_remarks', []]}, remarks[category]]}}, 0]}
+
+
+def counters(name: str) -> dict:
+    """Аккумуляторы $group, считающие недопуски по категориям замечаний."""
+
+    return {
+        col: {'$sum': {"$cond": [{'$and': [has_remark(category), {'$eq': ['$resolution_success', False]}]}, 1, 0]}}
+        for col, category in causes[name].items()
+    }
+
+
+def count_causes(name: str, resolution_remarks: List[str], resolution_success: bool) -> Dict[str, int]:
+    """То же, что counters, для одного осмотра на стороне python.
+
+    Args:
+        name (str): Название пайплайна.
+        resolution_remarks (List[str]): Замечания осмотра.
+        resolution_success (bool): Итог осмотра.
+
+    Returns:
+        Dict[str, int]: Колонка счетчика -> 0 или 1.
+    """
+
+    found = set(resolution_remarks or [])
+    return {
+        col: int(resolution_success is False and not found.isdisjoint(remarks[category]))
+        for col, category in causes[name].items()
+    }
+
+
+# рекомендуемые составные индексы под $match пайплайнов: сначала поля равенства, затем диапазон дат
+indexes = {
+    "organization_isTest_processedAt": [('organization.id', 1), ('isTest', 1), ('timestamps.processedAt', 1)],
+    "organization_isTest_type_processedAt": [('organization.id', 1), ('isTest', 1), ('type', 1), ('timestamps.processedAt', 1)],
+}
+
+# схема выходных документов пайплайнов: колонка -> тип
+# object и json - ключи группировки (json - вложенные документы), int64 - счетчики, float64 - средние
+schema = {
+    "sheet1": {
+        'organization_name': 'object',
+        'organization_id': 'object',
+        'organization_inn': 'object',
+        'host_release_point': 'object',
+        'count_medics': 'int64',
+        'count_success': 'int64',
+        'count_not_success': 'int64',
+        'count_med_cause': 'int64',
+        'count_adm_cause': 'int64',
+        'count_tech_cause': 'int64',
+        'count_cancel_cause': 'int64',
+        'count_ad': 'int64',
+        'count_pulse': 'int64',
+    },
+    "sheet2": {
+        'organization_name': 'object',
+        'organization_id': 'object',
+        'organization_inn': 'object',
+        'employee_name': 'object',
+        'employee_surname': 'object',
+        'employee_patronymic': 'object',
+        'employee_birthday': 'datetime64[ns]',
+        'employee_number': 'object',
+        'count_all': 'int64',
+        'count_ad_pulse_cause': 'int64',
+        'mean_sad': 'float64',
+        'mean_dad': 'float64',
+        'mean_pulse': 'float64',
+        'mean_sq_sad': 'float64',
+        'mean_sq_dad': 'float64',
+        'mean_sq_pulse': 'float64',
+    },
+}
+
+# сотрудник в пределах организации: те же поля, по которым его различал исходный пайплайн sheet2
+EMPLOYEE_KEY = ['employee_number', 'employee_birthday', 'employee_surname', 'employee_name', 'employee_patronymic']
+
+# типы колонок выгрузок в памяти: повторяющиеся строки - category, счетчики - int32.
+# Средние и границы остаются float64: во float32 они попадают в Лист2 с шумом (132.2200012207031)
+# и сдвигают классификацию у самых границ
+compact = {
+    **{col: 'category' for col in ['organization_name', 'organization_inn', 'host_release_point', 'boundary_origin',
+                                   'employee_name', 'employee_surname', 'employee_patronymic']},
+    **{col: 'int32' for columns in schema.values() for col, dtype in columns.items() if dtype == 'int64'},
+}
+
+
+def daily_schema(columns: dict, by_day: bool = True) -> dict:
+    """Схема дневных частичных агрегатов: средние хранятся как сумма и количество."""
+
+    res = {}
+    for col, dtype in columns.items():
+        if dtype == 'float64':
+            res[f'{col}_sum'] = 'float64'
+            res[f'{col}_count'] = 'int64'
+        else:
+            res[col] = dtype
+    if by_day:
+        res['day'] = 'object'
+    return res
+
+
+def daily(pipe: List[dict], by_day: bool = True) -> List[dict]:
+    """Превращает пайплайн в пайплайн дневных частичных агрегатов.
+
+    К ключу группировки добавляется день осмотра, а каждое $avg заменяется
+    на пару сумма и количество, чтобы частичные агрегаты можно было складывать.
+    Без by_day день в ключ не добавляется: так считаются частичные агрегаты шардов (DB.load_sharded).
+    """
+
+    pipe = copy.deepcopy(pipe)
+    project = next(stage['$project'] for stage in pipe if '$project' in stage)
+    group = next(stage['$group'] for stage in pipe if '$group' in stage)
+    final = pipe[-1]['$project']
+
+    if by_day:
+        project['day'] = {'$dateToString': {'format': '%Y-%m-%d', 'date': '$timestamps.processedAt'}}
+        group['_id']['day'] = '$day'
+
+    averages = {}
+    for acc, expr in list(group.items()):
+        if isinstance(expr, dict) and '$avg' in expr:
+            del group[acc]
+            group[f'{acc}_sum'] = {'$sum': expr['$avg']}
+            group[f'{acc}_count'] = {'$sum': {'$cond': [{'$isNumber': expr['$avg']}, 1, 0]}}
+            averages[f'${acc}'] = acc
+
+    columns = {}
+    for col, expr in final.items():
+        if expr in averages:
+            columns[f'{col}_sum'] = f'{expr}_sum'
+            columns[f'{col}_count'] = f'{expr}_count'
+        else:
+            columns[col] = expr
+    if by_day:
+        columns['day'] = '$_id.day'
+    pipe[-1]['$project'] = columns
+    return pipe
+
+
+# предел размера ответа $facet с запасом до ограничения mongo в 16MB на документ
+facet_limit = 12 * 1024 * 1024
+
+
+def facet(pipe1: List[dict], pipe2: List[dict]) -> List[dict]:
+    """Объединяет пайплайны обеих страниц в один проход по коллекции.
+
+    Общий $match первого пайплайна выполняется один раз, а условия, которыми $match
+    второго пайплайна отличается от него, переносятся внутрь ветки $facet.
+    Если ответ приближается к facet_limit, ветки возвращаются пустыми с флагом too_large.
+    """
+
+    match1, match2 = pipe1[0]['$match'], pipe2[0]['$match']
+    extra = {key: value for key, value in match2.items() if match1.get(key) != value}
+    return [
+        pipe1[0],
+        {'$facet': {
+            'sheet1': pipe1[1:],
+            'sheet2': [{'$match': extra}] + pipe2[1:],
+        }},
+        {'$addFields': {'too_large': {'$gte': [{'$bsonSize': '$$ROOT'}, facet_limit]}}},
+        {'$project': {
+            'too_large': 1,
+            'sheet1': {'$cond': ['$too_large', [], '$sheet1']},
+            'sheet2': {'$cond': ['$too_large', [], '$sheet2']},
+        }},
+    ]
+
+
+schema.update({f'{name}_daily': daily_schema(columns) for name, columns in list(schema.items())})
+schema.update({f'{name}_partial': daily_schema(schema[name], by_day=False) for name in ["sheet1", "sheet2"]})
+
+# приближенные перцентили показателей сотрудника (mongo 7.0+): колонка -> (показатель, p)
+quantiles = {
+    'median_sad': ('sad', 0.5),
+    'p90_sad': ('sad', 0.9),
+    'median_dad': ('dad', 0.5),
+    'p90_dad': ('dad', 0.9),
+    'median_pulse': ('pulse', 0.5),
+    'p90_pulse': ('pulse', 0.9),
+}
+
+schema["sheet2_percentile"] = {**schema["sheet2"], **{col: 'float64' for col in quantiles}}
+
+
+def percentiles(pipe: List[dict]) -> List[dict]:
+    """Добавляет в пайплайн sheet2 приближенные перцентили показателей сотрудника.
+
+    $percentile с method 'approximate' считается на сервере в ограниченной памяти
+    при любом числе осмотров. По дням такие перцентили не складываются,
+    поэтому в хранилище дневных агрегатов их нет.
+    """
+
+    pipe = copy.deepcopy(pipe)
+    group = next(stage['$group'] for stage in pipe if '$group' in stage)
+    final = pipe[-1]['$project']
+
+    values = {}
+    for col, (value, p) in quantiles.items():
+        values.setdefault(value, []).append(p)
+    for value, ps in values.items():
+        group[f'pct_{value}'] = {'$percentile': {'input': f'${value}', 'p': ps, 'method': 'approximate'}}
+    for col, (value, p) in quantiles.items():
+        final[col] = {'$arrayElemAt': [f'$pct_{value}', values[value].index(p)]}
+    return pipe
+
+
+
+# статистики 'Ящика с усами' по организации и блоку наблюдений, выбросы - списком
+schema["box"] = {
+    'chart': 'object',
+    'organization_name': 'object',
+    'block': 'object',
+    'q1': 'float64',
+    'median': 'float64',
+    'q3': 'float64',
+    'lowerfence': 'float64',
+    'upperfence': 'float64',
+    'outliers': 'json',
+}
+
+# графики 'Ящик с усами': имя графика из CHARTS -> (блок наблюдений, среднее сотрудника)
+boxes = {
+    'fig1': ('Блок наблюдений по АД', 'mean_sad'),
+    'fig2': ('Блок наблюдений по АД', 'mean_dad'),
+    'fig3': ('Блок наблюдений по ЧСС', 'mean_pulse'),
+}
+
+operators = {'<': '$lt', '<=': '$lte', '>': '$gt', '>=': '$gte'}
+
+
+def switch(choices: list, default: str) -> dict:
+    """Выражение mongo $switch по таблице правил из internal.hemodynamics.
+
+    Пустое среднее не попадает ни под одно правило, как и NaN в select.
+    """
+
+    return {'$switch': {
+        'branches': [
+            {'case': {'$or': [
+                {'$and': [{'$isNumber': f'${col}'}, {operators[op]: [f'${col}', threshold]}]}
+                for col, op, threshold in rules
+            ]}, 'then': value}
+            for value, rules in choices
+        ],
+        'default': default,
+    }}
+
+
+def box(pipe2: List[dict]) -> List[dict]:
+    """Пайплайн статистик 'Ящика с усами' на стороне сервера.
+
+    Средние сотрудников считаются так же, как в sheet2, сотрудники раскладываются по блокам
+    наблюдений, а по каждой организации и блоку возвращаются квартили ($percentile, mongo 7.0+),
+    усы по правилу 1.5 IQR и только выбросы вместо всех точек.
+    """
+
+    blocks = sorted({block for block, _ in boxes.values()})
+    q1, median, q3 = ({'$arrayElemAt': ['$q', i]} for i in range(3))
+    inside = {'$and': [{'$gte': ['$$this', '$lower']}, {'$lte': ['$$this', '$upper']}]}
+    branches = {}
+    for chart, (block, mean) in boxes.items():
+        branches[chart] = [
+            {'$match': {mean: {'$type': 'number'}}},
+            {'$group': {
+                '_id': {'organization_name': '$organization_name', 'block': f'${block}'},
+                'q': {'$percentile': {'input': f'${mean}', 'p': [0.25, 0.5, 0.75], 'method': 'approximate'}},
+                'values': {'$push': f'${mean}'},
+            }},
+            {'$addFields': {
+                'lower': {'$subtract': [q1, {'$multiply': [1.5, {'$subtract': [q3, q1]}]}]},
+                'upper': {'$add': [q3, {'$multiply': [1.5, {'$subtract': [q3, q1]}]}]},
+            }},
+            {'$project': {
+                '_id': 0,
+                'chart': {'$literal': chart},
+                'organization_name': '$_id.organization_name',
+                'block': '$_id.block',
+                'q1': q1,
+                'median': median,
+                'q3': q3,
+                'lowerfence': {'$min': {'$filter': {'input': '$values', 'cond': inside}}},
+                'upperfence': {'$max': {'$filter': {'input': '$values', 'cond': inside}}},
+                'outliers': {'$filter': {'input': '$values', 'cond': {'$not': [inside]}}},
+            }},
+        ]
+    return [
+        pipe2[0],
+        pipe2[1],
+        {'$group': {
+            '_id': {'organization_id': '$organization_id', **{col: f'${col}' for col in EMPLOYEE_KEY}},
+            'organization_name': {'$first': '$organization_name'},
+            'mean_sad': {'$avg': '$sad'},
+            'mean_dad': {'$avg': '$dad'},
+            'mean_pulse': {'$avg': '$pulse'},
+        }},
+        {'$addFields': {block: switch(*OBSERVATION_BLOCKS[block]) for block in blocks}},
+        {'$facet': branches},
+        {'$project': {'rows': {'$concatArrays': [f'${chart}' for chart in branches]}}},
+        {'$unwind': '$rows'},
+        {'$replaceRoot': {'newRoot': '$rows'}},
+    ]
+
+
+def flagged(limits: Dict[int, Dict[str, float]]) -> dict:
+    """$match сотрудников с непустым типом гемодинамики по правилам HEMODYNAMIC_TYPES.
+
+    Границы у каждой организации свои (limits: id организации -> колонка BOUNDARIES -> значение), поэтому
+    условие строится по организациям. Операторы запросов сравнивают только числа: пустое среднее
+    не проходит, как и NaN в classify; правила с неизвестной границей пропускаются.
+    """
+
+    rules = list(dict.fromkeys(rule for choices, _ in HEMODYNAMIC_TYPES.values() for _, found in choices for rule in found))
+    conditions = []
+    for org_id, bounds in limits.items():
+        found = []
+        for col, op, threshold in rules:
+            value = float(bounds[threshold]) if isinstance(threshold, str) else threshold
+            if value == value:
+                found.append({col: {operators[op]: value}})
+        if found:
+            conditions.append({'organization_id': org_id, '$or': found})
+    # без условий не подходит никто ($or не может быть пустым)
+    return {'$match': {'$or': conditions} if conditions else {'organization_id': {'$in': []}}}
 
 
 def pipeline(name: str, start_date: datetime, end_date: datetime, org_ids: List[int]) -> List[str]:
@@ -40,92 +403,7 @@ def pipeline(name: str, start_date: datetime, end_date: datetime, org_ids: List[
                     'count_not_success': {
                         '$sum': {"$cond": ['$resolution_success', 0, 1]}
                     },
-                    'count_med_cause': {
-                        '$sum': {"$cond": [{'$and': [{'$or': [{'$in': ['pulse', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'pressure', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'temperature', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'complaints', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'complains', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'skin', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'injury', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'alcohol', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'reactions', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'inebriation', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'odd_behavior', '$resolution_remarks']},
-                                                              ]}, {'$eq': ['$resolution_success', False]}]}, 1, 0]}
-                    },
-                    'count_adm_cause': {
-                        '$sum': {"$cond": [{'$and': [{'$or': [{'$in': ['alco_out_of_sight', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'tono_out_of_sight', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'alco_rules', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'tono_rules', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'temperature_rules', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'out_of_sight', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'wrong_order', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'clothes', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'mask_gloves', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'high_illumination', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'low_illumination', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'wrong_person', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'strangers', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'extra_stuff', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'food', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'bandage', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'illegal_drugs_intake', '$resolution_remarks']},
-                                                              ]}, {'$eq': ['$resolution_success', False]}]}, 1, 0]}
-                    },
-                    'count_tech_cause': {
-                        '$sum': {"$cond": [{'$and': [{'$or': [{'$in': ['no_video', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'outdated', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'not_all_steps', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'device_malfunction', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'no_photo', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'incorrect_video', '$resolution_remarks']},
-                                                              ]}, {'$eq': ['$resolution_success', False]}]}, 1, 0]}
-                    },
-                    'count_cancel_cause': {
-                        '$sum': {"$cond": [{'$and': [{'$in': ['cancel', '$resolution_remarks']}, {'$eq': ['$resolution_success', False]}]}, 1, 0]}
-                    },
-                    'count_ad': {
-                        '$sum': {"$cond": [{'$and': [{'$or': [
-                            {'$in': ['pressure', '$resolution_remarks']},
-                        ]}, {'$eq': ['$resolution_success', False]}]}, 1, 0]}
-                    },
-                    'count_pulse': {
-                        '$sum': {"$cond": [{'$and': [{'$or': [{'$in': ['pulse', '$resolution_remarks']}]}, {'$eq': ['$resolution_success', False]}]}, 1, 0]}
-                    }
-
+                    **counters("sheet1"),
                 }
             }, {
                 '$project': {
@@ -162,8 +440,6 @@ def pipeline(name: str, start_date: datetime, end_date: datetime, org_ids: List[
                     'organization_name': '$organization.name',
                     'organization_id': '$organization.id',
                     'organization_inn': '$organization.inn',
-                    'boundary_origin': '$boundaries.origin',
-                    'boundary': '$boundaries.values',
                     'employee_name': '$employee.name',
                     'employee_surname': '$employee.surname',
                     'employee_patronymic': '$employee.patronymic',
@@ -178,27 +454,18 @@ def pipeline(name: str, start_date: datetime, end_date: datetime, org_ids: List[
             },
             {
                 '$group': {
+                    # компактный ключ: организация и поля сотрудника (EMPLOYEE_KEY), атрибуты организации
+                    # берутся из первого осмотра, а ее границы подтягиваются отдельно (пайплайн boundary)
                     '_id': {
-                        'organization_name': '$organization_name',
                         'organization_id': '$organization_id',
-                        'organization_inn': '$organization_inn',
-                        'boundary_origin': '$boundary_origin',
-                        'boundary': '$boundary',
-                        'employee_name': '$employee_name',
-                        'employee_surname': '$employee_surname',
-                        'employee_patronymic': '$employee_patronymic',
-                        'employee_birthday': '$employee_birthday',
-                        'employee_number': '$employee_number',
+                        **{col: f'${col}' for col in EMPLOYEE_KEY},
                     },
+                    'organization_name': {'$first': '$organization_name'},
+                    'organization_inn': {'$first': '$organization_inn'},
                     'count_all': {
                         '$sum': 1
                     },
-                    'count_ad_pulse_cause': {
-                        '$sum': {"$cond": [{'$and': [{'$or': [{'$in': ['pressure', '$resolution_remarks']},
-                                                              {'$in': [
-                                                                  'pulse', '$resolution_remarks']},
-                                                              ]}, {'$eq': ['$resolution_success', False]}]}, 1, 0]}
-                    },
+                    **counters("sheet2"),
                     'avg_sad': {
                         '$avg': '$sad'
                     },
@@ -208,16 +475,25 @@ def pipeline(name: str, start_date: datetime, end_date: datetime, org_ids: List[
                     'avg_pulse': {
                         '$avg': "$pulse",
                     },
+                    # средние квадратов: дисперсия = среднее квадратов - квадрат среднего,
+                    # как и средние, складываются по дням в хранилище агрегатов
+                    'avg_sq_sad': {
+                        '$avg': {'$multiply': ['$sad', '$sad']}
+                    },
+                    'avg_sq_dad': {
+                        '$avg': {'$multiply': ['$dad', '$dad']}
+                    },
+                    'avg_sq_pulse': {
+                        '$avg': {'$multiply': ['$pulse', '$pulse']}
+                    },
 
                 }
             }, {
                 '$project': {
                     '_id': None,
-                    'organization_name': '$_id.organization_name',
+                    'organization_name': '$organization_name',
                     'organization_id': '$_id.organization_id',
-                    'organization_inn': '$_id.organization_inn',
-                    'boundary': '$_id.boundary',
-                    'boundary_origin': '$_id.boundary_origin',
+                    'organization_inn': '$organization_inn',
                     'employee_name': '$_id.employee_name',
                     'employee_surname': '$_id.employee_surname',
                     'employee_patronymic': '$_id.employee_patronymic',
@@ -228,7 +504,46 @@ def pipeline(name: str, start_date: datetime, end_date: datetime, org_ids: List[
                     'mean_sad': '$avg_sad',
                     'mean_dad': '$avg_dad',
                     'mean_pulse': '$avg_pulse',
+                    'mean_sq_sad': '$avg_sq_sad',
+                    'mean_sq_dad': '$avg_sq_dad',
+                    'mean_sq_pulse': '$avg_sq_pulse',
+                }}],
+        # границы одной организации по последнему осмотру периода: индексный поиск с $limit 1
+        "boundary": [
+            {
+                '$match': {
+                    'timestamps.processedAt': {
+                        '$lt': end_date,
+                        '$gte': start_date
+                    },
+                    'isTest': False,
+                    'type': {'$in': ['BEFORE_TRIP', 'BEFORE_SHIFT']},
+                    'organization.id':{ '$in': org_ids}
+                }
+            }, {
+                '$sort': {'timestamps.processedAt': -1}
+            }, {
+                '$limit': 1
+            }, {
+                '$project': {
+                    '_id': None,
+                    'organization_id': '$organization.id',
+                    'processed_at': '$timestamps.processedAt',
+                    'boundary_origin': '$boundaries.origin',
+                    'boundary': '$boundaries.values',
                 }}]
     }
+    if name == "sheet2_percentile":
+        return percentiles(pipes["sheet2"])
+    if name == "facet":
+        return facet(pipes["sheet1"], pipes["sheet2"])
+    if name == "facet_percentile":
+        return facet(pipes["sheet1"], percentiles(pipes["sheet2"]))
+    if name == "box":
+        return box(pipes["sheet2"])
+    if name.endswith("_daily"):
+        return daily(pipes[name[:-len("_daily")]])
+    if name.endswith("_partial"):
+        return daily(pipes[name[:-len("_partial")]], by_day=False)
     return pipes[name]
 
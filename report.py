@@ -1,15 +1,60 @@
-from typing import List, Dict
+from typing import List, Dict, Tuple, TYPE_CHECKING
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import zipfile
+import hashlib
+import pickle
+import time
+import io
 import sys
 import os
 sys.path.append("./")
 
 import pandas as pd
 import numpy as np
-import plotly.express as px
 
 from internal.db.db import DB
-from query.queries import pipeline
+from internal.charts.charts import CHARTS, Renderer, box_stats
+from internal.hemodynamics.hemodynamics import classify, age
+from internal.store.store import Store
+from internal.snapshot.snapshot import Snapshot
+from internal.profile.profile import Profiler, measure
+from internal.memo.memo import Memo, MISSING
+from query.queries import pipeline, schema, compact
+
+# тяжелые зависимости загружаются в этапах, которым они нужны: pymongo - при подключении,
+# xlsxwriter - при сохранении, plotly и kaleido - при рендеринге графиков
+if TYPE_CHECKING:
+    from pymongo import MongoClient
+    from internal.live.live import Live
+    from internal.db.db import Backend
+
+
+def safe(name) -> str:
+    """Название организации для имени файла: без разделителей пути."""
+
+    return str(name).replace('/', '_').replace('\\', '_')
+
+
+def digest(path: str) -> str:
+    """sha256 содержимого файла."""
+
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def partition(df: pd.DataFrame, column) -> Dict[str, pd.DataFrame]:
+    """Разбивает датафрейм на части по значениям колонки за один проход.
+
+    Args:
+        df (pd.DataFrame): Данные.
+        column (str): Колонка (или список колонок - тогда ключи кортежи), по которой разбиваются данные.
+
+    Returns:
+        Dict[str, pd.DataFrame]: Словарь значение колонки -> часть данных.
+    """
+
+    return {key: buf for key, buf in df.groupby(column, sort=False, observed=True)}
 
 
 class Gemodynamics:
@@ -18,7 +63,26 @@ class Gemodynamics:
                  start_date: datetime, 
                  end_date: datetime,
                  org_ids: List[int],
-                 save_path: str):
+                 save_path: str,
+                 store_path: str = None,
+                 workers: int = None,
+                 client: "MongoClient" = None,
+                 renderer: Renderer = None,
+                 images_path: str = "images",
+                 snapshot_path: str = "tmp",
+                 replay_path: str = None,
+                 box: bool = False,
+                 profile_path: str = None,
+                 cprofile_path: str = None,
+                 charts: bool = True,
+                 live: "Live" = None,
+                 in_memory: bool = False,
+                 shard_orgs: int = None,
+                 shard_days: int = None,
+                 shard_workers: int = 4,
+                 memo_path: str = None,
+                 backend: "Backend" = None,
+                 db_name: str = "history"):
         """Класс Gemodynamics реализует логику формирования отчета
         'Водители выгрузка типы гемодинамики'.
         
@@ -30,19 +94,97 @@ class Gemodynamics:
             end_date (datetime): Дата конца выгрузки осмотров.
             org_ids (List[int]): Список id организаций, по которым нужно сделать отчет.   
             save_path (str): Путь до папки, в которую нужно сохранить отчет.
+            store_path (str, optional): Путь до локального хранилища дневных агрегатов.
+                Если указан, из mongo выгружаются только дни, которых еще нет в хранилище.
+            workers (int, optional): Количество процессов для рендеринга графиков и сохранения отчетов
+                по организациям. По умолчанию - число ядер.
+            client (MongoClient, optional): Общий клиент mongo. Если не указан, создается свой
+                и закрывается после выгрузки.
+            renderer (Renderer, optional): Общий рендерер графиков.
+            images_path (str, optional): Папка для графиков.
+            snapshot_path (str, optional): Папка для снимков выгрузок из mongo (parquet).
+            replay_path (str, optional): Папка со снимком предыдущего запуска. Если указана,
+                отчет строится из снимка без обращения к mongo (Snapshot). Снимок со статистиками
+                графиков воспроизводится с box.
+            box (bool, optional): Графики по готовым статистикам 'Ящика с усами' (квартили, усы, выбросы)
+                вместо всех точек сотрудников. Статистики считаются в mongo (7.0+), и тогда детализация sheet2
+                выгружается только по сотрудникам с типом гемодинамики; на старых серверах и у других
+                источников - по загруженной выгрузке sheet2.
+            profile_path (str, optional): Путь до json с замерами этапов run (время, строки, пик памяти).
+                Если не указан (и не указан cprofile_path), замеры не ведутся.
+            cprofile_path (str, optional): Путь до дампа cProfile всего запуска.
+            charts (bool, optional): Рисовать графики и вставлять их в отчет. Если False, plotly и kaleido
+                не загружаются вовсе, а вторая страница отчета остается без графиков.
+            live (Live, optional): Живые агрегаты из change stream. Если указаны, выгрузки собираются
+                из них без обращения к mongo (границы периода - целые дни).
+            in_memory (bool, optional): Формировать отчет без диска: графики остаются байтами и вставляются
+                в книги через image_data, книги собираются в памяти, снимки выгрузок и кэш png не пишутся.
+                Готовые отчеты возвращает run (имя файла -> содержимое), zip собирает из них архив.
+            shard_orgs (int, optional): Шардированная выгрузка: организаций в одном шарде.
+            shard_days (int, optional): Шардированная выгрузка: дней в одном шарде. Если указан хотя бы
+                один размер, выгрузка делится на шарды (организации x отрезок времени), которые выполняются
+                параллельно и складываются точно (без перцентилей sheet2).
+            shard_workers (int, optional): Сколько шардов выполнять одновременно.
+            memo_path (str, optional): Папка кэша этапов run. Если указана, результаты этапов (выгрузка
+                за закончившийся период, подготовка страниц, графики, книги организаций) сохраняются
+                под хэшем входов, параметров и кода этапа, и при повторном запуске неизменившиеся этапы
+                и книги не пересчитываются, а упавший запуск продолжается с последнего готового этапа.
+            backend (Backend, optional): Источник выгрузок вместо mongo с интерфейсом DB (load, box, save,
+                close_client), например Local - те же пайплайны над локальным экспортом осмотров.
+            db_name (str, optional): База mongo с коллекцией осмотров inspections.
+
+        Raises:
+            ValueError: Указано несколько источников (backend, replay_path, live) или вместе с другим
+                источником - настройки выгрузки из mongo (store_path, shard_orgs, shard_days).
 
         Example:
             gem_report = Gemodynamics(datetime(2023, 10, 1), datetime(2023, 11, 1))
             gem_report.run()
+
+            # перестроить отчет из снимка прошлого запуска
+            Gemodynamics(datetime(2023, 10, 1), datetime(2023, 11, 1), [], "results", replay_path="tmp").run()
+
+            # отчеты в памяти одним архивом
+            report = Gemodynamics(datetime(2023, 10, 1), datetime(2023, 11, 1), [1328, 2211], None, in_memory=True)
+            report.run()
+            data = report.zip()
         """
 
-        # инициализируем экземпляр сервиса работы с базой данных
-        self.db = DB(pipeline)
+        # источник выгрузок: mongo или один из других (снимок, живые агрегаты, переданный backend)
+        sources = [name for name, value in [('backend', backend), ('replay_path', replay_path), ('live', live)] if value]
+        if len(sources) > 1:
+            raise ValueError(f"источник выгрузок должен быть один, указаны: {', '.join(sources)}")
+        options = [name for name, value in [('store_path', store_path), ('shard_orgs', shard_orgs), ('shard_days', shard_days)] if value]
+        if sources and options:
+            raise ValueError(f"{', '.join(options)} - настройки выгрузки из mongo, а источник - {sources[0]}")
+        if replay_path:
+            backend = Snapshot(replay_path)
+            # sheet2 снимка со статистиками сервера - только сотрудники с типом гемодинамики
+            box = box or backend.boxed
+        self.profiler = Profiler(profile_path, cprofile_path)
+        if backend is not None or live is not None:
+            self.db = backend if backend is not None else live
+        else:
+            self.db = DB(pipeline, schema, store=Store(store_path) if store_path else None, client=client,
+                         snapshot_path=None if in_memory else snapshot_path, profiler=self.profiler, dtypes=compact,
+                         shard_orgs=shard_orgs, shard_days=shard_days, shard_workers=shard_workers, db_name=db_name)
 
         self.start_date = start_date
         self.end_date = end_date
         self.org_ids = org_ids
         self.save_path = save_path
+        self.images_path = images_path
+        self.box = box
+        self.workers = workers or os.cpu_count()
+        self.charts = charts
+        self.in_memory = in_memory
+        # графики организаций в памяти: (организация, график) -> png
+        self.images: Dict[Tuple[str, str], bytes] = {}
+        # готовые отчеты в памяти: имя файла -> содержимое книги
+        self.reports: Dict[str, bytes] = {}
+        self.memo = Memo(memo_path) if memo_path else None
+        self.own_renderer = charts and renderer is None
+        self.renderer = (renderer or Renderer(self.workers, cache_dir=None if in_memory else os.path.join(images_path, "cache"))) if charts else None
 
 
     def get_reports(self) -> Dict[str, pd.DataFrame]:
@@ -55,21 +197,26 @@ class Gemodynamics:
         # инициализируем словарь
         dfs = dict()
 
+        # статистики графиков посчитаем на сервере (None - источник их не считает); тогда точки
+        # сотрудников для графиков не нужны, и сервер отдает только сотрудников с типом гемодинамики
+        box = self.db.box(self.start_date, self.end_date, self.org_ids) if self.box and self.charts else None
+
         # запустим выгрузку и сложим в словарь
-        df11, df2 = self.db.load(self.start_date, self.end_date, self.org_ids)
+        df11, df2 = self.db.load(self.start_date, self.end_date, self.org_ids, flagged=box is not None)
         dfs['sheet11'] = df11
         dfs['sheet2'] = df2
+        dfs['box'] = box
 
-        # сохраним csv исходников
+        # сохраним снимок исходников (без статистик старый снимок box удаляется)
         self.db.save('sheet11', df11)
         self.db.save('sheet2', df2)
+        self.db.save('box', box)
 
         # сформируем вторую часть первой страницы
         # это группировка по организации
-        df1 = dfs['sheet11'].copy()
-        df1 = df1.groupby(['organization_id', 
-                                      'organization_inn', 
-                                      'organization_name'], as_index=False).agg('sum').drop(['host_release_point'], axis=1)
+        keys = ['organization_id', 'organization_inn', 'organization_name']
+        counts = [col for col in dfs['sheet11'].columns if col not in keys + ['host_release_point']]
+        df1 = dfs['sheet11'].groupby(keys, as_index=False, observed=True)[counts].sum()
         dfs['sheet1'] = df1
 
         # закроем подключение
@@ -112,23 +259,22 @@ class Gemodynamics:
         res = []
         for sheet_name in ['sheet1', 'sheet11']: # пробежимся по компонентам первой страницы
 
-            buf = dfs[sheet_name].copy()
+            # переименуем колонки (новые колонки добавляются только в buf, копия выгрузки не нужна)
+            buf = dfs[sheet_name].rename(columns=columns, copy=False)
 
             # создадим колонки с периодом
             buf['Период'] = start_date + " - " + end_date
 
-            # переименуем колонки
-            buf.rename(columns=columns, inplace=True)
-
-            # вычислим относительные величины
-            buf["Допуск %"] = ((buf["Допуск"] / buf["Всего осмотров"] * 100).round(2)).astype(str) + "%"
-            buf["Недопуск (включая тех.сбои) %"] = ((buf["Недопуск (включая тех.сбои)"] / buf["Всего осмотров"] * 100).round(2)).astype(str) + "%"
-            buf["Недопуски по мед. причинам %"] = ((buf["Недопуски по мед. причинам"] / buf["Всего осмотров"] * 100).round(2)).astype(str) + "%"
-            buf["Недопуски по адм. причинам %"] = ((buf["Недопуски по адм. причинам"] / buf["Всего осмотров"] * 100).round(2)).astype(str) + "%"
-            buf["Недопуски по тех. причинам %"] = ((buf["Недопуски по тех. причинам"] / buf["Всего осмотров"] * 100).round(2)).astype(str) + "%"
-            buf["Прерванные осмотры / Зависло %"] = ((buf["Прерванные осмотры / Зависло"] / buf["Всего осмотров"] * 100).round(2)).astype(str) + "%"
-            buf["ЧСС вне нормы %"] = ((buf["ЧСС вне нормы"] / buf["Всего осмотров"] * 100).round(2)).astype(str) + "%"
-            buf["АД вне нормы %"] = ((buf["АД вне нормы"] / buf["Всего осмотров"] * 100).round(2)).astype(str) + "%"
+            # вычислим относительные величины - доли, проценты появляются только в формате ячеек excel
+            for col in ["Допуск",
+                        "Недопуск (включая тех.сбои)",
+                        "Недопуски по мед. причинам",
+                        "Недопуски по адм. причинам",
+                        "Недопуски по тех. причинам",
+                        "Прерванные осмотры / Зависло",
+                        "ЧСС вне нормы",
+                        "АД вне нормы"]:
+                buf[f"{col} %"] = (buf[col] / buf["Всего осмотров"]).round(4)
 
             # оставим только нужные колонки в первой части
             if sheet_name == 'sheet1':
@@ -189,42 +335,21 @@ class Gemodynamics:
             pd.DataFrame: Датафрейм для заполнения второй страницы отчета.  
         """
         
-        buf = df.copy()
-
-        # создадим колонки для границы показателей АД и пульса
-        buf['boundary_pulse_lower'] = np.nan
-        buf['boundary_pulse_upper'] = np.nan
-        buf['boundary_sad_lower'] = np.nan
-        buf['boundary_sad_upper'] = np.nan
-        buf['boundary_dad_upper'] = np.nan
-        buf['boundary_dad_lower'] = np.nan
-
-        # вытащим индивидуальные границы по организации
-        # buf['boundary'] = buf.boundary.apply(lambda x: x.replace("false", "False").replace('true', 'True') if not pd.isna(x) else x)
-        buf.loc[:, 'boundary_pulse_lower'] = buf.apply(lambda x: x.boundary['pulse']['lower'] if x.boundary_origin=='org' else 54, axis=1)
-        buf.loc[:, 'boundary_pulse_upper'] = buf.apply(lambda x: x.boundary['pulse']['upper'] if x.boundary_origin=='org' else 100, axis=1)
-
-        buf.loc[:, 'boundary_sad_upper'] = buf.apply(lambda x: x.boundary['pressure']['systolic']['upper'] if x.boundary_origin=='org' else 139, axis=1)
-        buf.loc[:, 'boundary_sad_lower'] = buf.apply(lambda x: x.boundary['pressure']['systolic']['lower'] if x.boundary_origin=='org' else 100, axis=1)
-
-        buf.loc[:, 'boundary_dad_upper'] = buf.apply(lambda x: x.boundary['pressure']['diastolic']['upper'] if x.boundary_origin=='org' else 89, axis=1)
-        buf.loc[:, 'boundary_dad_lower'] = buf.apply(lambda x: x.boundary['pressure']['systolic']['lower'] if x.boundary_origin=='org' else 60, axis=1)
-
-        # присвоим тип гемодинамики
-        buf['type_sad'] = buf.apply(lambda x: "Гипертоник (Повышенное сАД)" if x.mean_sad>x.boundary_sad_upper else ("Гипотоник (Пониженное сАД)" if x.mean_sad<x.boundary_sad_lower else ""), axis=1)
-        buf['type_dad'] = buf.apply(lambda x: "Гипертоник (Повышенное дАД)" if x.mean_dad>x.boundary_dad_upper else ("Гипотоник (Пониженное дАД)" if x.mean_dad<x.boundary_dad_lower else ""), axis=1)
-        buf['type_pulse'] = buf.apply(lambda x: "Тахиритмик (Повышенная ЧСС)" if x.mean_pulse>x.boundary_pulse_upper else "", axis=1)
-        buf['type_sad'] = buf.apply(lambda x: "Брадиритмик (Пониженная ЧСС)" if x.mean_pulse<x.boundary_pulse_lower else "", axis=1)
+        # развернем границы и присвоим типы гемодинамики, блоки наблюдений и рекомендации
+        buf = classify(df)
 
         # соберем нужные колонки
-        buf['Тип гемодинамики'] = buf[['type_sad', 'type_dad', 'type_pulse', 'type_sad']].agg(', '.join, axis=1).str.rstrip(", ").str.lstrip(", ")
-        buf['Блок наблюдений по АД'] = buf.apply(lambda x: "Повышенное АД" if x.mean_dad>89 or x.mean_sad>139 else ("Пониженное АД" if x.mean_dad<60 or x.mean_sad<100 else "Нормальное АД"), axis=1)
-        buf['Блок наблюдений по ЧСС'] = buf.apply(lambda x: "Повышенная ЧСС" if x.mean_pulse>100 else ("Пониженная ЧСС" if x.mean_pulse<54 else "Нормальная ЧСС"), axis=1)
-        buf['Рекомендации'] = buf.apply(lambda x: "Рекомендуется внеочередной медицинский осмотра с заключением врача профпатолога" if x.mean_sad >= 160 or x.mean_sad <= 89 or x.mean_dad >= 100 or x.mean_dad <= 49 or x.mean_pulse >= 106 or x.mean_pulse <= 44 else "Рекомендуется обратиться ко врачу терапевту за медицинской консультацией", axis=1)
-        buf['ФИО'] = buf['employee_surname'] + " " + buf['employee_name'] + " " + buf['employee_patronymic']
+        buf['ФИО'] = buf['employee_surname'].astype(object) + " " + buf['employee_name'].astype(object) + " " + buf['employee_patronymic'].astype(object)
         buf['Табельный номер'] = buf['employee_number']
-        buf['Доля недопусков по АД и ЧСС'] = (buf['count_ad_pulse_cause'] / buf['count_all']) * 100
-        buf['Возраст'] = pd.to_datetime(buf['employee_birthday']).apply(lambda x: datetime.now().year - x.year - ((datetime.now().month, datetime.now().day) < (x.month, x.day)))
+        buf['Доля недопусков по АД и ЧСС'] = buf['count_ad_pulse_cause'] / buf['count_all']
+        buf['Возраст'] = age(buf['employee_birthday'])
+
+        # разброс показателей: СКО из среднего квадратов, перцентили - если сервер их посчитал (mongo 7.0+)
+        for value, title in [('sad', 'АД систолическое'), ('dad', 'АД диастолическое'), ('pulse', 'ЧСС')]:
+            variance = (buf[f'mean_sq_{value}'] - buf[f'mean_{value}'] ** 2).clip(lower=0)
+            buf[f'СКО {title}'] = np.sqrt(variance).round(2)
+            buf[f'Медиана {title}'] = buf[f'median_{value}'].round(2) if f'median_{value}' in buf else np.nan
+            buf[f'90-й перцентиль {title}'] = buf[f'p90_{value}'].round(2) if f'p90_{value}' in buf else np.nan
 
         # приведем названия в порядок
         buf.rename(columns={
@@ -251,6 +376,15 @@ class Gemodynamics:
                 "Среднее значение по АД систолическое", 
                 "Среднее значение по АД диастолическое",
                 "Среднее значение по ЧСС",
+                "СКО АД систолическое",
+                "Медиана АД систолическое",
+                "90-й перцентиль АД систолическое",
+                "СКО АД диастолическое",
+                "Медиана АД диастолическое",
+                "90-й перцентиль АД диастолическое",
+                "СКО ЧСС",
+                "Медиана ЧСС",
+                "90-й перцентиль ЧСС",
                 "Тип гемодинамики",
                 "Рекомендации",
                 'Блок наблюдений по АД',
@@ -260,183 +394,310 @@ class Gemodynamics:
         buf['Среднее значение по АД систолическое'] = buf['Среднее значение по АД систолическое'].round(2)
         buf['Среднее значение по АД диастолическое'] = buf['Среднее значение по АД диастолическое'].round(2)
         buf['Среднее значение по ЧСС'] = buf['Среднее значение по ЧСС'].round(2)
-        buf["Доля недопусков по АД и ЧСС"] = buf["Доля недопусков по АД и ЧСС"].round(2).astype(str) + "%"
+        buf["Доля недопусков по АД и ЧСС"] = buf["Доля недопусков по АД и ЧСС"].round(4)
 
         return buf
 
 
-    def draw(self, df: pd.DataFrame):
+    def draw(self, df: pd.DataFrame, box: pd.DataFrame = None) -> Dict[Tuple[str, str], bytes]:
         """Метод для генерации графиков типа 'Ящик с усами' для показателей АД и пульса.
 
         Args:
             df (pd.DataFrame): Данные для генерации графиков.
+            box (pd.DataFrame, optional): Статистики графиков из mongo (dfs['box']). Если указаны, графики
+                строятся по ним (df тогда только с типами гемодинамики), иначе при self.box - по df.
+
+        Returns:
+            Dict[Tuple[str, str], bytes]: (организация, график) -> png.
         """
 
-        os.makedirs("./images", exist_ok=True)
-        for i in df.organization_name.unique():
-            # график для систолического АД
-            fig1 = px.box(df[df['organization_name']==i], 
-                        x="Блок наблюдений по АД", 
-                        y="Среднее значение по АД систолическое",
-                        color="Блок наблюдений по АД",
-                        color_discrete_map={
-                            "Нормальное АД": "green",
-                            "Повышенное АД": "red",
-                            "Пониженное АД": "yellow"
-                        },
-                        points='all',
-                        width=1000, 
-                        height=700,
-                        title='Систолическое давление')
-            fig1.write_image(f"images/{i}_fig1.png")
-
-            # график для диастолического АД
-            fig2 = px.box(df[df['organization_name']==i], 
-                        x="Блок наблюдений по АД", 
-                        y="Среднее значение по АД диастолическое",
-                        color="Блок наблюдений по АД",
-                        color_discrete_map={
-                            "Нормальное АД": "green",
-                            "Повышенное АД": "red",
-                            "Пониженное АД": "yellow"
-                        },
-                        points='all',
-                        width=1000, 
-                        height=700,
-                        title='Диастолическое давление')
-            fig2.write_image(f"images/{i}_fig2.png")
-
-            # график для ЧСС
-            fig3 = px.box(df[df['organization_name']==i], 
-                        x="Блок наблюдений по ЧСС", 
-                        y="Среднее значение по ЧСС",
-                        color="Блок наблюдений по ЧСС",
-                        color_discrete_map={
-                            "Нормальная ЧСС": "green",
-                            "Повышенная ЧСС": "red",
-                            "Пониженная ЧСС": "yellow"
-                        },
-                        points='all',
-                        width=1000, 
-                        height=700,
-                        title='Частота сердечно-сосудистых сокращений')
-            fig3.write_image(f"images/{i}_fig3.png")
-
-
-    def save(self, df1: pd.DataFrame, df11: pd.DataFrame, df2: pd.DataFrame):
+        with self.profiler.stage("draw", rows_in=len(df)) as record:
+            # в режиме статистик вместо точек сотрудников рисуются квартили, усы и выбросы
+            # по три графика на организацию, рендерятся параллельно, неизменившиеся берутся из кэша
+            if box is not None:
+                parts = partition(box.sort_values('block'), ['organization_name', 'chart'])
+                empty = pd.DataFrame(columns=['block', 'q1', 'median', 'q3', 'lowerfence', 'upperfence', 'outliers'])
+                orgs = list(dict.fromkeys(box['organization_name']))
+                jobs = [((i, name), parts.get((i, name), empty), spec) for i in orgs for name, spec in CHARTS.items()]
+            else:
+                jobs = [((i, name), box_stats(buf, spec) if self.box else buf, spec)
+                        for i, buf in df.groupby('organization_name', sort=False, observed=True)
+                        for name, spec in CHARTS.items()]
+            self.images = self.renderer.draw(jobs)
+            self.write_images()
+            record['rows_out'] = len(jobs)
+        return self.images
+
+
+    def image_path(self, org: str, name: str) -> str:
+        return f"{self.images_path}/{safe(org)}_{name}.png"
+
+
+    def write_images(self):
+        if self.in_memory:
+            return
+        os.makedirs(self.images_path, exist_ok=True)
+        for (i, name), image in self.images.items():
+            with open(self.image_path(i, name), 'wb') as f:
+                f.write(image)
+
+
+    def save(self, df1: pd.DataFrame, df11: pd.DataFrame, df2: pd.DataFrame) -> Dict[str, bytes]:
         """Метод для формирования отчета и сохранения.
 
+        Данные разбиваются по организациям за один проход, а книги пишутся параллельно
+        в пуле процессов из self.workers процессов.
+
         Args:
             df1 (pd.DataFrame): Данные для первой части первой страницы.
             df11 (pd.DataFrame): Данные для второй части первой страницы.
             df2 (pd.DataFrame): Данные для второй страницы.
+
+        Returns:
+            Dict[str, bytes]: При self.in_memory - имя файла отчета -> содержимое, иначе пустой словарь.
         """
 
-        for i in df1.Организация.unique(): # пробежимся по всем организациям
+        from internal.workbook.workbook import write_workbook
 
-            # выделим названия и создадим генератор отчета
-            idd = df2.loc[df2.organization_name==i, 'organization_name'].values[0]
+        if not self.in_memory:
             os.makedirs(self.save_path, exist_ok=True)
-            writer = pd.ExcelWriter(f"{self.save_path}/Водители выгрузка типы гемодинамики {i}.xlsx", engine='xlsxwriter')
-            workbook = writer.book
-
-            # выделим отдельные организации
-            buf1 = df1[df1.Организация==i].reset_index(drop=True)
-            buf11 = df11[df11.Организация==i].drop(['Организация'], axis=1).reset_index(drop=True)
-            buf2 = df2[(df2.organization_name==i) & (df2['Тип гемодинамики']!='')].drop(['organization_name', 'organization_id', 'organization_inn', 'Блок наблюдений по АД', 'Блок наблюдений по ЧСС'], axis=1)
-
-            # укажем расположение данных на странице
-            buf1.to_excel(writer, sheet_name="Лист1", index=False)  # send df to writer
-            buf11.to_excel(writer, sheet_name="Лист1", index=False, startrow=len(buf1)+1, startcol=0)
-
-            # раскрасим колонку с недопусками
-            worksheet = writer.sheets["Лист1"]  # pull worksheet object    
-            for i, v in enumerate(buf1['Недопуск (включая тех.сбои) %'].values):
-                if float(v.replace("%",'')) < 25:
-                    cell_format = workbook.add_format()
-                    cell_format.set_bg_color('green')
-                elif float(v.replace("%",'')) < 35:
-                    cell_format = workbook.add_format()
-                    cell_format.set_bg_color('yellow')
-                else:
-                    cell_format = workbook.add_format()
-                    cell_format.set_bg_color('red')
-                worksheet.write(i+1, 6, v, cell_format)
-                
-            for i, v in enumerate(buf11['Недопуск (включая тех.сбои) %'].values):
-                if float(v.replace("%",'')) < 25:
-                    cell_format = workbook.add_format()
-                    cell_format.set_bg_color('green')
-                elif float(v.replace("%",'')) < 35:
-                    cell_format = workbook.add_format()
-                    cell_format.set_bg_color('yellow')
+
+        # разобьем данные по организациям один раз
+        parts1 = partition(df1, 'Организация')
+        parts11 = partition(df11, 'Организация')
+        parts2 = partition(df2[df2['Тип гемодинамики']!=''], 'organization_name')
+
+        # версия кода книги для кэша этапов: меняется при любой правке оформления
+        version = Memo.version(sys.modules[write_workbook.__module__], Gemodynamics.save) if self.memo is not None else None
+
+        jobs, keys = [], {}
+        for i in df1.Организация.unique(): # пробежимся по всем организациям
+            buf1 = parts1[i].reset_index(drop=True)
+            buf11 = parts11.get(i, df11.iloc[:0]).drop(['Организация'], axis=1).reset_index(drop=True)
+            buf2 = parts2.get(i, df2.iloc[:0]).drop(['organization_name', 'organization_id', 'organization_inn', 'Блок наблюдений по АД', 'Блок наблюдений по ЧСС'], axis=1)
+            if not self.charts:
+                images = []
+            elif self.in_memory:
+                images = [self.images[(i, name)] for name in CHARTS if (i, name) in self.images]
+            else:
+                images = [self.image_path(i, name) for name in CHARTS]
+            name = f"Водители выгрузка типы гемодинамики {safe(i)}.xlsx"
+            jobs.append((name, None if self.in_memory else f"{self.save_path}/{name}", buf1, buf11, buf2, images))
+            if self.memo is not None:
+                keys[name] = Memo.key(name, jobs[-1][1], buf1, buf11, buf2, version,
+                                      *[self.images.get((i, chart)) for chart in CHARTS if self.charts])
+
+        self.reports = {}
+        # книги с теми же данными, графиками и кодом уже сохранены прошлым запуском - пропустим их.
+        # В кэше - содержимое книги в памяти или хэш записанного файла: имя книги не зависит от периода,
+        # и файл по тому же пути мог перезаписать запуск за другой период
+        if self.memo is not None:
+            pending = []
+            for job in jobs:
+                cached = self.memo.get("save", keys[job[0]])
+                if cached is MISSING or (job[1] is not None and (not os.path.exists(job[1]) or digest(job[1]) != cached)):
+                    pending.append(job)
+                elif job[1] is None:
+                    self.reports[job[0]] = cached
+            jobs = pending
+        paths = {name: path for name, path, *_ in jobs}
+
+        def done(name: str, data: bytes):
+            if data is not None:
+                self.reports[name] = data
+            if self.memo is not None:
+                self.memo.put("save", keys[name], data if paths[name] is None else digest(paths[name]))
+
+        # сохраним отчеты, при одном процессе - без пула
+        if self.workers == 1 or len(jobs) <= 1:
+            for name, *job in jobs:
+                with self.profiler.stage(f"save:{name}", rows_in=len(job[3])):
+                    done(name, write_workbook(*job))
+            return self.reports
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            # при замерах книга пишется через measure, чтобы получить время и память процесса пула
+            futures = [pool.submit(measure, write_workbook, *job) if self.profiler.enabled else pool.submit(write_workbook, *job)
+                       for _, *job in jobs]
+            for (name, *job), future in zip(jobs, futures):
+                res = future.result()
+                if self.profiler.enabled:
+                    data = res.pop('result')
+                    self.profiler.record(f"save:{name}", rows_in=len(job[3]), rows_out=None, **res)
                 else:
-                    cell_format = workbook.add_format()
-                    cell_format.set_bg_color('red')
-                worksheet.write(i+1+len(buf1)+1, 6, v, cell_format)
-
-            # добавим текст с рекомендациями по отчету
-            worksheet.write_string(len(buf1) + len(buf11) + 3, 0, "Рекомендуемый период составляет 1 месяц")
-            worksheet.write_string(len(buf1) + len(buf11) + 4, 0, "если меньше - данные теряют точность, если больше данные теряют актуальность")
-
-            # отнормируем ширину колонок
-            for idx, col in enumerate(buf1):
-                series = buf1[col]
-                max_len = max((
-                    series.astype(str).apply(len).max(),
-                    len(str(col))
-                    ))+1
-                worksheet.set_column(idx, idx, max_len)
-            for idx, col in enumerate(buf11):
-                series = buf11[col]
-                max_len = max((
-                    series.astype(str).apply(len).max(),
-                    len(str(col))
-                    ))+1
-                worksheet.set_column(idx, idx, max_len)
-
-            # укажем расположение данных на странице 2
-            buf2.to_excel(writer, sheet_name='Лист2', index=False)
-            worksheet = writer.sheets["Лист2"]
-            for idx, col in enumerate(buf2):
-                series = buf2[col]
-                max_len = max((
-                    series.astype(str).apply(len).max(),
-                    len(str(col))
-                    ))+1
-                worksheet.set_column(idx, idx, max_len)
-
-            # вставим графики
-            worksheet.insert_image(1, 14, f"images/{idd}_fig1.png")   
-            worksheet.insert_image(38, 14, f"images/{idd}_fig2.png")   
-            worksheet.insert_image(74, 14, f"images/{idd}_fig3.png")   
+                    data = res
+                done(name, data)
+        return self.reports
+
+
+    def zip(self, file=None):
+        """Упаковывает отчеты, собранные в памяти, в zip-архив.
+
+        Args:
+            file (optional): Путь или открытый для записи файловый объект (например, ответ HTTP),
+                в который архив пишется по мере упаковки. Если не указан, архив возвращается байтами.
+
+        Returns:
+            bytes: Архив, если file не указан.
+        """
+
+        output = io.BytesIO() if file is None else file
+        # книги xlsx уже сжаты, повторно их не сжимаем
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED) as archive:
+            for name, data in self.reports.items():
+                archive.writestr(name, data)
+        return output.getvalue() if file is None else None
+
+
+    def fetch_key(self) -> str:
+        """Ключ выгрузки в кэше этапов. None - выгрузку кэшировать нельзя.
+
+        Кэшируется только выгрузка из mongo за закончившийся период (по UTC): осмотры текущего дня
+        еще меняются, а снимок и живые агрегаты могут обновиться под тем же путем. В ключе - и сервер
+        с коллекцией, и настройки выгрузки (DB.identity): другой источник дает другую выгрузку.
+        """
+
+        today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+        if self.memo is None or not isinstance(self.db, DB) or self.end_date > today:
+            return None
+        return Memo.key(self.start_date, self.end_date, sorted(self.org_ids), self.box, self.db.identity(),
+                        Memo.version(DB, sys.modules[pipeline.__module__], Gemodynamics.get_reports))
 
-            # сохраним отчет
-            writer.close()
 
+    def cached(self, stage: str, key: str, fn):
+        """Результат этапа из кэша этапов или fn(), сохраненный в кэш. Возвращает (результат, попадание)."""
 
-    def run(self):
+        if self.memo is None or key is None:
+            return fn(), False
+        value = self.memo.get(stage, key)
+        if value is not MISSING:
+            return value, True
+        return self.memo.put(stage, key, fn()), False
+
+
+    def run(self) -> Dict[str, bytes]:
         """Главный метод класса.
         Запускает все процессы по очереди.
 
+        Returns:
+            Dict[str, bytes]: При self.in_memory - отчеты (имя файла -> содержимое), иначе пустой словарь.
+
         Raises:
             exc: Исключение.
         """
         
         try:
             # получим данные из базы
-            dfs = self.get_reports()
+            with self.profiler.stage("get_reports") as record:
+                fetch_key = self.fetch_key()
+                dfs, hit = self.cached("get_reports", fetch_key, self.get_reports)
+                record['rows_out'] = sum(len(df) for df in dfs.values() if df is not None)
+            # при попадании в кэш выгрузка не запускалась и подключение не закрыто
+            if hit:
+                self.db.close_client()
+
+            # ключ данных для следующих этапов: ключ выгрузки или, если она не кэшируется, ее содержимое
+            data_key = None
+            if self.memo is not None:
+                # выбросы статистик - списки, их хэшируем сериализованными
+                data_key = fetch_key or Memo.key(dfs['sheet11'], dfs['sheet2'], pickle.dumps(dfs.get('box')))
 
             # подготовим данные для первой страницы
-            df1, df11 = self.sheet1_prep(dfs)
+            with self.profiler.stage("sheet1_prep", rows_in=len(dfs['sheet1']) + len(dfs['sheet11'])) as record:
+                # кроме данных, этап читает период: из него строится подпись 'Период'
+                key = data_key and Memo.key(data_key, self.start_date, self.end_date, Memo.version(Gemodynamics.sheet1_prep))
+                (df1, df11), _ = self.cached("sheet1_prep", key, lambda: self.sheet1_prep(dfs))
+                record['rows_out'] = len(df1) + len(df11)
 
             # подготовим данные для второй
-            df2 = self.sheet2_prep(dfs['sheet2'])
+            with self.profiler.stage("sheet2_prep", rows_in=len(dfs['sheet2'])) as record:
+                # возраст считается на текущую дату
+                key = data_key and Memo.key(data_key, datetime.now().date(),
+                                            Memo.version(Gemodynamics.sheet2_prep, sys.modules[classify.__module__]))
+                df2, _ = self.cached("sheet2_prep", key, lambda: self.sheet2_prep(dfs['sheet2']))
+                record['rows_out'] = len(df2)
+
+            # нарисуем графики для второй страницы (из кэша - только запишем png)
+            if self.charts:
+                key = data_key and Memo.key(data_key, self.box, Memo.version(
+                    Gemodynamics.sheet2_prep, Gemodynamics.draw, sys.modules[classify.__module__], sys.modules[box_stats.__module__]))
+                self.images, hit = self.cached("draw", key, lambda: self.draw(df2, dfs.get('box')))
+                if hit:
+                    self.write_images()
 
             # сохраним отчет
-            self.save(df1, df11, df2)
+            with self.profiler.stage("save", rows_in=len(df2)):
+                self.save(df1, df11, df2)
+            return self.reports
         except Exception as exc:
             raise exc
+        finally:
+            self.profiler.dump()
+            if self.own_renderer:
+                self.renderer.close()
+
+
+def run_batch(jobs: List[Tuple[Tuple[datetime, datetime], List[int], str]],
+              jobs_concurrency: int = 4,
+              connection_string: str = None,
+              max_pool_size: int = 16,
+              **kwargs) -> List[dict]:
+    """Формирует несколько отчетов с одним общим пулом подключений к mongo.
+
+    Задания выполняются параллельно в потоках, но не больше, чем позволяет пул подключений.
+
+    Args:
+        jobs (List[Tuple[Tuple[datetime, datetime], List[int], str]]): Задания вида
+            ((start_date, end_date), org_ids, save_path).
+        jobs_concurrency (int, optional): Количество одновременно выполняемых заданий.
+        connection_string (str, optional): Строка подключения к mongo.
+        max_pool_size (int, optional): Размер пула подключений.
+        **kwargs: Остальные параметры Gemodynamics (store_path, workers - процессы общего рендерера
+            и сохранения книг, и т.д.).
+
+    Returns:
+        List[dict]: По каждому заданию в порядке jobs: параметры задания, время выполнения, ошибка
+            (если была) и reports - результат run (при in_memory - имя файла -> содержимое книги).
+
+    Example:
+        results = run_batch([((datetime(2023, 10, 1), datetime(2023, 11, 1)), [1328, 2211], "results/a"),
+                             ((datetime(2023, 9, 1), datetime(2023, 10, 1)), [452], "results/b")])
+
+        # отчеты в памяти по каждому заданию
+        results = run_batch(jobs, in_memory=True)
+        reports = [res['reports'] for res in results]
+    """
+
+    client = DB.pool(connection_string, max_pool_size)
+    images_path = kwargs.pop('images_path', "images")
+    renderer = kwargs.pop('renderer', None)
+    own_renderer = renderer is None and kwargs.get('charts', True)
+    # кэш png общий для всех заданий
+    cache_dir = None if kwargs.get('in_memory') else os.path.join(images_path, "cache")
+    renderer = renderer or (Renderer(kwargs.get('workers'), cache_dir=cache_dir) if own_renderer else None)
+    snapshot_path = kwargs.pop('snapshot_path', "tmp")
+
+    def run_job(idx, job):
+        (start_date, end_date), org_ids, save_path = job
+        res = {'start_date': start_date, 'end_date': end_date, 'org_ids': org_ids, 'save_path': save_path,
+               'error': None, 'reports': None}
+        started = time.perf_counter()
+        try:
+            # у каждого задания своя папка графиков: одна организация может быть в нескольких заданиях
+            res['reports'] = Gemodynamics(start_date, end_date, org_ids, save_path, client=client, renderer=renderer,
+                                          images_path=f"{images_path}/job{idx}", snapshot_path=f"{snapshot_path}/job{idx}",
+                                          **kwargs).run()
+        except Exception as exc:
+            res['error'] = repr(exc)
+        res['seconds'] = time.perf_counter() - started
+        return res
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(jobs_concurrency, max_pool_size))) as pool:
+            return list(pool.map(run_job, range(len(jobs)), jobs))
+    finally:
+        if own_renderer:
+            renderer.close()
+        client.close()
 
 
 if __name__ == "__main__":
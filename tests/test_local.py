@@ -0,0 +1,121 @@
+"""Local.load на осмотрах, собранных вручную.
+
+Счетчики, средние второго измерения, $first атрибутов и границы организации по последнему осмотру
+сверяются с посчитанными руками значениями; в экспорт попадают и осмотры, которые $match пайплайнов
+отбрасывает (тестовые, вне периода, другой организации). Экспорт - JSON lines, как у mongoexport.
+
+Example:
+    python -m pytest -q tests
+"""
+from datetime import datetime
+import json
+import sys
+sys.path.append("./")
+
+import pandas as pd
+import numpy as np
+import pytest
+
+from internal.local.local import Local
+from query.queries import schema, compact
+
+START, END = datetime(2023, 10, 1), datetime(2023, 11, 1)
+
+EMPLOYEES = {
+    'A': {'name': 'Иван', 'surname': 'Иванов', 'patronymic': 'Иванович', 'personnelNumber': '1',
+          'dateOfBirth': datetime(1980, 5, 12)},
+    'B': {'name': 'Петр', 'surname': 'Петров', 'patronymic': 'Петрович', 'personnelNumber': '2',
+          'dateOfBirth': datetime(1975, 1, 2)},
+}
+
+ORG_BOUNDARIES = {'pulse': {'lower': 50, 'upper': 110},
+                  'pressure': {'systolic': {'lower': 95, 'upper': 145}, 'diastolic': {'lower': 55, 'upper': 95}}}
+
+
+def inspection(employee: str, processed_at: datetime, type: str = 'BEFORE_TRIP', success: bool = True,
+               remarks: list = (), readings: list = ((120, 80, 70), (130, 85, 75)), org_id: int = 1,
+               point: str = 'P1', is_test: bool = False, origin: str = 'default') -> dict:
+    return {
+        'timestamps': {'processedAt': processed_at},
+        'isTest': is_test,
+        'type': type,
+        'organization': {'id': org_id, 'name': f"Организация {org_id}", 'inn': f"77{org_id:08d}"},
+        'host': {'releasePoint': {'address': point}},
+        'resolution': {'success': success, 'remarks': list(remarks)},
+        'steps': [{'result': {'value': {'pressure': {'systolic': sad, 'diastolic': dad}, 'pulse': pulse}}}
+                  for sad, dad, pulse in readings],
+        'boundaries': {'origin': origin, 'values': ORG_BOUNDARIES if origin == 'org' else None},
+        'employee': EMPLOYEES[employee],
+    }
+
+
+INSPECTIONS = [
+    inspection('A', datetime(2023, 10, 2, 8)),
+    # недопуск по давлению: мед. причина, АД и причина второй страницы; последний осмотр организации
+    inspection('A', datetime(2023, 10, 20, 9), type='BEFORE_SHIFT', success=False, remarks=['pressure'],
+               readings=[(125, 82, 72), (150, 95, 90)], origin='org'),
+    # послерейсовый: только первая страница
+    inspection('B', datetime(2023, 10, 5, 18), type='AFTER_TRIP', success=False, remarks=['no_video'], point='P2'),
+    # одно измерение: второго нет, средние пустые
+    inspection('B', datetime(2023, 10, 6, 8), point='P2', readings=[(120, 80, 70)]),
+    # не проходят $match
+    inspection('A', datetime(2023, 10, 3, 8), is_test=True),
+    inspection('A', datetime(2023, 11, 2, 8)),
+    inspection('A', datetime(2023, 10, 3, 8), org_id=2),
+]
+
+
+def mongoexport(value):
+    if isinstance(value, datetime):
+        return {'$date': value.strftime("%Y-%m-%dT%H:%M:%S.%fZ")}
+    raise TypeError(type(value))
+
+
+@pytest.fixture
+def local(tmp_path):
+    path = tmp_path / "inspections.jsonl"
+    with open(path, 'w') as f:
+        for doc in INSPECTIONS:
+            f.write(json.dumps(doc, default=mongoexport, ensure_ascii=False) + "\n")
+    return Local(str(path), schema, compact)
+
+
+def test_sheet1(local):
+    df1, _ = local.load(START, END, [1])
+    df1 = df1.astype({'host_release_point': object}).set_index('host_release_point').sort_index()
+    counts = ['count_medics', 'count_success', 'count_not_success', 'count_med_cause', 'count_adm_cause',
+              'count_tech_cause', 'count_cancel_cause', 'count_ad', 'count_pulse']
+    assert df1[counts].to_dict('index') == {
+        'P1': {'count_medics': 2, 'count_success': 1, 'count_not_success': 1, 'count_med_cause': 1, 'count_adm_cause': 0,
+               'count_tech_cause': 0, 'count_cancel_cause': 0, 'count_ad': 1, 'count_pulse': 0},
+        'P2': {'count_medics': 2, 'count_success': 1, 'count_not_success': 1, 'count_med_cause': 0, 'count_adm_cause': 0,
+               'count_tech_cause': 1, 'count_cancel_cause': 0, 'count_ad': 0, 'count_pulse': 0},
+    }
+    assert set(df1['organization_name'].astype(object)) == {"Организация 1"}
+    assert str(df1['count_medics'].dtype) == compact['count_medics']
+
+
+def test_sheet2(local):
+    _, df2 = local.load(START, END, [1])
+    df2 = df2.set_index('employee_number').sort_index()
+    a, b = df2.loc['1'], df2.loc['2']
+
+    assert (a['count_all'], a['count_ad_pulse_cause']) == (2, 1)
+    assert (a['mean_sad'], a['mean_dad'], a['mean_pulse']) == (140, 90, 82.5)
+    assert a['mean_sq_sad'] == pytest.approx((130 ** 2 + 150 ** 2) / 2)
+    assert a['median_sad'] == pytest.approx(140)
+    assert a['employee_birthday'] == pd.Timestamp(1980, 5, 12)
+
+    assert (b['count_all'], b['count_ad_pulse_cause']) == (1, 0)
+    assert np.isnan(b['mean_sad']) and np.isnan(b['mean_pulse'])
+
+    # границы - по последнему осмотру организации (с границами организации)
+    assert set(df2['boundary_origin'].astype(object)) == {'org'}
+    assert set(df2['boundary_pulse_upper']) == {110}
+    assert set(df2['boundary_dad_upper']) == {95}
+
+
+def test_empty_period(local):
+    df1, df2 = local.load(datetime(2024, 1, 1), datetime(2024, 2, 1), [1])
+    assert df1.empty and df2.empty
+    assert list(df1.columns) == list(schema['sheet1'])
@@ -0,0 +1,90 @@
+"""Кэш этапов Memo: ключи по содержимому, чтение и запись, пропуск уже сохраненных книг.
+
+Книги отчета пропускаются, только если файл на диске - тот самый, что записал прошлый запуск:
+удаленная или перезаписанная (например, отчетом за другой период под тем же именем) книга пишется заново.
+
+Example:
+    python -m pytest -q tests
+"""
+from datetime import datetime
+import zipfile
+import sys
+import os
+sys.path.append("./")
+sys.path.append("./bench")
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from report import Gemodynamics
+from internal.local.local import Local
+from internal.memo.memo import Memo, MISSING
+from inspections import make_inspections
+from query.queries import schema, compact
+
+START, END = datetime(2023, 10, 1), datetime(2023, 11, 1)
+
+
+def test_key():
+    df = pd.DataFrame({'a': [1, 2], 'b': ['x', 'y']})
+    assert Memo.key(df, 1) == Memo.key(df.copy(), 1)
+    assert Memo.key(df) != Memo.key(df.assign(a=[1, 3]))
+    assert Memo.key(df) != Memo.key(df.astype({'a': 'float64'}))
+    assert Memo.key('ab', 'c') != Memo.key('a', 'bc')
+    assert Memo.key(b'png') != Memo.key(b'gif')
+    assert Memo.version(Memo.key) != Memo.version(Memo.get)
+
+
+def test_get_put(tmp_path):
+    memo = Memo(str(tmp_path))
+    assert memo.get("stage", "key") is MISSING
+    # None - допустимый результат этапа, не промах
+    assert memo.put("stage", "key", None) is None
+    assert memo.get("stage", "key") is None
+    df = pd.DataFrame({'a': [1.5]})
+    memo.put("stage", "other", df)
+    pd.testing.assert_frame_equal(memo.get("stage", "other"), df)
+    assert memo.stats == {'hits': 2, 'misses': 1}
+    assert not [name for name in os.listdir(tmp_path / "stage") if not name.endswith(".pickle")]
+
+
+@pytest.fixture(scope="module")
+def export(tmp_path_factory) -> str:
+    path = str(tmp_path_factory.mktemp("export") / "inspections.parquet")
+    writer = None
+    for batch in make_inspections(3000, START, END, orgs=2, employees=20):
+        table = pa.Table.from_pylist(batch)
+        writer = writer or pq.ParquetWriter(path, table.schema)
+        writer.write_table(table)
+    writer.close()
+    return path
+
+
+def run(export: str, tmp_path) -> Gemodynamics:
+    report = Gemodynamics(START, END, [1, 2], str(tmp_path / "results"), workers=1, charts=False,
+                          memo_path=str(tmp_path / "memo"), backend=Local(export, schema, compact))
+    report.run()
+    return report
+
+
+def test_stale_workbook(export, tmp_path):
+    report = run(export, tmp_path)
+    paths = sorted(os.path.join(report.save_path, name) for name in os.listdir(report.save_path))
+    assert len(paths) == 2 and report.memo.stats['misses'] > 0
+
+    # те же данные: книги не переписываются
+    mtimes = [os.stat(path).st_mtime_ns for path in paths]
+    report = run(export, tmp_path)
+    assert [os.stat(path).st_mtime_ns for path in paths] == mtimes
+    assert report.memo.stats['misses'] == 0
+
+    # книга удалена, другая перезаписана чужим содержимым: обе пишутся заново
+    os.remove(paths[0])
+    with open(paths[1], 'wb') as f:
+        f.write(b"stale")
+    run(export, tmp_path)
+    for path in paths:
+        with zipfile.ZipFile(path) as book:
+            assert "xl/workbook.xml" in book.namelist()
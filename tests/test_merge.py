@@ -0,0 +1,123 @@
+"""Сложение частичных агрегатов DB.merge.
+
+Частичные агрегаты дней (хранилище, DB.load_daily) и шардов (DB.load_sharded) строятся по осмотрам
+так же, как их считают пайплайны query.queries.daily: счетчики - суммы, средние - пары сумма и количество
+числовых значений. Сложенные DB.merge, они должны совпадать с агрегатами, посчитанными сразу по всему
+периоду, в том числе для пустых ключей (точка выпуска без адреса) и сотрудников без измерений в части
+частичных агрегатов.
+
+Example:
+    python -m pytest -q tests
+"""
+from datetime import datetime
+import sys
+sys.path.append("./")
+
+import pandas as pd
+import numpy as np
+import pytest
+
+from internal.db.db import DB
+from query.queries import schema
+
+START, END = datetime(2023, 10, 1), datetime(2023, 10, 15)
+
+
+def keys(name: str) -> list:
+    return [col for col, dtype in schema[name].items() if dtype not in ('int64', 'float64')]
+
+
+def counters(name: str) -> list:
+    return [col for col, dtype in schema[name].items() if dtype == 'int64']
+
+
+def reading(col: str) -> str:
+    # mean_sq_sad -> sad
+    return col.split('_')[-1]
+
+
+@pytest.fixture(scope="module")
+def inspections() -> pd.DataFrame:
+    """По одной строке на осмотр: ключи обеих страниц, счетчики осмотра (0/1) и показатели."""
+
+    rng = np.random.default_rng(0)
+    n = 2000
+    employee = rng.integers(0, 40, n)
+    org_id = employee % 4 + 1
+    df = pd.DataFrame({
+        'organization_name': [f"Организация {x}" for x in org_id],
+        'organization_id': org_id,
+        'organization_inn': [f"77{x:08d}" for x in org_id],
+        'host_release_point': np.where(rng.random(n) < 0.1, None, [f"Точка {x}" for x in rng.integers(0, 3, n)]),
+        'employee_name': 'Иван',
+        'employee_surname': [f"Иванов {x}" for x in employee],
+        'employee_patronymic': 'Иванович',
+        'employee_birthday': pd.to_datetime(1970 + employee % 30, format='%Y'),
+        'employee_number': employee.astype(str),
+        'processed_at': START + pd.to_timedelta(rng.integers(0, (END - START).total_seconds(), n), unit='s'),
+    })
+    df['day'] = df['processed_at'].dt.strftime("%Y-%m-%d")
+    for name in ['sheet1', 'sheet2']:
+        for col in counters(name):
+            df[col] = 1 if col in ('count_medics', 'count_all') else rng.integers(0, 2, n)
+    for col in ['sad', 'dad', 'pulse']:
+        values = rng.normal(100, 20, n)
+        # без второго измерения: в $avg не участвует
+        values[rng.random(n) < 0.2] = np.nan
+        df[col] = values
+    return df
+
+
+def partials(df: pd.DataFrame, name: str, by_day: bool) -> pd.DataFrame:
+    # как пайплайн daily(..., by_day): $sum счетчиков, сумма и количество числовых показателей
+    group = keys(name) + (['day'] if by_day else [])
+    buf = df[group + counters(name)].copy()
+    means = [col for col, dtype in schema[name].items() if dtype == 'float64']
+    for col in means:
+        value = df[reading(col)] ** 2 if '_sq_' in col else df[reading(col)]
+        buf[f'{col}_sum'] = value.fillna(0)
+        buf[f'{col}_count'] = value.notna().astype('int64')
+    return buf.groupby(group, as_index=False, sort=False, dropna=False).sum()
+
+
+def expected(df: pd.DataFrame, name: str) -> pd.DataFrame:
+    # тот же пайплайн сразу по всему периоду: $sum и $avg
+    means = [col for col, dtype in schema[name].items() if dtype == 'float64']
+    buf = df[keys(name) + counters(name)].copy()
+    for col in means:
+        buf[col] = df[reading(col)] ** 2 if '_sq_' in col else df[reading(col)]
+    res = buf.groupby(keys(name), as_index=False, sort=False, dropna=False).agg(
+        {**{col: 'sum' for col in counters(name)}, **{col: 'mean' for col in means}})
+    return res[list(schema[name])]
+
+
+def same(a: pd.DataFrame, b: pd.DataFrame, name: str):
+    order = [col for col in keys(name) if col != 'employee_birthday']
+    a = a.sort_values(order, ignore_index=True, na_position='first')
+    b = b.sort_values(order, ignore_index=True, na_position='first')
+    pd.testing.assert_frame_equal(a, b, check_dtype=False)
+
+
+@pytest.mark.parametrize("name", ["sheet1", "sheet2"])
+def test_daily(inspections, name):
+    # как DB.load_daily: дни из хранилища в кодированном виде, после сложения - декодируются
+    columns = schema[f"{name}_daily"]
+    df = DB.encode(partials(inspections, name, by_day=True)[list(columns)], columns)
+    res = DB.decode(DB.merge(schema, name, df), schema[name])
+    same(res, expected(inspections, name), name)
+
+
+@pytest.mark.parametrize("name", ["sheet1", "sheet2"])
+def test_sharded(inspections, name):
+    # шарды DB.shards: организации по две, отрезки по 4 дня (последний короче)
+    db = DB.__new__(DB)
+    db.shard_orgs, db.shard_days = 2, 4
+    shards = db.shards(START, END, [1, 2, 3, 4])
+    assert len(shards) == 8
+    parts = []
+    for first, last, org_ids in shards:
+        rows = inspections[(inspections['processed_at'] >= first) & (inspections['processed_at'] < last)
+                           & inspections['organization_id'].isin(org_ids)]
+        parts.append(partials(rows, name, by_day=False))
+    res = DB.merge(schema, name, pd.concat(parts, ignore_index=True))
+    same(res, expected(inspections, name), name)
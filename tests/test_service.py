@@ -0,0 +1,96 @@
+"""Кэш отчетов ReportService: объединение одинаковых запросов, ttl и вытеснение LRU.
+
+Отчет не строится: build подменен заглушкой, которая считает запуски и создает папку отчета.
+Пул подключений mongo создается, но не используется (pymongo подключается лениво).
+
+Example:
+    python -m pytest -q tests
+"""
+from datetime import datetime, timedelta
+import threading
+import asyncio
+import sys
+import os
+sys.path.append("./")
+
+import pytest
+
+from internal.service.service import ReportService
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = ReportService("mongodb://localhost:27017", cache_path=str(tmp_path), cache_size=2, ttl=600)
+    service.builds = []
+    service.release = threading.Event()
+    service.release.set()
+
+    def build(key):
+        # как build: у каждого ключа своя папка с отчетами
+        service.release.wait(5)
+        service.builds.append(key)
+        os.makedirs(f"{service.folder(key)}/results", exist_ok=True)
+        return [f"{service.folder(key)}/results/{len(service.builds)}.xlsx"]
+
+    service.build = build
+    yield service
+    service.close()
+
+
+# закончившиеся периоды: отчет по ним не устаревает
+OCT = (datetime(2023, 10, 1), datetime(2023, 11, 1))
+SEP = (datetime(2023, 9, 1), datetime(2023, 10, 1))
+AUG = (datetime(2023, 8, 1), datetime(2023, 9, 1))
+
+
+def test_coalesced(service):
+    async def run():
+        service.release.clear()
+        first = asyncio.create_task(service.report(*OCT, [2211, 1328]))
+        second = asyncio.create_task(service.report(*OCT, [1328, 2211, 1328]))
+        await asyncio.sleep(0.1)
+        service.release.set()
+        return await first, await second
+
+    (paths1, cached1), (paths2, cached2) = asyncio.run(run())
+    assert len(service.builds) == 1
+    assert paths1 == paths2 and not cached1 and not cached2
+    assert service.stats['runs'] == 1 and service.stats['coalesced'] == 1
+    assert not service.inflight
+
+
+def test_ttl(service):
+    # период еще идет: отчет живет ttl секунд
+    now = datetime.utcnow()
+    current = (now - timedelta(days=1), now + timedelta(days=1))
+
+    async def run():
+        await service.report(*current, [1328])
+        _, hit = await service.report(*current, [1328])
+        assert hit
+        service.ttl = 0
+        _, hit = await service.report(*current, [1328])
+        assert not hit
+        # закончившийся период из кэша берется и без ttl
+        await service.report(*OCT, [1328])
+        _, hit = await service.report(*OCT, [1328])
+        assert hit
+
+    asyncio.run(run())
+    assert len(service.builds) == 3
+
+
+def test_lru(service):
+    async def run():
+        await service.report(*OCT, [1328])
+        await service.report(*SEP, [1328])
+        # октябрь использован последним, вытесняется сентябрь
+        await service.report(*OCT, [1328])
+        await service.report(*AUG, [1328])
+
+    asyncio.run(run())
+    oct_key, sep_key, aug_key = (service.key(*period, [1328]) for period in (OCT, SEP, AUG))
+    assert list(service.cache) == [oct_key, aug_key]
+    assert not os.path.exists(service.folder(sep_key))
+    assert os.path.exists(service.folder(oct_key))
+    assert service.stats['hits'] == 1 and len(service.builds) == 3
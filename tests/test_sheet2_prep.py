@@ -0,0 +1,90 @@
+"""Золотой тест подготовки второй страницы отчета.
+
+Полный результат Gemodynamics.sheet2_prep (ФИО, возраст, доля недопусков, округления, типы
+гемодинамики, блоки и рекомендации) на синтетической выгрузке с фиксированным зерном
+сравнивается с сохраненным в golden/sheet2_prep.jsonl. Классификация, блоки наблюдений, рекомендации
+и возраст, кроме того, сверяются с прежней построчной реализацией (legacy_sheet2_prep из
+bench/bench_sheet2_prep.py), чтобы золотой файл не закрепил расхождение с ней.
+
+Если вывод страницы меняется намеренно, золотой файл пересоздается:
+    python tests/test_sheet2_prep.py
+
+Example:
+    python -m pytest -q tests
+"""
+from datetime import datetime
+import sys
+import os
+sys.path.append("./")
+sys.path.append("./bench")
+
+import pandas as pd
+import numpy as np
+
+import report
+import bench_sheet2_prep
+from report import Gemodynamics
+from internal.hemodynamics.hemodynamics import age, flatten_boundaries
+from bench_sheet2_prep import make_sheet2, legacy_sheet2_prep
+
+GOLDEN = os.path.join(os.path.dirname(__file__), "golden", "sheet2_prep.jsonl")
+
+# возраст считается на текущую дату, в тесте она зафиксирована
+NOW = datetime(2024, 3, 1)
+
+
+class Frozen(datetime):
+    """datetime с зафиксированным now для прежней реализации."""
+
+    @classmethod
+    def now(cls, tz=None):
+        return NOW
+
+
+def prepare(monkeypatch) -> pd.DataFrame:
+    monkeypatch.setattr(report, 'age', lambda birthday: age(birthday, NOW))
+    df = make_sheet2(100, seed=0)
+    # перцентили сотрудника, как из sheet2_percentile (mongo 7.0+)
+    rng = np.random.default_rng(1)
+    for value in ['sad', 'dad', 'pulse']:
+        df[f'median_{value}'] = df[f'mean_{value}'] + rng.normal(0, 2, len(df))
+        df[f'p90_{value}'] = df[f'mean_{value}'] + rng.uniform(0, 15, len(df))
+    return Gemodynamics.__new__(Gemodynamics).sheet2_prep(df).reset_index(drop=True)
+
+
+def test_sheet2_prep_golden(monkeypatch):
+    res = prepare(monkeypatch)
+    golden = pd.read_json(GOLDEN, orient='records', lines=True, dtype=False)
+    pd.testing.assert_frame_equal(res, golden, check_dtype=False)
+
+
+def test_sheet2_prep_legacy(monkeypatch):
+    monkeypatch.setattr(report, 'age', lambda birthday: age(birthday, NOW))
+    monkeypatch.setattr(bench_sheet2_prep, 'datetime', Frozen)
+    df = make_sheet2(500, seed=2)
+    # пропуски средних: ни одно правило не срабатывает, как и в построчных сравнениях
+    df.loc[::17, 'mean_pulse'] = np.nan
+    df.loc[::23, 'mean_dad'] = np.nan
+    old = legacy_sheet2_prep(df.copy())
+    new = Gemodynamics.__new__(Gemodynamics).sheet2_prep(df.copy())
+    pd.testing.assert_frame_equal(new[old.columns].reset_index(drop=True), old.reset_index(drop=True), check_dtype=False)
+
+
+if __name__ == "__main__":
+    import pytest
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        res = prepare(monkeypatch)
+    os.makedirs(os.path.dirname(GOLDEN), exist_ok=True)
+    res.to_json(GOLDEN, orient='records', lines=True, force_ascii=False)
+    print(f"{GOLDEN}: {len(res)} строк")
+
+
+def test_sheet2_prep_keeps_input(monkeypatch):
+    # выгрузку sheet2 читают и следующие этапы (графики, ключи кэша), подготовка ее не меняет
+    monkeypatch.setattr(report, 'age', lambda birthday: age(birthday, NOW))
+    df = make_sheet2(50, seed=3)
+    df = df.join(flatten_boundaries(df))
+    before = df.copy()
+    Gemodynamics.__new__(Gemodynamics).sheet2_prep(df)
+    pd.testing.assert_frame_equal(df, before)